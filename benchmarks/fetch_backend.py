@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Compares the sqlalchemy and ibm_db fetch backends on real tables.
+
+    python benchmarks/fetch_backend.py config.json SCHEMA.TABLE [...]
+
+Every table is read in full with each backend, through the same
+execute_query and fetch_batches calls the sync strategies use, and the rows
+are discarded. The numbers therefore measure the driver and result
+handling, not conversion to Singer messages.
+"""
+
+import json
+import sys
+import time
+
+from tap_db2.connection import get_azure_sql_engine
+import tap_db2.native_fetch as native_fetch
+import tap_db2.sync_strategies.common as common
+
+
+def run(label, config, engine, table, select_sql):
+    start = time.perf_counter()
+    rows = 0
+    with engine.connect() as open_conn:
+        results = common.execute_query(open_conn, select_sql, [], config)
+        for batch in common.fetch_batches(
+            results, common.get_fetch_batch_size(config)
+        ):
+            rows += len(batch)
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(
+        "{:<32} {:<12} {:>10,} rows {:>8.2f}s {:>12,.0f} rows/s\n".format(
+            table, label, rows, elapsed, rows / elapsed if elapsed else 0
+        )
+    )
+    return elapsed
+
+
+def main():
+    with open(sys.argv[1]) as config_file:
+        config = json.load(config_file)
+
+    engine = get_azure_sql_engine(config)
+
+    for table in sys.argv[2:]:
+        table_schema, table_name = table.split(".", 1)
+        select_sql = "SELECT * FROM {}.{}".format(
+            common.escape(table_schema), common.escape(table_name)
+        )
+
+        baseline = run(
+            "sqlalchemy",
+            dict(config, fetch_backend="sqlalchemy"),
+            engine,
+            table,
+            select_sql,
+        )
+        native = run(
+            "ibm_db",
+            dict(config, fetch_backend="ibm_db"),
+            engine,
+            table,
+            select_sql,
+        )
+        sys.stderr.write("speedup: {:.2f}x\n".format(baseline / native))
+
+    native_fetch.close_pools()
+
+
+if __name__ == "__main__":
+    main()
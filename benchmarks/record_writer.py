@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Compares singer.write_message with RecordWriter on a synthetic stream.
+
+    python benchmarks/record_writer.py [rows]
+
+Records are written to /dev/null, so the numbers measure message
+formatting and encoding rather than the consumer of the tap's output.
+"""
+
+import os
+import sys
+import time
+
+import singer
+from singer import utils
+
+from tap_db2.messages import RecordWriter
+
+
+def synthetic_records(rows):
+    for i in range(rows):
+        yield {
+            "ID": i,
+            "NAME": "customer-{}".format(i),
+            "BALANCE": i * 0.25,
+            "ACTIVE": i % 2 == 0,
+            "CREATED_AT": "2021-05-04T03:02:01.000123+00:00",
+            "NOTES": None,
+        }
+
+
+def run(label, write_record, rows):
+    start = time.perf_counter()
+    for record in synthetic_records(rows):
+        write_record(record)
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(
+        "{:<24} {:>8.2f}s {:>12,.0f} rows/s\n".format(
+            label, elapsed, rows / elapsed
+        )
+    )
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    time_extracted = utils.now()
+
+    def write_with_singer(record):
+        singer.write_message(
+            singer.RecordMessage(
+                stream="SYNTHETIC",
+                record=record,
+                version=1,
+                time_extracted=time_extracted,
+            )
+        )
+
+    writer = RecordWriter(
+        "SYNTHETIC", version=1, time_extracted=time_extracted, use_decimal=False
+    )
+
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            baseline = run("singer.write_message", write_with_singer, rows)
+            fast = run("RecordWriter", writer.write, rows)
+        finally:
+            sys.stdout = stdout
+
+    sys.stderr.write("speedup: {:.2f}x\n".format(baseline / fast))
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,11 @@ setup(
         "singer-python==5.9.0",
         "sqlalchemy<2.0.0",
     ],
+    extras_require={
+        "speedups": ["orjson>=3.6"],
+        "columnar": ["pyarrow>=7.0"],
+        "batch": ["pyarrow>=7.0", "zstandard>=0.15"],
+    },
     entry_points="""
           [console_scripts]
           tap-db2=tap_db2:main
@@ -1,11 +1,13 @@
 # import datetime
 import collections
 import itertools
+from concurrent import futures
 
 # from itertools import dropwhile
 # import json
 import logging
-import copy
+import threading
+import time
 
 # import uuid
 
@@ -19,6 +21,10 @@ from singer import utils
 from singer.schema import Schema
 from singer.catalog import Catalog, CatalogEntry
 
+import tap_db2.messages as messages
+import tap_db2.native_fetch as native_fetch
+import tap_db2.scheduler as scheduler
+from tap_db2.discovery_cache import DiscoveryCache
 import tap_db2.sync_strategies.common as common
 import tap_db2.sync_strategies.full_table as full_table
 import tap_db2.sync_strategies.incremental as incremental
@@ -26,6 +32,7 @@ import tap_db2.sync_strategies.logical as logical
 
 from tap_db2.connection import (
     # connect_with_backoff,
+    dispose_engines,
     get_azure_sql_engine,
 )
 
@@ -41,9 +48,17 @@ Column = collections.namedtuple(
         "numeric_precision",
         "numeric_scale",
         "is_primary_key",
+        "key_sequence",
+        "table_type",
+        "row_count",
+        "page_count",
+        "average_row_size",
+        "page_size",
     ],
 )
 
+TABLE_STATISTICS_KEYS = ("row-count", "estimated-size-bytes")
+
 REQUIRED_CONFIG_KEYS = [
     "username",
     "password",
@@ -60,6 +75,7 @@ STRING_TYPES = set(
     [
         "binary",
         "char",
+        "character",
         "enum",
         "longtext",
         "mediumtext",
@@ -175,120 +191,314 @@ def create_column_metadata(cols):
     return metadata.to_list(mdata)
 
 
-def discover_catalog(mssql_conn, config):
-    """Returns a Catalog describing the structure of the database."""
-    LOGGER.info("Preparing Catalog")
+DISCOVERY_SQL = """
+    SELECT
+        c.TABSCHEMA AS TABLE_SCHEMA,
+        c.TABNAME AS TABLE_NAME,
+        c.COLNAME AS COLUMN_NAME,
+        c.TYPENAME AS DATA_TYPE,
+        c.LENGTH AS CHARACTER_MAXIMUM_LENGTH,
+        c.LONGLENGTH AS NUMERIC_PRECISION,
+        c.SCALE AS NUMERIC_SCALE,
+        CASE
+            WHEN pk.COLSEQ IS NOT NULL THEN 1
+            ELSE 0
+        END AS IS_PRIMARY_KEY,
+        pk.COLSEQ AS KEY_SEQUENCE,
+        t.TYPE AS TABLE_TYPE,
+        t.CARD AS ROW_COUNT,
+        t.NPAGES AS PAGE_COUNT,
+        t.AVGROWSIZE AS AVERAGE_ROW_SIZE,
+        ts.PAGESIZE AS PAGE_SIZE
+    FROM SYSCAT.COLUMNS c
+    JOIN SYSCAT.TABLES t
+    ON c.TABSCHEMA = t.TABSCHEMA
+    AND c.TABNAME = t.TABNAME
+    LEFT JOIN SYSCAT.TABLESPACES ts
+    ON t.TBSPACE = ts.TBSPACE
+    LEFT JOIN (
+        SELECT k.TABSCHEMA, k.TABNAME, k.COLNAME, k.COLSEQ
+        FROM SYSCAT.KEYCOLUSE k
+        JOIN SYSCAT.TABCONST tc
+        ON k.CONSTNAME = tc.CONSTNAME
+        AND k.TABSCHEMA = tc.TABSCHEMA
+        AND k.TABNAME = tc.TABNAME
+        WHERE tc.TYPE = 'P'
+    ) pk
+    ON c.TABSCHEMA = pk.TABSCHEMA
+    AND c.TABNAME = pk.TABNAME
+    AND c.COLNAME = pk.COLNAME
+    WHERE t.TABSCHEMA NOT IN (
+        'SYSTOOLS',
+        'SYSIBM',
+        'SYSCAT',
+        'SYSPUBLIC',
+        'SYSSTAT',
+        'SYSIBMADM'
+    )
+    AND t.TABSCHEMA NOT LIKE 'SYS%'
+    {table_filter}
+    ORDER BY c.TABSCHEMA, c.TABNAME, c.COLNO
+"""
+
+ALTER_TIMES_SQL = """
+    SELECT
+        t.TABSCHEMA AS TABLE_SCHEMA,
+        t.TABNAME AS TABLE_NAME,
+        t.ALTER_TIME,
+        t.CARD AS ROW_COUNT,
+        t.NPAGES AS PAGE_COUNT,
+        t.AVGROWSIZE AS AVERAGE_ROW_SIZE,
+        ts.PAGESIZE AS PAGE_SIZE
+    FROM SYSCAT.TABLES t
+    LEFT JOIN SYSCAT.TABLESPACES ts
+    ON t.TBSPACE = ts.TBSPACE
+    WHERE t.TABSCHEMA NOT IN (
+        'SYSTOOLS',
+        'SYSIBM',
+        'SYSCAT',
+        'SYSPUBLIC',
+        'SYSSTAT',
+        'SYSIBMADM'
+    )
+    AND t.TABSCHEMA NOT LIKE 'SYS%'
+    {table_filter}
+    ORDER BY t.TABSCHEMA, t.TABNAME
+"""
 
-    with mssql_conn.connect() as open_conn:
-        LOGGER.info("Fetching tables")
-        tables_results = open_conn.execute(
-            """
-            SELECT
-                TABSCHEMA AS TABLE_SCHEMA,
-                TABNAME AS TABLE_NAME,
-                TYPE AS TABLE_TYPE
-            FROM SYSCAT.TABLES t
-            WHERE t.TABSCHEMA NOT IN (
-                'SYSTOOLS',
-                'SYSIBM',
-                'SYSCAT',
-                'SYSPUBLIC',
-                'SYSSTAT',
-                'SYSIBMADM'
-            )
-            """
-        )
-        table_info = {}
+DISCOVERY_FETCH_SIZE = 10000
 
-        for (db, table, table_type) in tables_results.fetchall():
-            if db not in table_info:
-                table_info[db] = {}
+# Number of (schema, table) pairs per IN-list of a targeted discovery query
+DISCOVERY_TABLE_BATCH_SIZE = 100
 
-            table_info[db][table] = {
-                "row_count": None,
-                "is_view": table_type == "V",
-            }
 
-            LOGGER.info(table_info)
-        LOGGER.info("Tables fetched, fetching columns")
-        column_results = open_conn.execute(
-            """
-            SELECT
-                t.TABSCHEMA AS TABLE_SCHEMA,
-                t.TABNAME AS TABLE_NAME,
-                s.NAME AS COLUMN_NAME,
-                s.COLTYPE AS DATA_TYPE,
-                s.LENGTH AS CHARACTER_MAXIMUM_LENGTH,
-                s.LONGLENGTH AS NUMERIC_PRECISION,
-                s.SCALE AS NUMERIC_SCALE,
-                CASE
-                    WHEN s.KEYSEQ IS NOT NULL THEN 1
-                    ELSE 0
-                END AS IS_PRIMARY_KEY
-            FROM SYSIBM.SYSCOLUMNS s
-            LEFT JOIN SYSCAT.TABLES t
-            ON s.TBNAME = t.TABNAME
-            WHERE t.TABSCHEMA NOT LIKE 'SYS%'
-            """
+def estimate_table_size(row_count, page_count, average_row_size, page_size):
+    """Returns the row count and estimated size in bytes of a table from its
+    catalog statistics, either of them None when unknown.
+
+    DB2 reports -1 for statistics that were never collected. The size is
+    CARD * AVGROWSIZE, or NPAGES times the page size of the table space
+    when the average row size is unknown.
+    """
+    if row_count is None or row_count < 0:
+        row_count = None
+
+    size_bytes = None
+    if row_count is not None and (average_row_size or 0) > 0:
+        size_bytes = row_count * average_row_size
+    elif page_count is not None and page_count >= 0 and page_size:
+        size_bytes = page_count * page_size
+
+    return row_count, size_bytes
+
+
+def write_table_statistics(md_map, row_count, size_bytes):
+    """Writes the row-count and estimated-size-bytes metadata, removing
+    statistics that are no longer known."""
+    statistics = {
+        "row-count": row_count,
+        "estimated-size-bytes": size_bytes,
+    }
+    for key, value in statistics.items():
+        if value is None:
+            md_map.get((), {}).pop(key, None)
+        else:
+            md_map = metadata.write(md_map, (), key, value)
+
+    return md_map
+
+
+def catalog_entry_for_columns(table_schema, table_name, cols):
+    """Returns the CatalogEntry of one table from its Columns."""
+    schema = Schema(
+        type="object",
+        properties={c.column_name: schema_for_column(c) for c in cols},
+    )
+    md = create_column_metadata(cols)
+    md_map = metadata.to_map(md)
+
+    md_map = metadata.write(md_map, (), "database-name", table_schema)
+    md_map = metadata.write(md_map, (), "is-view", cols[0].table_type == "V")
+
+    key_properties = [
+        c.column_name
+        for c in sorted(
+            (c for c in cols if c.is_primary_key == 1),
+            key=lambda c: c.key_sequence,
         )
-        columns = []
-        rec = column_results.fetchone()
-        LOGGER.info(rec)
-        while rec is not None:
-            columns.append(Column(*rec))
-            rec = column_results.fetchone()
-        LOGGER.info("Columns Fetched")
-        entries = []
-        for (k, cols) in itertools.groupby(
-            columns, lambda c: (c.table_schema, c.table_name)
-        ):
-            cols = list(cols)
-            (table_schema, table_name) = k
-            schema = Schema(
-                type="object",
-                properties={c.column_name: schema_for_column(c) for c in cols},
+    ]
+
+    md_map = metadata.write(md_map, (), "table-key-properties", key_properties)
+
+    md_map = write_table_statistics(
+        md_map,
+        *estimate_table_size(
+            cols[0].row_count,
+            cols[0].page_count,
+            cols[0].average_row_size,
+            cols[0].page_size,
+        ),
+    )
+
+    return CatalogEntry(
+        table=table_name,
+        stream=table_name,
+        metadata=metadata.to_list(md_map),
+        tap_stream_id=common.generate_tap_stream_id(table_schema, table_name),
+        schema=schema,
+    )
+
+
+def generate_table_filter(tables):
+    """Returns a predicate restricting a discovery query to tables, a list
+    of (schema, table) pairs, and its positional parameters."""
+    predicate = "AND ({})".format(
+        " OR ".join("(t.TABSCHEMA = ? AND t.TABNAME = ?)" for _ in tables)
+    )
+    params = [name for table in tables for name in table]
+
+    return predicate, params
+
+
+def execute_discovery_query(open_conn, sql, tables=None):
+    """Runs sql, a discovery query with a {table_filter} placeholder, and
+    yields its rows, fetched in bulk.
+
+    The query covers every table when tables is None; otherwise the
+    (schema, table) pairs of tables are pushed into it, in batches of
+    DISCOVERY_TABLE_BATCH_SIZE.
+    """
+    if tables is None:
+        queries = [(sql.format(table_filter=""), ())]
+    else:
+        queries = []
+        for start in range(0, len(tables), DISCOVERY_TABLE_BATCH_SIZE):
+            table_filter, params = generate_table_filter(
+                tables[start : start + DISCOVERY_TABLE_BATCH_SIZE]
             )
-            md = create_column_metadata(cols)
-            md_map = metadata.to_map(md)
+            queries.append((sql.format(table_filter=table_filter), params))
 
-            md_map = metadata.write(md_map, (), "database-name", table_schema)
+    for query, params in queries:
+        if params:
+            results = open_conn.execute(query, tuple(params))
+        else:
+            results = open_conn.execute(query)
 
-            is_view = table_info[table_schema][table_name]["is_view"]
+        rows = results.fetchmany(DISCOVERY_FETCH_SIZE)
+        while rows:
+            yield from rows
+            rows = results.fetchmany(DISCOVERY_FETCH_SIZE)
 
-            if (
-                table_schema in table_info
-                and table_name in table_info[table_schema]
-            ):
-                row_count = table_info[table_schema][table_name].get(
-                    "row_count"
-                )
 
-                if row_count is not None:
-                    md_map = metadata.write(md_map, (), "row-count", row_count)
+def discover_tables(open_conn, tables=None):
+    """Returns the CatalogEntries of tables, or of every table when tables
+    is None, by (schema, table) pair."""
+    columns = [
+        Column(*row)
+        for row in execute_discovery_query(open_conn, DISCOVERY_SQL, tables)
+    ]
 
-                md_map = metadata.write(md_map, (), "is-view", is_view)
+    LOGGER.info("Fetched %d columns", len(columns))
 
-            key_properties = [
-                c.column_name for c in cols if c.is_primary_key == 1
-            ]
+    entries = {}
+    for (table_schema, table_name), cols in itertools.groupby(
+        columns, lambda c: (c.table_schema, c.table_name)
+    ):
+        entries[(table_schema, table_name)] = catalog_entry_for_columns(
+            table_schema, table_name, list(cols)
+        )
 
-            md_map = metadata.write(
-                md_map, (), "table-key-properties", key_properties
+    return entries
+
+
+def discover_tables_with_cache(open_conn, discovery_cache, tables=None):
+    """Returns the CatalogEntries like discover_tables, rediscovering only
+    the tables altered since they were cached."""
+    alter_times = {}
+    statistics = {}
+    for row in execute_discovery_query(open_conn, ALTER_TIMES_SQL, tables):
+        table = (row[0], row[1])
+        alter_times[table] = str(row[2])
+        statistics[table] = estimate_table_size(*row[3:])
+
+    entries = {}
+    altered_tables = []
+    for (table_schema, table_name), alter_time in alter_times.items():
+        entry = discovery_cache.get(table_schema, table_name, alter_time)
+        if entry is None:
+            altered_tables.append((table_schema, table_name))
+        else:
+            # Statistics change without altering the table
+            md_map = write_table_statistics(
+                metadata.to_map(entry.metadata),
+                *statistics[(table_schema, table_name)],
             )
+            entry.metadata = metadata.to_list(md_map)
+            entries[(table_schema, table_name)] = entry
 
-            entry = CatalogEntry(
-                table=table_name,
-                stream=table_name,
-                metadata=metadata.to_list(md_map),
-                tap_stream_id=common.generate_tap_stream_id(
-                    table_schema, table_name
-                ),
-                schema=schema,
+    LOGGER.info(
+        "Rediscovering %d of %d tables", len(altered_tables), len(alter_times)
+    )
+
+    if altered_tables:
+        discovered = discover_tables(open_conn, altered_tables)
+        for (table_schema, table_name), entry in discovered.items():
+            discovery_cache.put(
+                table_schema,
+                table_name,
+                alter_times[(table_schema, table_name)],
+                entry,
+            )
+        entries.update(discovered)
+
+    # Tables outside a targeted discovery stay cached, dropped ones do not
+    if tables is None:
+        discovery_cache.save(alter_times)
+    else:
+        discovery_cache.save(
+            set(discovery_cache.tables).difference(tables).union(alter_times)
+        )
+
+    return {key: entries[key] for key in alter_times if key in entries}
+
+
+def discover_catalog(mssql_conn, config, tables=None):
+    """Returns a Catalog describing the structure of the database.
+
+    Tables, columns and primary keys are read with a single query, ordered
+    by table, so the columns of each table can be grouped in one pass. When
+    tables, a list of (schema, table) pairs, is given only those tables are
+    discovered. When discovery_cache_path is configured, tables whose
+    ALTER_TIME did not change since the previous discovery are read from
+    that cache instead.
+    """
+    LOGGER.info("Preparing Catalog")
+
+    cache_path = config.get("discovery_cache_path")
+
+    with mssql_conn.connect() as open_conn:
+        if cache_path:
+            entries = discover_tables_with_cache(
+                open_conn, DiscoveryCache(cache_path), tables
             )
+        else:
+            entries = discover_tables(open_conn, tables)
+
+    LOGGER.info("Catalog ready with %d tables", len(entries))
+    return Catalog(list(entries.values()))
+
 
-            entries.append(entry)
-    LOGGER.info("Catalog ready")
-    return Catalog(entries)
+def get_selected_tables(streams):
+    """Returns the (schema, table) pairs of streams, or None when a stream
+    does not name both."""
+    tables = []
+    for stream in streams:
+        table_schema = common.get_database_name(stream)
+        if not table_schema or not stream.table:
+            return None
+        tables.append((table_schema, stream.table))
+
+    return sorted(set(tables))
 
 
 def do_discover(mssql_conn, config):
@@ -348,13 +558,41 @@ def is_valid_currently_syncing_stream(selected_stream, state):
     return True
 
 
+def copy_table_statistics(discovered_table, md):
+    """Returns a copy of md, the metadata of a selected stream, with the
+    current table statistics of its discovered table."""
+    discovered_metadata = common.get_metadata_map(discovered_table).get((), {})
+    statistics = {
+        key: discovered_metadata[key]
+        for key in TABLE_STATISTICS_KEYS
+        if key in discovered_metadata
+    }
+
+    result = []
+    for entry in md:
+        if not entry["breadcrumb"]:
+            stream_metadata = {
+                key: value
+                for key, value in entry["metadata"].items()
+                if key not in TABLE_STATISTICS_KEYS
+            }
+            stream_metadata.update(statistics)
+            entry = {
+                "breadcrumb": entry["breadcrumb"],
+                "metadata": stream_metadata,
+            }
+        result.append(entry)
+
+    return result
+
+
 def resolve_catalog(discovered_catalog, streams_to_sync):
     result = Catalog(streams=[])
 
     # Iterate over the streams in the input catalog and match each one up
     # with the same stream in the discovered catalog.
     for catalog_entry in streams_to_sync:
-        catalog_metadata = metadata.to_map(catalog_entry.metadata)
+        catalog_metadata = common.get_metadata_map(catalog_entry)
         replication_key = catalog_metadata.get((), {}).get("replication-key")
 
         discovered_table = discovered_catalog.get_stream(
@@ -382,7 +620,9 @@ def resolve_catalog(discovered_catalog, streams_to_sync):
         result.streams.append(
             CatalogEntry(
                 tap_stream_id=catalog_entry.tap_stream_id,
-                metadata=catalog_entry.metadata,
+                metadata=copy_table_statistics(
+                    discovered_table, catalog_entry.metadata
+                ),
                 stream=catalog_entry.tap_stream_id,
                 table=catalog_entry.table,
                 schema=Schema(
@@ -418,17 +658,20 @@ def get_non_binlog_streams(mssql_conn, catalog, config, state):
       3. any streams that do not have a replication method of LOG_BASED
 
     """
-    discovered = discover_catalog(mssql_conn, config)
-
     # Filter catalog to include only selected streams
     selected_streams = list(
         filter(lambda s: common.stream_is_selected(s), catalog.streams)
     )
+
+    # Only the selected tables need to be rediscovered
+    discovered = discover_catalog(
+        mssql_conn, config, get_selected_tables(selected_streams)
+    )
     streams_with_state = []
     streams_without_state = []
 
     for stream in selected_streams:
-        stream_metadata = metadata.to_map(stream.metadata)
+        stream_metadata = common.get_metadata_map(stream)
         # if stream_metadata.table in ["aagaggpercols", "aagaggdef"]:
         for k, v in stream_metadata.get((), {}).items():
             LOGGER.info(f"{k}: {v}")
@@ -487,7 +730,7 @@ def get_binlog_streams(mssql_conn, catalog, config, state):
     binlog_streams = []
 
     # for stream in selected_streams:
-    #     stream_metadata = metadata.to_map(stream.metadata)
+    #     stream_metadata = common.get_metadata_map(stream)
     #     replication_method = stream_metadata.get((), {}).get(
     #         "replication-method"
     #     )
@@ -501,7 +744,7 @@ def write_schema_message(config, catalog_entry, bookmark_properties=[]):
 
     table_stream = common.set_schema_mapping(config, catalog_entry.stream)
 
-    singer.write_message(
+    messages.write_message(
         singer.SchemaMessage(
             stream=table_stream,
             schema=catalog_entry.schema.to_dict(),
@@ -512,7 +755,7 @@ def write_schema_message(config, catalog_entry, bookmark_properties=[]):
 
 
 def do_sync_incremental(mssql_conn, config, catalog_entry, state, columns):
-    md_map = metadata.to_map(catalog_entry.metadata)
+    md_map = common.get_metadata_map(catalog_entry)
     # stream_version = common.get_stream_version(
     #     catalog_entry.tap_stream_id, state
     # )
@@ -526,7 +769,7 @@ def do_sync_incremental(mssql_conn, config, catalog_entry, state, columns):
     LOGGER.info("Schema written")
     incremental.sync_table(mssql_conn, config, catalog_entry, state, columns)
 
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    messages.write_state(state, catalog_entry.tap_stream_id)
 
 
 def do_sync_full_table(mssql_conn, config, catalog_entry, state, columns):
@@ -549,7 +792,7 @@ def do_sync_full_table(mssql_conn, config, catalog_entry, state, columns):
         state, catalog_entry.tap_stream_id, "initial_full_table_complete", True
     )
 
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    messages.write_state(state, catalog_entry.tap_stream_id)
 
 
 def do_sync_log_based_table(mssql_conn, config, catalog_entry, state, columns):
@@ -567,131 +810,253 @@ def do_sync_log_based_table(mssql_conn, config, catalog_entry, state, columns):
         mssql_conn, config, catalog_entry, state, columns
     )
 
-    # assert all of the log_based prereq's are met
-    log_based.assert_log_based_is_enabled()
+    try:
+        # assert all of the log_based prereq's are met
+        log_based.assert_log_based_is_enabled()
+
+        # create state if none exists
+        initial_full_table_complete = log_based.log_based_init_state()
+
+        if not initial_full_table_complete:
+            # set full_table_complete state to false and current_log_version
+            # to current
+            state = singer.write_bookmark(
+                state,
+                catalog_entry.tap_stream_id,
+                "initial_full_table_complete",
+                log_based.initial_full_table_complete,
+            )
+            state = singer.write_bookmark(
+                state,
+                catalog_entry.tap_stream_id,
+                "current_log_version",
+                log_based.current_log_version,
+            )
 
-    # create state if none exists
-    initial_full_table_complete = log_based.log_based_init_state()
+            log_based.state = state
 
-    if not initial_full_table_complete:
-        # set full_table_complete state to false and current_log_version
-        # to current
-        state = singer.write_bookmark(
-            state,
-            catalog_entry.tap_stream_id,
-            "initial_full_table_complete",
-            log_based.initial_full_table_complete,
-        )
-        state = singer.write_bookmark(
-            state,
-            catalog_entry.tap_stream_id,
-            "current_log_version",
-            log_based.current_log_version,
-        )
+        initial_load = log_based.log_based_initial_full_table()
+
+        if initial_load:
+            do_sync_full_table(
+                mssql_conn, config, catalog_entry, state, columns
+            )
+            state = singer.write_bookmark(
+                state,
+                catalog_entry.tap_stream_id,
+                "initial_full_table_complete",
+                True,
+            )
 
-        log_based.state = state
+            state = singer.write_bookmark(
+                state,
+                catalog_entry.tap_stream_id,
+                "current_log_version",
+                log_based.current_log_version,  # when the version is out of date,
+                # this has gotten stuck instead of refreshing the table.
+            )
 
-    initial_load = log_based.log_based_initial_full_table()
+        else:
+            LOGGER.info("Continue log-based syncing")
+            log_based.execute_log_based_sync()
+    finally:
+        # Releases the connection of the change tracking metadata queries
+        log_based.close()
 
-    if initial_load:
-        do_sync_full_table(mssql_conn, config, catalog_entry, state, columns)
-        state = singer.write_bookmark(
-            state,
-            catalog_entry.tap_stream_id,
-            "initial_full_table_complete",
-            True,
-        )
 
-        state = singer.write_bookmark(
-            state,
-            catalog_entry.tap_stream_id,
-            "current_log_version",
-            log_based.current_log_version,  # when the version is out of date,
-            # this has gotten stuck instead of refreshing the table.
+def sync_non_binlog_stream(mssql_conn, config, catalog_entry, state):
+    columns = list(catalog_entry.schema.properties.keys())
+
+    if not columns:
+        LOGGER.warning(
+            "There are no columns selected for stream %s, skipping it.",
+            catalog_entry.stream,
         )
+        return
 
-    else:
-        LOGGER.info("Continue log-based syncing")
-        log_based.execute_log_based_sync()
+    state = singer.set_currently_syncing(state, catalog_entry.tap_stream_id)
 
+    # Emit a state message to indicate that we've started this stream
+    messages.write_state(state, catalog_entry.tap_stream_id)
 
-def sync_non_binlog_streams(mssql_conn, non_binlog_catalog, config, state):
+    md_map = common.get_metadata_map(catalog_entry)
+    replication_method = md_map.get((), {}).get("replication-method")
+    replication_key = md_map.get((), {}).get("replication-key")
+    # primary_keys = md_map.get((), {}).get("table-key-properties")
+    LOGGER.info(
+        f"Table {catalog_entry.table} proposes {replication_method} sync"
+    )
+    if replication_method == "INCREMENTAL" and not replication_key:
+        LOGGER.info(
+            f"No replication key for {catalog_entry.table}, "
+            "using full table replication"
+        )
+        replication_method = "FULL_TABLE"
+    # Removing conditional check for primary keys - if a replication key
+    # is already specified, we can allow incremental loads on views
+
+    # if replication_method == "INCREMENTAL" and not primary_keys:
+    #     LOGGER.info(
+    #         f"No primary key for {catalog_entry.table}, "
+    #           "using full table replication"
+    #     )
+    #     replication_method = "FULL_TABLE"
+    LOGGER.info(
+        f"Table {catalog_entry.table} will use {replication_method} sync"
+    )
 
-    for catalog_entry in non_binlog_catalog.streams:
-        columns = list(catalog_entry.schema.properties.keys())
+    database_name = common.get_database_name(catalog_entry)
 
-        if not columns:
-            LOGGER.warning(
-                "There are no columns selected for stream %s, skipping it.",
-                catalog_entry.stream,
+    # The row count estimates the rows of a full table sync only
+    expected_rows = None
+    if replication_method == "FULL_TABLE":
+        expected_rows = md_map.get((), {}).get("row-count")
+    common.start_progress(catalog_entry, expected_rows, config)
+    started = time.monotonic()
+
+    with metrics.job_timer("sync_table") as timer:
+        timer.tags["database"] = database_name
+        timer.tags["table"] = catalog_entry.table
+
+        if replication_method == "INCREMENTAL":
+            LOGGER.info(f"syncing {catalog_entry.table} incrementally")
+            do_sync_incremental(
+                mssql_conn, config, catalog_entry, state, columns
+            )
+        elif replication_method == "FULL_TABLE":
+            LOGGER.info(f"syncing {catalog_entry.table} full table")
+            do_sync_full_table(
+                mssql_conn, config, catalog_entry, state, columns
+            )
+        elif replication_method == "LOG_BASED":
+            LOGGER.info(
+                f"syncing {catalog_entry.table} using replication method "
+                "LOG_BASED"
+            )
+            do_sync_log_based_table(
+                mssql_conn, config, catalog_entry, state, columns
+            )
+        else:
+            raise Exception(
+                "only INCREMENTAL and FULL TABLE replication methods are "
+                "supported"
             )
-            continue
 
-        state = singer.set_currently_syncing(
-            state, catalog_entry.tap_stream_id
-        )
+    common.finish_progress(catalog_entry)
 
-        # Emit a state message to indicate that we've started this stream
-        singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    # Lets the scheduler of the next run estimate the cost of this stream
+    state = singer.write_bookmark(
+        state,
+        catalog_entry.tap_stream_id,
+        "last_sync_seconds",
+        round(time.monotonic() - started, 3),
+    )
+    messages.write_state(state, catalog_entry.tap_stream_id)
 
-        md_map = metadata.to_map(catalog_entry.metadata)
-        replication_method = md_map.get((), {}).get("replication-method")
-        replication_key = md_map.get((), {}).get("replication-key")
-        # primary_keys = md_map.get((), {}).get("table-key-properties")
-        LOGGER.info(
-            f"Table {catalog_entry.table} proposes {replication_method} sync"
-        )
-        if replication_method == "INCREMENTAL" and not replication_key:
+
+def sync_stream_list(
+    mssql_conn, config, catalog_entries, state_merger, failed
+):
+    """Syncs catalog_entries in order, as one worker of a parallel sync.
+
+    failed is the threading.Event shared by all workers. It is set when a
+    stream fails, and once it is set no further streams are started.
+    """
+    for catalog_entry in catalog_entries:
+        if failed.is_set():
             LOGGER.info(
-                f"No replication key for {catalog_entry.table}, "
-                "using full table replication"
+                "Skipping %s after another stream failed",
+                catalog_entry.tap_stream_id,
             )
-            replication_method = "FULL_TABLE"
-        # Removing conditional check for primary keys - if a replication key
-        # is already specified, we can allow incremental loads on views
-
-        # if replication_method == "INCREMENTAL" and not primary_keys:
-        #     LOGGER.info(
-        #         f"No primary key for {catalog_entry.table}, "
-        #           "using full table replication"
-        #     )
-        #     replication_method = "FULL_TABLE"
-        LOGGER.info(
-            f"Table {catalog_entry.table} will use {replication_method} sync"
-        )
+            return
 
-        database_name = common.get_database_name(catalog_entry)
+        stream_state = state_merger.start(catalog_entry.tap_stream_id)
+        try:
+            sync_non_binlog_stream(
+                mssql_conn, config, catalog_entry, stream_state
+            )
+        except Exception:
+            failed.set()
+            raise
+        state_merger.finish(catalog_entry.tap_stream_id, stream_state)
 
-        with metrics.job_timer("sync_table") as timer:
-            timer.tags["database"] = database_name
-            timer.tags["table"] = catalog_entry.table
 
-            if replication_method == "INCREMENTAL":
-                LOGGER.info(f"syncing {catalog_entry.table} incrementally")
-                do_sync_incremental(
-                    mssql_conn, config, catalog_entry, state, columns
-                )
-            elif replication_method == "FULL_TABLE":
-                LOGGER.info(f"syncing {catalog_entry.table} full table")
-                do_sync_full_table(
-                    mssql_conn, config, catalog_entry, state, columns
-                )
-            elif replication_method == "LOG_BASED":
-                LOGGER.info(
-                    f"syncing {catalog_entry.table} using replication method "
-                    "LOG_BASED"
-                )
-                do_sync_log_based_table(
-                    mssql_conn, config, catalog_entry, state, columns
+def sync_streams_in_parallel(mssql_conn, stream_lists, config, state):
+    """Syncs lists of streams on a pool of max_parallel_streams threads.
+
+    Every list is synced in order by a single worker. Each stream syncs on
+    its own pooled connection and its own state dict. The STATE messages
+    the workers emit are merged into state by a single StateMerger, which
+    keeps currently_syncing pointing at the oldest stream still in flight.
+    After the first failure the workers finish the streams they are syncing
+    but start no others.
+    """
+    max_workers = int(config.get("max_parallel_streams"))
+    state_merger = messages.StateMerger(state)
+    failed = threading.Event()
+
+    with messages.merging_state(state_merger):
+        with futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sync-stream"
+        ) as executor:
+            pending = [
+                executor.submit(
+                    sync_stream_list,
+                    mssql_conn,
+                    config,
+                    catalog_entries,
+                    state_merger,
+                    failed,
                 )
-            else:
-                raise Exception(
-                    "only INCREMENTAL and FULL TABLE replication methods are "
-                    "supported"
+                for catalog_entries in stream_lists
+            ]
+
+            try:
+                for future in futures.as_completed(pending):
+                    future.result()
+            except Exception:
+                failed.set()
+                for future in pending:
+                    future.cancel()
+                raise
+
+
+def sync_non_binlog_streams(mssql_conn, non_binlog_catalog, config, state):
+    max_parallel_streams = int(config.get("max_parallel_streams") or 1)
+    stream_order = config.get("stream_order")
+
+    if stream_order in scheduler.STREAM_ORDERS:
+        stream_lists = scheduler.pack_streams(
+            non_binlog_catalog.streams,
+            state,
+            stream_order,
+            max_parallel_streams,
+        )
+    elif stream_order:
+        raise Exception(
+            "Unknown stream_order {}, expected one of {}".format(
+                stream_order, ", ".join(sorted(scheduler.STREAM_ORDERS))
+            )
+        )
+    else:
+        stream_lists = [
+            [catalog_entry] for catalog_entry in non_binlog_catalog.streams
+        ]
+
+    if max_parallel_streams > 1:
+        LOGGER.info(
+            f"Syncing up to {max_parallel_streams} streams in parallel"
+        )
+        sync_streams_in_parallel(mssql_conn, stream_lists, config, state)
+    else:
+        for catalog_entries in stream_lists:
+            for catalog_entry in catalog_entries:
+                sync_non_binlog_stream(
+                    mssql_conn, config, catalog_entry, state
                 )
 
     state = singer.set_currently_syncing(state, None)
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    messages.write_state(state)
 
 
 def do_sync(mssql_conn, config, catalog, state):
@@ -727,6 +1092,9 @@ def log_server_params(mssql_conn):
 
 def main_impl():
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
+    messages.configure(args.config)
+    # Fails early on an unknown or unavailable fetch_backend
+    native_fetch.get_fetch_backend(args.config)
     mssql_conn = get_azure_sql_engine(args.config)
     log_server_params(mssql_conn)
 
@@ -749,3 +1117,7 @@ def main():
     except Exception as exc:
         LOGGER.critical(exc)
         raise exc
+    finally:
+        messages.flush()
+        native_fetch.close_pools()
+        dispose_engines()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import os
+import pathlib
+import uuid
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import singer
+
+import tap_db2.messages as messages
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd compression is optional
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - Parquet batches are optional
+    pa = None
+    pq = None
+
+LOGGER = singer.get_logger()
+
+BATCH_FORMATS = {"jsonl", "parquet"}
+
+BATCH_COMPRESSIONS = {"gzip", "zstd", "none"}
+
+DEFAULT_MAX_FILE_BYTES = 256 * 1024 * 1024
+
+DEFAULT_BATCH_SIZE = 1000000
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+FILE_EXTENSIONS = {
+    ("jsonl", "gzip"): ".jsonl.gz",
+    ("jsonl", "zstd"): ".jsonl.zst",
+    ("jsonl", "none"): ".jsonl",
+    ("parquet", "gzip"): ".parquet",
+    ("parquet", "zstd"): ".parquet",
+    ("parquet", "none"): ".parquet",
+}
+
+
+def get_batch_root(storage):
+    """Returns the local directory batch files are written to."""
+    root = storage.get("root") or "file://{}".format(os.getcwd())
+    parsed = urlparse(root)
+    if parsed.scheme not in ("", "file"):
+        raise Exception(
+            "Batch files can only be written to file:// roots, got {}".format(
+                root
+            )
+        )
+    return url2pathname(parsed.path) if parsed.scheme else root
+
+
+def validate_batch_config(batch_config):
+    encoding = batch_config.get("encoding") or {}
+    batch_format = encoding.get("format") or "jsonl"
+    compression = encoding.get("compression") or "gzip"
+
+    if batch_format not in BATCH_FORMATS:
+        raise Exception(
+            "Unknown batch format {}, expected one of: {}".format(
+                batch_format, ", ".join(sorted(BATCH_FORMATS))
+            )
+        )
+    if compression not in BATCH_COMPRESSIONS:
+        raise Exception(
+            "Unknown batch compression {}, expected one of: {}".format(
+                compression, ", ".join(sorted(BATCH_COMPRESSIONS))
+            )
+        )
+    if batch_format == "parquet" and pa is None:
+        raise Exception("Parquet batch files require the pyarrow package")
+    if batch_format == "jsonl" and compression == "zstd" and zstandard is None:
+        raise Exception("zstd batch files require the zstandard package")
+
+    return batch_format, compression
+
+
+class BatchWriter:
+    """Writes the records of a stream to local batch files.
+
+    Records are appended to the current file until it holds batch_size
+    records or max_file_bytes bytes: characters before compression for
+    JSONL, bytes on disk for Parquet. Parquet files are written one row
+    group of row_group_size records at a time, so only that many records
+    are held in memory; a row group whose values do not fit the schema of
+    the current file starts a new one. Closing a file emits a Singer BATCH
+    message whose manifest references it, so the caller writes its STATE
+    only once the records it covers are in a closed file. batch_config
+    follows the Singer SDK layout:
+
+        {"encoding": {"format": "jsonl", "compression": "gzip"},
+         "storage": {"root": "file:///tmp/batches", "prefix": "tap-db2-"},
+         "batch_size": 1000000, "max_file_bytes": 268435456}
+    """
+
+    def __init__(self, stream, batch_config, use_decimal=True):
+        self.stream = stream
+        self.batch_format, self.compression = validate_batch_config(
+            batch_config
+        )
+        storage = batch_config.get("storage") or {}
+        self.root = get_batch_root(storage)
+        self.prefix = storage.get("prefix") or ""
+        self.batch_size = int(
+            batch_config.get("batch_size") or DEFAULT_BATCH_SIZE
+        )
+        self.max_file_bytes = int(
+            batch_config.get("max_file_bytes") or DEFAULT_MAX_FILE_BYTES
+        )
+        self.row_group_size = int(
+            batch_config.get("row_group_size") or DEFAULT_ROW_GROUP_SIZE
+        )
+        self.encode_record = messages.get_record_encoder(use_decimal)
+
+        os.makedirs(self.root, exist_ok=True)
+
+        self.path = None
+        self.file = None
+        self.parquet_writer = None
+        self.records = []
+        self.file_records = 0
+        self.file_bytes = 0
+
+    def open_file(self):
+        self.path = os.path.join(
+            self.root,
+            "{}{}-{}{}".format(
+                self.prefix,
+                self.stream,
+                uuid.uuid4().hex,
+                FILE_EXTENSIONS[(self.batch_format, self.compression)],
+            ),
+        )
+        if self.batch_format == "parquet":
+            self.file = open(self.path, "wb")
+        elif self.compression == "gzip":
+            self.file = gzip.open(self.path, "wt", encoding="utf-8")
+        elif self.compression == "zstd":
+            self.file = io.TextIOWrapper(
+                zstandard.ZstdCompressor().stream_writer(
+                    open(self.path, "wb")
+                ),
+                encoding="utf-8",
+            )
+        else:
+            self.file = open(self.path, "w", encoding="utf-8")
+
+    def write(self, record):
+        """Appends record to the current batch file and returns the length
+        of its JSON encoding, 0 for Parquet."""
+        if self.path is None:
+            self.open_file()
+
+        self.file_records += 1
+        if self.batch_format == "parquet":
+            self.records.append(record)
+            if len(self.records) >= self.row_group_size:
+                self.write_row_group()
+            return 0
+
+        line = self.encode_record(record) + "\n"
+        self.file.write(line)
+        self.file_bytes += len(line)
+        return len(line)
+
+    def write_row_group(self):
+        """Writes the buffered Parquet records to the current file as a
+        row group. The first row group sets the schema of the file; if the
+        records do not fit it, the file is finished and they start a new
+        one."""
+        records, self.records = self.records, []
+        if self.parquet_writer is None:
+            table = pa.Table.from_pylist(records)
+            self.parquet_writer = pq.ParquetWriter(
+                self.file, table.schema, compression=self.compression
+            )
+        else:
+            try:
+                table = pa.Table.from_pylist(
+                    records, schema=self.parquet_writer.schema
+                )
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                self.file_records -= len(records)
+                self.finish_file()
+                self.open_file()
+                self.file_records = len(records)
+                self.records = records
+                self.write_row_group()
+                return
+
+        self.parquet_writer.write_table(table)
+        self.file_bytes = self.file.tell()
+
+    def is_full(self):
+        return (
+            self.file_records >= self.batch_size
+            or self.file_bytes >= self.max_file_bytes
+        )
+
+    def finish_file(self):
+        """Closes the current batch file, if any records were written to it,
+        and emits the BATCH message referencing it."""
+        if self.path is None:
+            return
+
+        if self.batch_format == "parquet":
+            if self.records:
+                self.write_row_group()
+            self.parquet_writer.close()
+        self.file.close()
+
+        messages.write_batch(
+            self.stream,
+            {"format": self.batch_format, "compression": self.compression},
+            [pathlib.Path(self.path).resolve().as_uri()],
+        )
+        LOGGER.info(
+            "Wrote %d records of %s to %s",
+            self.file_records,
+            self.stream,
+            self.path,
+        )
+        self.reset()
+
+    def abort(self):
+        """Discards the current, unfinished batch file."""
+        if self.path is None:
+            return
+
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.file is not None:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.reset()
+
+    def reset(self):
+        self.path = None
+        self.file = None
+        self.parquet_writer = None
+        self.records = []
+        self.file_records = 0
+        self.file_bytes = 0
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import threading
+from concurrent import futures
+
 import backoff
 
 import pyodbc
@@ -14,6 +17,12 @@ import singer
 
 LOGGER = singer.get_logger()
 
+DEFAULT_POOL_SIZE = 5
+
+# Engines shared by the whole run, by connection settings
+ENGINES = {}
+ENGINES_LOCK = threading.Lock()
+
 
 @backoff.on_exception(backoff.expo, pyodbc.Error, max_tries=5, factor=2)
 def connect_with_backoff(connection):
@@ -57,8 +66,45 @@ def revert_ouput_converter(conn, prev_converter):
     conn.connection.add_output_converter(pyodbc.SQL_WVARCHAR, prev_converter)
 
 
+def get_pool_size(config):
+    """Returns the pool_size config property or, when it is not set, enough
+    connections for every stream synced in parallel and every key range
+    of a partitioned full-table sync to hold one of their own."""
+    if config.get("pool_size"):
+        return int(config["pool_size"])
+
+    return max(
+        DEFAULT_POOL_SIZE,
+        int(config.get("max_parallel_streams") or 1)
+        * int(config.get("full_table_partitions") or 1),
+    )
+
+
+def prewarm_engine(engine, count):
+    """Opens count pooled connections concurrently and returns them to the
+    pool, so streams do not pay the connect latency when they start."""
+    count = min(count, engine.pool.size())
+    if count <= 0:
+        return
+
+    with futures.ThreadPoolExecutor(max_workers=count) as executor:
+        connections = list(
+            executor.map(lambda _: engine.connect(), range(count))
+        )
+    for connection in connections:
+        connection.close()
+
+    LOGGER.info("Pre-warmed %d pooled connections", count)
+
+
 def get_azure_sql_engine(config) -> Engine:
-    """The All-Purpose SQL connection object for the Azure Data Warehouse."""
+    """The All-Purpose SQL connection object for the Azure Data Warehouse.
+
+    The engine and its connection pool are created once per run and shared
+    by discovery and every stream and strategy. Pooled connections are
+    checked with a ping before use (pool_pre_ping, on by default), and
+    pool_prewarm connections are opened up front.
+    """
 
     # connection_string = "ibm_db_sa+pyodbc://db2inst1:*
     # @localhost:50000/TESTDB"
@@ -69,5 +115,27 @@ def get_azure_sql_engine(config) -> Engine:
         config["port"],
         config["database"],
     )
-    engine = create_engine(connection_string)
+    pool_size = get_pool_size(config)
+    pool_pre_ping = bool(config.get("pool_pre_ping", True))
+
+    engine_key = (connection_string, pool_size, pool_pre_ping)
+    with ENGINES_LOCK:
+        engine = ENGINES.get(engine_key)
+        if engine is None:
+            engine = create_engine(
+                connection_string,
+                pool_size=pool_size,
+                pool_pre_ping=pool_pre_ping,
+            )
+            prewarm_engine(engine, int(config.get("pool_prewarm") or 0))
+            ENGINES[engine_key] = engine
+
     return engine
+
+
+def dispose_engines():
+    """Closes the connections of every shared engine."""
+    with ENGINES_LOCK:
+        for engine in ENGINES.values():
+            engine.dispose()
+        ENGINES.clear()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+import singer
+from singer.catalog import Catalog
+
+LOGGER = singer.get_logger()
+
+CACHE_FORMAT_VERSION = 1
+
+
+class DiscoveryCache:
+    """CatalogEntries of earlier discoveries, stored on disk.
+
+    Every table is stored as the JSON of its CatalogEntry together with the
+    SYSCAT.TABLES.ALTER_TIME it was discovered at. A cached entry is only
+    returned for the same ALTER_TIME, so altered tables are rediscovered.
+    A missing, unreadable or outdated cache file is treated as empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tables = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                cached = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            LOGGER.warning("Ignoring discovery cache %s: %s", self.path, e)
+            return
+
+        if cached.get("version") != CACHE_FORMAT_VERSION:
+            LOGGER.info(
+                "Ignoring discovery cache %s of an older format", self.path
+            )
+            return
+
+        for table in cached.get("tables", []):
+            key = (table["table_schema"], table["table_name"])
+            self.tables[key] = (table["alter_time"], table["entry"])
+
+    def get(self, table_schema, table_name, alter_time):
+        """Returns the cached CatalogEntry of a table if it was discovered
+        at alter_time, otherwise None."""
+        cached = self.tables.get((table_schema, table_name))
+        if cached is None or cached[0] != alter_time:
+            return None
+
+        entry = Catalog.from_dict({"streams": [cached[1]]}).streams[0]
+        # JSON turns the breadcrumb tuples of discovery into lists
+        for md in entry.metadata:
+            md["breadcrumb"] = tuple(md["breadcrumb"])
+
+        return entry
+
+    def put(self, table_schema, table_name, alter_time, entry):
+        self.tables[(table_schema, table_name)] = (alter_time, entry.to_dict())
+
+    def save(self, tables):
+        """Writes the cache to disk, dropping every table that is not in
+        tables, a collection of (schema, table) pairs."""
+        cached_tables = []
+        for (table_schema, table_name), cached in self.tables.items():
+            if (table_schema, table_name) in tables:
+                cached_tables.append(
+                    {
+                        "table_schema": table_schema,
+                        "table_name": table_name,
+                        "alter_time": cached[0],
+                        "entry": cached[1],
+                    }
+                )
+
+        # Replace the file atomically so an interrupted run never leaves a
+        # truncated cache behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(
+                {"version": CACHE_FORMAT_VERSION, "tables": cached_tables},
+                cache_file,
+            )
+        os.replace(tmp_path, self.path)
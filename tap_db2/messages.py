@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+import contextlib
+import copy
+import json
+import sys
+import threading
+
+import pytz
+import simplejson
+import singer
+from singer import utils
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+LOGGER = singer.get_logger()
+
+DEFAULT_OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+
+def _encode_with_singer(record):
+    # Same encoder singer.write_message uses, including Decimal support
+    return simplejson.dumps(record, use_decimal=True)
+
+
+def _encode_with_stdlib(record):
+    try:
+        return json.dumps(record)
+    except TypeError:
+        return _encode_with_singer(record)
+
+
+def _encode_with_orjson(record):
+    try:
+        return orjson.dumps(record).decode("utf-8")
+    except TypeError:
+        return _encode_with_singer(record)
+
+
+def get_record_encoder(use_decimal):
+    """Returns the fastest available function encoding a record body.
+
+    Records that may contain Decimal values are encoded with simplejson,
+    exactly like singer.write_message does. Everything else goes through
+    orjson when it is installed, otherwise through the stdlib C encoder.
+    Both fall back to simplejson for values they cannot encode.
+    """
+    if use_decimal:
+        return _encode_with_singer
+    if orjson is not None:
+        return _encode_with_orjson
+    return _encode_with_stdlib
+
+
+class RecordWriter:
+    """Writes RECORD messages for a single stream.
+
+    The envelope of a RECORD message (type, stream, version and
+    time_extracted) is the same for every row of a stream sync, so it is
+    rendered once here and only the record body is encoded per row. The
+    output is a valid Singer RECORD message with the same keys, in the same
+    order, as singer.RecordMessage produces.
+    """
+
+    def __init__(
+        self, stream, version=None, time_extracted=None, use_decimal=True
+    ):
+        self.encode_record = get_record_encoder(use_decimal)
+
+        self.prefix = '{{"type": "RECORD", "stream": {}, "record": '.format(
+            json.dumps(stream)
+        )
+
+        suffix = ""
+        if version is not None:
+            suffix += ', "version": {}'.format(json.dumps(version))
+        if time_extracted:
+            as_utc = time_extracted.astimezone(pytz.utc)
+            suffix += ', "time_extracted": {}'.format(
+                json.dumps(utils.strftime(as_utc))
+            )
+        self.suffix = suffix + "}\n"
+
+    def format_record(self, record):
+        return self.prefix + self.encode_record(record) + self.suffix
+
+    def write(self, record):
+        """Writes the RECORD message for record and returns its length."""
+        line = self.format_record(record)
+        SINK.write(line)
+        return len(line)
+
+
+class MessageSink:
+    """Buffers formatted messages on their way to stdout.
+
+    Messages are accumulated until buffer_size characters are pending and
+    then handed to stdout in a single write. STATE messages always flush the
+    buffer, so every record a STATE message accounts for reaches the target
+    before the STATE itself does. A buffer_size of 0 writes every message
+    through immediately. The sink may be shared by several threads.
+    """
+
+    def __init__(self, buffer_size=0):
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.pending_size = 0
+        self.lock = threading.Lock()
+
+    def write(self, line):
+        with self.lock:
+            self.pending.append(line)
+            self.pending_size += len(line)
+            if self.pending_size >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            sys.stdout.write("".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+        sys.stdout.flush()
+
+
+class StateSerializer:
+    """Formats STATE messages without re-encoding unchanged bookmarks.
+
+    The bookmarks of every stream are encoded once and cached as a JSON
+    fragment. Formatting a state re-encodes only the bookmarks of the dirty
+    streams, and of streams whose bookmark dict was replaced since the last
+    STATE; every other stream reuses its cached fragment. The cost of a
+    checkpoint therefore no longer grows with the number of streams in the
+    state. The output is identical to singer.format_message.
+    """
+
+    def __init__(self):
+        self.fragments = {}
+        self.lock = threading.Lock()
+
+    def format_state(self, state, dirty_streams=None):
+        """Returns the STATE message for state as a line of JSON.
+
+        dirty_streams names the streams whose bookmarks may have changed
+        in place since the last call; None re-encodes every stream.
+        """
+        with self.lock:
+            items = []
+            for key, value in state.items():
+                if key == "bookmarks" and isinstance(value, dict):
+                    encoded = self._format_bookmarks(value, dirty_streams)
+                else:
+                    encoded = _encode_with_singer(value)
+                items.append("{}: {}".format(json.dumps(key), encoded))
+
+            return '{{"type": "STATE", "value": {{{}}}}}'.format(
+                ", ".join(items)
+            )
+
+    def _format_bookmarks(self, bookmarks, dirty_streams):
+        fragments = {}
+        items = []
+        for tap_stream_id, bookmark in bookmarks.items():
+            cached = self.fragments.get(tap_stream_id)
+            if (
+                cached is None
+                or cached[0] is not bookmark
+                or dirty_streams is None
+                or tap_stream_id in dirty_streams
+            ):
+                cached = (bookmark, _encode_with_singer(bookmark))
+
+            fragments[tap_stream_id] = cached
+            items.append("{}: {}".format(json.dumps(tap_stream_id), cached[1]))
+
+        self.fragments = fragments
+        return "{{{}}}".format(", ".join(items))
+
+
+class StateMerger:
+    """Merges the state of streams synced concurrently into one document.
+
+    Every stream synced in parallel works on its own state dict, returned by
+    start. The STATE messages those streams emit are intercepted by
+    write_message and their bookmarks merged into the shared state, which is
+    what actually gets written. currently_syncing always names the oldest
+    stream still in flight, so an interrupted run resumes from it.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.in_flight = []
+        self.serializer = StateSerializer()
+        self.lock = threading.RLock()
+
+    def start(self, tap_stream_id):
+        """Marks a stream as in flight and returns its own state dict."""
+        with self.lock:
+            self.in_flight.append(tap_stream_id)
+            stream_state = {"currently_syncing": tap_stream_id}
+            bookmark = self.state.get("bookmarks", {}).get(tap_stream_id)
+            if bookmark is not None:
+                stream_state["bookmarks"] = {
+                    tap_stream_id: copy.deepcopy(bookmark)
+                }
+            return stream_state
+
+    def finish(self, tap_stream_id, stream_state):
+        """Merges the final bookmarks of a stream that synced successfully."""
+        with self.lock:
+            self.merge(copy.deepcopy(stream_state))
+            self.in_flight.remove(tap_stream_id)
+            self.state["currently_syncing"] = self.currently_syncing()
+
+    def currently_syncing(self):
+        return self.in_flight[0] if self.in_flight else None
+
+    def merge(self, stream_state):
+        bookmarks = stream_state.get("bookmarks", {})
+        for tap_stream_id, bookmark in bookmarks.items():
+            self.state.setdefault("bookmarks", {})[tap_stream_id] = bookmark
+        self.state["currently_syncing"] = self.currently_syncing()
+        return self.state
+
+    def write_state(self, stream_state):
+        with self.lock:
+            merged = self.merge(stream_state)
+            dirty_streams = set(stream_state.get("bookmarks", {}))
+            SINK.write(
+                self.serializer.format_state(merged, dirty_streams) + "\n"
+            )
+            SINK.flush()
+
+
+SINK = MessageSink()
+
+SERIALIZER = StateSerializer()
+
+STATE_MERGER = None
+
+
+def configure(config):
+    """Applies the output_buffer_size config property to the sink."""
+    buffer_size = config.get("output_buffer_size")
+    if buffer_size is None:
+        buffer_size = DEFAULT_OUTPUT_BUFFER_SIZE
+    SINK.buffer_size = int(buffer_size)
+
+
+def write_message(message):
+    """Writes a Singer message through the sink.
+
+    Equivalent to singer.write_message, except that the message may sit in
+    the sink's buffer until the buffer fills up or a STATE message is
+    written. While merging_state is active, STATE messages are merged into
+    the shared state first.
+    """
+    if isinstance(message, singer.StateMessage):
+        write_state(message.value)
+    else:
+        SINK.write(singer.format_message(message) + "\n")
+
+
+def write_batch(stream, encoding, manifest):
+    """Writes a Singer BATCH message for the files listed in manifest."""
+    SINK.write(
+        json.dumps(
+            {
+                "type": "BATCH",
+                "stream": stream,
+                "encoding": encoding,
+                "manifest": manifest,
+            }
+        )
+        + "\n"
+    )
+
+
+def write_state(state, tap_stream_id=None):
+    """Writes a STATE message for state and flushes the sink.
+
+    Unlike write_message, state is not copied: it is serialized right away.
+    tap_stream_id names the only stream whose bookmarks changed since the
+    last STATE message, so the cached bookmarks of all other streams are
+    reused. Without it, every stream is re-encoded.
+    """
+    if STATE_MERGER is not None:
+        STATE_MERGER.write_state(state)
+        return
+
+    dirty_streams = None if tap_stream_id is None else {tap_stream_id}
+    SINK.write(SERIALIZER.format_state(state, dirty_streams) + "\n")
+    SINK.flush()
+
+
+@contextlib.contextmanager
+def merging_state(state_merger):
+    """Routes every STATE message through state_merger while active."""
+    global STATE_MERGER  # pylint: disable=global-statement
+    STATE_MERGER = state_merger
+    try:
+        yield state_merger
+    finally:
+        STATE_MERGER = None
+
+
+def flush():
+    SINK.flush()
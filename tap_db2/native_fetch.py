@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import decimal
+import queue
+import threading
+
+import singer
+
+try:
+    import ibm_db
+except ImportError:  # pragma: no cover - needs the Db2 CLI driver
+    ibm_db = None
+
+LOGGER = singer.get_logger()
+
+FETCH_BACKENDS = {"sqlalchemy", "ibm_db"}
+
+# Streams whose queries need the output converters installed on their
+# pyodbc connection, see connection.modify_ouput_converter
+SQLALCHEMY_STREAMS = {"dbo-InputMetadata"}
+
+# ibm_db returns the values of these column types as strings
+DECIMAL_FIELD_TYPES = {"decfloat", "decimal", "numeric"}
+
+
+def get_fetch_backend(config, tap_stream_id=None):
+    fetch_backend = (config or {}).get("fetch_backend") or "sqlalchemy"
+    if fetch_backend not in FETCH_BACKENDS:
+        raise Exception(
+            "Unknown fetch_backend {}, expected one of: {}".format(
+                fetch_backend, ", ".join(sorted(FETCH_BACKENDS))
+            )
+        )
+    if fetch_backend == "ibm_db" and ibm_db is None:
+        raise Exception(
+            "fetch_backend ibm_db requires the ibm_db package and its Db2 "
+            "CLI driver"
+        )
+    if tap_stream_id in SQLALCHEMY_STREAMS:
+        return "sqlalchemy"
+    return fetch_backend
+
+
+def generate_connection_string(config):
+    """Returns the Db2 CLI connection string for config.
+
+    BlockForNRows makes the driver return this many rows from the server per
+    block of a read-only cursor, like cursor_array_size does for pyodbc.
+    """
+    block_rows = int(
+        config.get("cursor_array_size") or config.get("fetch_batch_size") or 0
+    )
+    connection_string = (
+        "DATABASE={};HOSTNAME={};PORT={};PROTOCOL=TCPIP;UID={};PWD={};".format(
+            config["database"],
+            config["hostname"],
+            config["port"],
+            config["username"],
+            config["password"],
+        )
+    )
+    if block_rows:
+        connection_string += "BlockForNRows={};".format(block_rows)
+    return connection_string
+
+
+class NativeConnectionPool:
+    """Native ibm_db connections, reused by the queries of the whole run.
+
+    A connection is checked out for the lifetime of one result and returned
+    once the result is exhausted or closed. Connections that were closed by
+    the server are dropped and replaced.
+    """
+
+    def __init__(self, config):
+        self.connection_string = generate_connection_string(config)
+        self.idle = queue.LifoQueue()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def checkout(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if ibm_db.active(conn):
+                return conn
+            self.discard(conn)
+
+        conn = ibm_db.connect(self.connection_string, "", "")
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def checkin(self, conn):
+        self.idle.put(conn)
+
+    def discard(self, conn):
+        with self.lock:
+            self.connections.remove(conn)
+        try:
+            ibm_db.close(conn)
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                ibm_db.close(conn)
+            self.connections = []
+        self.idle = queue.LifoQueue()
+
+
+class NativeResult:
+    """The rows of a SELECT statement executed with ibm_db.
+
+    Offers the fetchmany method of a SQLAlchemy result, so
+    common.fetch_batches can read either. Rows are tuples with the same
+    Python types the SQLAlchemy path returns: DECIMAL, NUMERIC and DECFLOAT
+    values, which ibm_db fetches as strings, are converted to Decimal.
+    """
+
+    def __init__(self, pool, conn, stmt):
+        self.pool = pool
+        self.conn = conn
+        self.stmt = stmt
+        self.decimal_indexes = [
+            index
+            for index in range(ibm_db.num_fields(stmt))
+            if ibm_db.field_type(stmt, index) in DECIMAL_FIELD_TYPES
+        ]
+
+    def fetchmany(self, size):
+        if self.stmt is None:
+            return []
+
+        fetch_tuple = ibm_db.fetch_tuple
+        rows = []
+        for _ in range(size):
+            row = fetch_tuple(self.stmt)
+            if not row:
+                break
+            rows.append(row)
+
+        if self.decimal_indexes:
+            rows = [self.convert_decimals(row) for row in rows]
+
+        if len(rows) < size:
+            self.close()
+
+        return rows
+
+    def convert_decimals(self, row):
+        row = list(row)
+        for index in self.decimal_indexes:
+            if row[index] is not None:
+                row[index] = decimal.Decimal(row[index])
+        return tuple(row)
+
+    def close(self):
+        """Frees the statement and returns the connection to the pool."""
+        if self.stmt is None:
+            return
+
+        ibm_db.free_result(self.stmt)
+        self.stmt = None
+        self.pool.checkin(self.conn)
+
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool(config):
+    pool_key = generate_connection_string(config)
+    with POOLS_LOCK:
+        pool = POOLS.get(pool_key)
+        if pool is None:
+            pool = NativeConnectionPool(config)
+            POOLS[pool_key] = pool
+    return pool
+
+
+def execute_query(config, select_sql, params):
+    """Executes select_sql on a pooled native connection and returns a
+    NativeResult over its rows.
+
+    The statement is declared FOR READ ONLY on a forward-only cursor, so the
+    server blocks its rows instead of returning them one at a time. The
+    percent signs generate_select_sql escapes for the DBAPI are unescaped,
+    as ibm_db passes the statement on as is.
+    """
+    pool = get_pool(config)
+    conn = pool.checkout()
+    try:
+        sql = select_sql.replace("%%", "%") + " FOR READ ONLY"
+        if len(params) == 0:
+            stmt = ibm_db.exec_immediate(conn, sql)
+        else:
+            stmt = ibm_db.prepare(
+                conn,
+                sql,
+                {ibm_db.SQL_ATTR_CURSOR_TYPE: ibm_db.SQL_CURSOR_FORWARD_ONLY},
+            )
+            ibm_db.execute(stmt, tuple(params))
+    except Exception:
+        pool.checkin(conn)
+        raise
+
+    return NativeResult(pool, conn, stmt)
+
+
+def close_pools():
+    with POOLS_LOCK:
+        for pool in POOLS.values():
+            pool.close()
+        POOLS.clear()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import statistics
+
+import singer
+
+import tap_db2.sync_strategies.common as common
+
+LOGGER = singer.get_logger()
+
+STREAM_ORDERS = {"largest_first", "bin_packing"}
+
+# Throughput assumed for tables that were never synced, when no stream has
+# both a size estimate and a past sync duration to measure it from
+DEFAULT_BYTES_PER_SECOND = 10 * 1024 * 1024
+
+
+def get_estimated_size(catalog_entry):
+    stream_metadata = common.get_metadata_map(catalog_entry).get((), {})
+    return stream_metadata.get("estimated-size-bytes")
+
+
+def get_last_sync_seconds(catalog_entry, state):
+    return singer.get_bookmark(
+        state, catalog_entry.tap_stream_id, "last_sync_seconds"
+    )
+
+
+def estimate_costs(catalog_entries, state):
+    """Returns the estimated sync time in seconds of each stream, by
+    tap_stream_id.
+
+    The duration of the stream's previous sync is the best estimate. Streams
+    that were never synced are estimated from their estimated-size-bytes and
+    the median throughput of the streams that have both, and streams with
+    neither cost 0.
+    """
+    sizes = {}
+    durations = {}
+    for catalog_entry in catalog_entries:
+        tap_stream_id = catalog_entry.tap_stream_id
+        sizes[tap_stream_id] = get_estimated_size(catalog_entry)
+        durations[tap_stream_id] = get_last_sync_seconds(catalog_entry, state)
+
+    throughputs = [
+        sizes[tap_stream_id] / durations[tap_stream_id]
+        for tap_stream_id in sizes
+        if sizes[tap_stream_id] and durations[tap_stream_id]
+    ]
+    bytes_per_second = (
+        statistics.median(throughputs)
+        if throughputs
+        else DEFAULT_BYTES_PER_SECOND
+    )
+
+    costs = {}
+    for tap_stream_id, size in sizes.items():
+        if durations[tap_stream_id] is not None:
+            costs[tap_stream_id] = durations[tap_stream_id]
+        elif size is not None:
+            costs[tap_stream_id] = size / bytes_per_second
+        else:
+            costs[tap_stream_id] = 0
+
+    return costs
+
+
+def pack_streams(catalog_entries, state, stream_order, workers):
+    """Splits catalog_entries into one list of streams per worker.
+
+    largest_first hands out the streams by decreasing estimated cost, one at
+    a time, to whichever worker becomes free first; every list then holds a
+    single stream. bin_packing assigns every stream, by decreasing cost, to
+    the worker with the least estimated work so far, so each worker syncs
+    its list in order. A stream that was interrupted by the previous run
+    (currently_syncing) is always synced first.
+    """
+    costs = estimate_costs(catalog_entries, state)
+    currently_syncing = singer.get_currently_syncing(state)
+
+    ordered = sorted(
+        catalog_entries,
+        key=lambda e: (
+            e.tap_stream_id != currently_syncing,
+            -costs[e.tap_stream_id],
+        ),
+    )
+
+    if stream_order == "largest_first":
+        return [[catalog_entry] for catalog_entry in ordered]
+
+    bins = [[] for _ in range(max(workers, 1))]
+    loads = [0.0] * len(bins)
+    for catalog_entry in ordered:
+        idx = loads.index(min(loads))
+        bins[idx].append(catalog_entry)
+        loads[idx] += costs[catalog_entry.tap_stream_id]
+
+    LOGGER.info(
+        "Estimated seconds of work per worker: %s",
+        ", ".join("{:.0f}".format(load) for load in loads),
+    )
+
+    return [streams for streams in bins if streams]
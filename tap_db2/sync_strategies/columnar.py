@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - pyarrow is an optional speedup
+    pa = None
+    pc = None
+
+# pa.array raises these for values Arrow cannot represent, e.g. UUIDs
+ARROW_CONVERSION_ERRORS = (TypeError, ValueError, OverflowError)
+
+
+def is_available():
+    return pa is not None
+
+
+def format_timestamps(array):
+    # Arrow casts timestamps as "YYYY-MM-DD HH:MM:SS.ffffff", which is much
+    # faster than pc.strftime. Like datetime.isoformat(), the result omits
+    # zero microseconds.
+    formatted = pc.replace_substring_regex(
+        pc.utf8_replace_slice(
+            array.cast(pa.string()), start=10, stop=11, replacement="T"
+        ),
+        pattern=r"\.0+$",
+        replacement="",
+    )
+    return pc.binary_join_element_wise(formatted, "+00:00", "")
+
+
+def format_dates(array):
+    return pc.binary_join_element_wise(
+        array.cast(pa.string()), "T00:00:00+00:00", ""
+    )
+
+
+def convert_column(values, boolean=False):
+    """Converts the fetched values of a column with Arrow compute kernels.
+
+    Returns the converted values as a list, identical to converting every
+    value with common.convert_value, or None if the values have an Arrow
+    type this conversion does not handle; the caller then converts them one
+    by one. Timestamps and dates become ISO 8601 strings, BIT values
+    (b"\\x00") and the numbers of boolean columns become booleans, and
+    strings and numbers are passed through.
+    """
+    try:
+        array = pa.array(values)
+    except ARROW_CONVERSION_ERRORS + (pa.ArrowException,):
+        return None
+
+    arrow_type = array.type
+    if pa.types.is_timestamp(arrow_type) and arrow_type.tz is None:
+        return format_timestamps(array).to_pylist()
+    if pa.types.is_date(arrow_type):
+        return format_dates(array).to_pylist()
+    if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type):
+        return pc.not_equal(array, pa.scalar(b"\x00")).to_pylist()
+
+    if boolean:
+        if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+            return pc.not_equal(array, 0).to_pylist()
+        if pa.types.is_boolean(arrow_type) or pa.types.is_null(arrow_type):
+            return list(values)
+        return None
+
+    if (
+        pa.types.is_string(arrow_type)
+        or pa.types.is_integer(arrow_type)
+        or pa.types.is_floating(arrow_type)
+        or pa.types.is_boolean(arrow_type)
+        or pa.types.is_null(arrow_type)
+    ):
+        return list(values)
+
+    return None
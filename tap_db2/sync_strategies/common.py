@@ -1,18 +1,72 @@
 #!/usr/bin/env python3
 # pylint: disable=too-many-arguments,duplicate-code,too-many-locals
 
-import copy
 import datetime
+import decimal
+import pendulum
+import queue
 import singer
+import threading
 import time
 import uuid
+import weakref
 
 import singer.metrics as metrics
 from singer import metadata
 from singer import utils
 
+import tap_db2.messages as messages
+import tap_db2.native_fetch as native_fetch
+import tap_db2.sync_strategies.columnar as columnar
+from tap_db2.batch import BatchWriter
+from tap_db2.messages import RecordWriter
+
 LOGGER = singer.get_logger()
 
+DEFAULT_FETCH_BATCH_SIZE = 1000
+
+DEFAULT_CHECKPOINT_ROWS = 1000
+
+DEFAULT_PROGRESS_LOG_SECONDS = 60
+
+# Bookmarks kept whatever the replication method, used to schedule streams
+SCHEDULING_BOOKMARK_KEYS = {"last_sync_seconds"}
+
+NUMERIC_SQL_DATATYPES = {
+    "bigint",
+    "decfloat",
+    "decimal",
+    "double",
+    "float",
+    "int",
+    "integer",
+    "numeric",
+    "real",
+    "smallint",
+}
+
+DATETIME_SQL_DATATYPES = {
+    "datetime",
+    "datetime2",
+    "smalldatetime",
+    "timestamp",
+    "timestmp",
+}
+
+DECIMAL_SQL_DATATYPES = {"decfloat", "decimal", "numeric"}
+
+BINARY_SQL_DATATYPES = {"binary", "varbinary"}
+
+# Key values that come back from JSON state as inexact floats
+INEXACT_KEY_SQL_DATATYPES = DECIMAL_SQL_DATATYPES | {
+    "double",
+    "float",
+    "money",
+    "real",
+}
+
+PASSTHROUGH_VALUE_TYPES = {bool, decimal.Decimal, float, int, str, type(None)}
+
 
 def escape(string):
     if "`" in string:
@@ -45,15 +99,43 @@ def get_stream_version(tap_stream_id, state):
     return stream_version
 
 
+# Metadata maps by id() of their CatalogEntry, which is not hashable
+_METADATA_MAPS = {}
+
+
+def get_metadata_map(catalog_entry):
+    """Returns metadata.to_map of the metadata of catalog_entry.
+
+    The map is built once per entry and reused for as long as the entry's
+    metadata list is not replaced. It is shared and must not be modified.
+    """
+    key = id(catalog_entry)
+    cached = _METADATA_MAPS.get(key)
+    if (
+        cached is not None
+        and cached[0]() is catalog_entry
+        and cached[1] is catalog_entry.metadata
+    ):
+        return cached[2]
+
+    md_map = metadata.to_map(catalog_entry.metadata)
+    entry_ref = weakref.ref(
+        catalog_entry, lambda _: _METADATA_MAPS.pop(key, None)
+    )
+    _METADATA_MAPS[key] = (entry_ref, catalog_entry.metadata, md_map)
+
+    return md_map
+
+
 def stream_is_selected(stream):
-    md_map = metadata.to_map(stream.metadata)
+    md_map = get_metadata_map(stream)
     selected_md = metadata.get(md_map, (), "selected")
 
     return selected_md
 
 
 def property_is_selected(stream, property_name):
-    md_map = metadata.to_map(stream.metadata)
+    md_map = get_metadata_map(stream)
     return singer.should_sync_field(
         metadata.get(md_map, ("properties", property_name), "inclusion"),
         metadata.get(md_map, ("properties", property_name), "selected"),
@@ -62,22 +144,21 @@ def property_is_selected(stream, property_name):
 
 
 def get_is_view(catalog_entry):
-    md_map = metadata.to_map(catalog_entry.metadata)
+    md_map = get_metadata_map(catalog_entry)
 
     return md_map.get((), {}).get("is-view")
 
 
 def get_database_name(catalog_entry):
-    md_map = metadata.to_map(catalog_entry.metadata)
+    md_map = get_metadata_map(catalog_entry)
 
     return md_map.get((), {}).get("database-name")
 
 
 def get_key_properties(catalog_entry):
-    catalog_metadata = metadata.to_map(catalog_entry.metadata)
-    stream_metadata = catalog_metadata.get((), {})
+    stream_metadata = get_metadata_map(catalog_entry).get((), {})
 
-    is_view = get_is_view(catalog_entry)
+    is_view = stream_metadata.get("is-view")
 
     if is_view:
         key_properties = stream_metadata.get("view-key-properties", [])
@@ -102,51 +183,293 @@ def generate_select_sql(catalog_entry, columns):
     return select_sql
 
 
-def row_to_singer_record(
-    catalog_entry, version, table_stream, row, columns, time_extracted
+def generate_key_predicate(
+    key_properties, key_values, operator, last_operator
 ):
-    row_to_persist = ()
-    md_map = metadata.to_map(catalog_entry.metadata)
+    """Returns a WHERE predicate comparing the key columns to key_values.
+
+    The row comparison (k1, k2, ...) <op> (v1, v2, ...) is expanded into
+    OR'ed prefix equalities, e.g. for operator ">" and two key columns:
+    ("k1" > ?) OR ("k1" = ? AND "k2" > ?). last_operator is used for the
+    last key column, so "<" / "<=" yields an inclusive upper bound. Returns
+    the predicate and its positional parameters.
+    """
+    clauses = []
+    params = []
+
+    for idx, key in enumerate(key_properties):
+        op = last_operator if idx == len(key_properties) - 1 else operator
+        terms = ["{} = ?".format(escape(k)) for k in key_properties[:idx]]
+        terms.append("{} {} ?".format(escape(key), op))
+        clauses.append("({})".format(" AND ".join(terms)))
+        params.extend(key_values[k] for k in key_properties[: idx + 1])
+
+    return "({})".format(" OR ".join(clauses)), params
+
+
+def supports_keyset_pagination(catalog_entry, key_columns, columns):
+    """Keyset pagination continues strictly after the bookmarked key.
+
+    That needs the unique, non-NULL primary key of a base table; the
+    view-key-properties of a view may be neither. Every key column must be
+    selected and compare exactly with its bookmarked value, which rules out
+    hex-encoded binary keys and decimal or floating point keys, which are
+    read back from JSON state as floats.
+    """
+    if not key_columns or get_is_view(catalog_entry):
+        return False
+
+    md_map = get_metadata_map(catalog_entry)
+    for key in key_columns:
+        if key not in columns:
+            return False
+        sql_datatype = md_map.get(("properties", key), {}).get("sql-datatype")
+        if sql_datatype in BINARY_SQL_DATATYPES | INEXACT_KEY_SQL_DATATYPES:
+            return False
+
+    return True
+
+
+def generate_order_by_clause(columns):
+    return " ORDER BY {}".format(
+        ", ".join("{} ASC".format(escape(c)) for c in columns)
+    )
+
+
+def bookmark_to_query_values(catalog_entry, bookmark_values):
+    """Turns bookmarked key values back into query parameters.
+
+    Bookmarks hold the emitted, i.e. converted, values; date-time columns
+    are parsed back into datetimes so DB2 compares them as such.
+    """
+    query_values = {}
+    for column, value in bookmark_values.items():
+        column_schema = catalog_entry.schema.properties.get(column)
+        if (
+            value is not None
+            and column_schema is not None
+            and column_schema.format == "date-time"
+        ):
+            value = pendulum.parse(value)
+        query_values[column] = value
+
+    return query_values
+
+
+def convert_value(elem, property_type):
+    """Converts a single fetched value into its Singer representation."""
+    if isinstance(elem, datetime.datetime):
+        return elem.isoformat() + "+00:00"
+
+    elif isinstance(elem, datetime.date):
+        return elem.isoformat() + "T00:00:00+00:00"
+
+    elif isinstance(elem, datetime.timedelta):
+        epoch = datetime.datetime.utcfromtimestamp(0)
+        timedelta_from_epoch = epoch + elem
+        return timedelta_from_epoch.isoformat() + "+00:00"
+
+    elif isinstance(elem, bytes):
+        if property_type in ["binary", "varbinary"]:
+            # Convert binary byte array to hex string‘
+            return f"0x{elem.hex().upper()}"
+        else:
+            # for BIT value, treat 0 as False and anything else as True
+            return elem != b"\x00"
+
+    elif "boolean" in property_type:
+        if elem is None:
+            return None
+        elif elem == 0:
+            return False
+        else:
+            return True
+    elif isinstance(elem, uuid.UUID):
+        return str(elem)
+    else:
+        return elem
+
+
+def _make_converter(property_type):
+    if property_type in NUMERIC_SQL_DATATYPES:
+        # The driver already returns int/float/Decimal for these columns
+        return None
+
+    if "boolean" in property_type:
+
+        def converter(elem):
+            return convert_value(elem, property_type)
+
+    elif property_type in DATETIME_SQL_DATATYPES:
+
+        def converter(elem):
+            if elem.__class__ is datetime.datetime:
+                return elem.isoformat() + "+00:00"
+            if elem is None:
+                return None
+            return convert_value(elem, property_type)
+
+    else:
+
+        def converter(elem):
+            if elem.__class__ in PASSTHROUGH_VALUE_TYPES:
+                return elem
+            return convert_value(elem, property_type)
+
+    return converter
+
+
+def get_property_types(catalog_entry, columns):
+    """Returns the sql-datatype of each of the columns, "" if unknown."""
+    md_map = dict(get_metadata_map(catalog_entry))
     md_map[("properties", "_sdc_deleted_at")] = {
         "sql-datatype": "datetime"  # maybe datetimeoffset??
     }
-    for idx, elem in enumerate(row):
-        # property_type = catalog_entry.schema.properties[columns[idx]].type
-        property_type = md_map.get(("properties", columns[idx])).get("sql-datatype")
-        if isinstance(elem, datetime.datetime):
-            row_to_persist += (elem.isoformat() + "+00:00",)
-
-        elif isinstance(elem, datetime.date):
-            row_to_persist += (elem.isoformat() + "T00:00:00+00:00",)
-
-        elif isinstance(elem, datetime.timedelta):
-            epoch = datetime.datetime.utcfromtimestamp(0)
-            timedelta_from_epoch = epoch + elem
-            row_to_persist += (timedelta_from_epoch.isoformat() + "+00:00",)
-
-        elif isinstance(elem, bytes):
-            if property_type in ["binary", "varbinary"]:
-                # Convert binary byte array to hex string‘
-                hex_representation = f"0x{elem.hex().upper()}"
-                row_to_persist += (hex_representation,)
-            else:
-                # for BIT value, treat 0 as False and anything else as True
-                boolean_representation = elem != b"\x00"
-                row_to_persist += (boolean_representation,)
 
-        elif "boolean" in property_type or property_type == "boolean":
-            if elem is None:
-                boolean_representation = None
-            elif elem == 0:
-                boolean_representation = False
-            else:
-                boolean_representation = True
-            row_to_persist += (boolean_representation,)
-        elif isinstance(elem, uuid.UUID):
-            row_to_persist += (str(elem),)
+    return [
+        md_map.get(("properties", column), {}).get("sql-datatype") or ""
+        for column in columns
+    ]
+
+
+def build_row_converter(catalog_entry, columns):
+    """Compiles the conversion plan for rows of the given columns.
+
+    Each column's sql-datatype is resolved once, up front, so converting a
+    row does no metadata lookups. Numeric columns are not looked at at
+    all, and string and date-time columns only call convert_value for
+    values the driver did not already return as str or datetime. Returns
+    a callable mapping a fetched row to a record dict keyed by column name.
+    """
+    checked = []
+    datetimes = []
+    plan = []
+    for idx, property_type in enumerate(
+        get_property_types(catalog_entry, columns)
+    ):
+        if property_type in NUMERIC_SQL_DATATYPES:
+            continue
+        elif "boolean" in property_type:
+            plan.append((idx, _make_converter(property_type)))
+        elif property_type in DATETIME_SQL_DATATYPES:
+            datetimes.append((idx, property_type))
         else:
-            row_to_persist += (elem,)
-    rec = dict(zip(columns, row_to_persist))
+            checked.append((idx, property_type))
+
+    def convert_row(row):
+        values = list(row)
+        for idx, property_type in checked:
+            elem = values[idx]
+            if elem.__class__ not in PASSTHROUGH_VALUE_TYPES:
+                values[idx] = convert_value(elem, property_type)
+        for idx, property_type in datetimes:
+            elem = values[idx]
+            if elem.__class__ is datetime.datetime:
+                values[idx] = elem.isoformat() + "+00:00"
+            elif elem is not None:
+                values[idx] = convert_value(elem, property_type)
+        for idx, converter in plan:
+            values[idx] = converter(values[idx])
+        return dict(zip(columns, values))
+
+    return convert_row
+
+
+def build_batch_converter(catalog_entry, columns, config=None):
+    """Returns a callable converting a batch of fetched rows to records.
+
+    By default every row goes through build_row_converter. With the
+    columnar_conversion config property, each batch is transposed into
+    columns and every column that needs converting is converted at once
+    with Arrow compute kernels, falling back to converting its values one
+    by one when Arrow cannot handle them. Both produce the same records.
+    """
+    convert_row = build_row_converter(catalog_entry, columns)
+
+    if not (config or {}).get("columnar_conversion"):
+
+        def convert_rows(rows):
+            return [convert_row(row) for row in rows]
+
+        return convert_rows
+
+    if not columnar.is_available():
+        raise Exception("columnar_conversion requires the pyarrow package")
+
+    plan = []
+    for idx, property_type in enumerate(
+        get_property_types(catalog_entry, columns)
+    ):
+        converter = _make_converter(property_type)
+        if converter is not None:
+            vectorize = property_type not in BINARY_SQL_DATATYPES
+            plan.append(
+                (idx, converter, vectorize, "boolean" in property_type)
+            )
+
+    def convert_columns(rows):
+        if not rows:
+            return []
+
+        values = list(zip(*rows))
+        for idx, converter, vectorize, boolean in plan:
+            # Columns of strings and numbers need no conversion at all
+            value_types = set(map(type, values[idx]))
+            if not boolean and value_types <= PASSTHROUGH_VALUE_TYPES:
+                continue
+
+            converted = None
+            if vectorize:
+                converted = columnar.convert_column(values[idx], boolean)
+            if converted is None:
+                converted = [converter(elem) for elem in values[idx]]
+            values[idx] = converted
+
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    return convert_columns
+
+
+def uses_decimal(catalog_entry, columns):
+    """Whether records of the given columns may contain Decimal values."""
+    md_map = get_metadata_map(catalog_entry)
+    return any(
+        md_map.get(("properties", column), {}).get("sql-datatype")
+        in DECIMAL_SQL_DATATYPES
+        for column in columns
+    )
+
+
+def build_record_writer(
+    catalog_entry, columns, table_stream, version, time_extracted
+):
+    """Returns a RecordWriter for rows of the given columns."""
+    return RecordWriter(
+        table_stream,
+        version=version,
+        time_extracted=time_extracted,
+        use_decimal=uses_decimal(catalog_entry, columns),
+    )
+
+
+def build_batch_writer(catalog_entry, columns, table_stream, config=None):
+    """Returns a BatchWriter if the batch_config config property is set,
+    otherwise None."""
+    batch_config = (config or {}).get("batch_config")
+    if not batch_config:
+        return None
+
+    return BatchWriter(
+        table_stream,
+        batch_config,
+        use_decimal=uses_decimal(catalog_entry, columns),
+    )
+
+
+def row_to_singer_record(
+    catalog_entry, version, table_stream, row, columns, time_extracted
+):
+    rec = build_row_converter(catalog_entry, columns)(row)
 
     return singer.RecordMessage(
         stream=table_stream,
@@ -163,10 +486,357 @@ def whitelist_bookmark_keys(bookmark_key_set, tap_stream_id, state):
         .get(tap_stream_id, {})
         .keys()
         if non_whitelisted_bookmark_key not in bookmark_key_set
+        and non_whitelisted_bookmark_key not in SCHEDULING_BOOKMARK_KEYS
     ]:
         singer.clear_bookmark(state, tap_stream_id, bk)
 
 
+def get_fetch_batch_size(config):
+    return int(
+        (config or {}).get("fetch_batch_size") or DEFAULT_FETCH_BATCH_SIZE
+    )
+
+
+def execute_query(
+    connection, select_sql, params, config=None, tap_stream_id=None
+):
+    """Executes select_sql on a streaming, forward-only cursor.
+
+    params is a sequence of values for the query's positional placeholders.
+    Rows are pulled from the server in batches of fetch_batch_size and the
+    DBAPI cursor's arraysize is set from cursor_array_size (defaulting to the
+    batch size), so memory stays bounded regardless of the table size.
+
+    With the ibm_db fetch_backend the query bypasses SQLAlchemy and runs on
+    a native ibm_db connection instead of connection, unless the stream
+    tap_stream_id needs the output converters of connection.
+    """
+    if native_fetch.get_fetch_backend(config, tap_stream_id) == "ibm_db":
+        return native_fetch.execute_query(config, select_sql, params)
+
+    return execute_streaming_query(connection, select_sql, params, config)
+
+
+def execute_streaming_query(connection, select_sql, params, config=None):
+    """Executes select_sql on a streaming cursor of the SQLAlchemy
+    connection, whatever the fetch_backend."""
+    config = config or {}
+    batch_size = get_fetch_batch_size(config)
+    array_size = int(config.get("cursor_array_size") or batch_size)
+
+    streaming_conn = connection.execution_options(
+        stream_results=True, max_row_buffer=batch_size
+    )
+
+    if len(params) == 0:
+        results = streaming_conn.execute(select_sql)
+    else:
+        results = streaming_conn.execute(select_sql, tuple(params))
+
+    dbapi_cursor = getattr(results, "cursor", None)
+    if dbapi_cursor is not None:
+        dbapi_cursor.arraysize = array_size
+
+    return results
+
+
+def get_fetch_queue_depth(config):
+    return int((config or {}).get("fetch_queue_depth") or 0)
+
+
+def fetch_batches(results, batch_size):
+    """Yields lists of up to batch_size rows until results is exhausted.
+
+    results is closed once exhausted, or once the generator is closed
+    because the consumer stopped early. That frees its cursor and, for the
+    ibm_db fetch_backend, returns its native connection to the pool.
+    """
+    try:
+        while True:
+            rows = results.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        results.close()
+
+
+def put_unless_stopped(fetched, item, stopped):
+    """Puts item on the fetched queue unless stopped is set while waiting.
+
+    Returns False if the consumer stopped before the item could be queued.
+    """
+    while not stopped.is_set():
+        try:
+            fetched.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_ahead(batches, queue_depth):
+    """Iterates over batches while a background thread fetches ahead.
+
+    The thread keeps pulling the next batches into a queue of queue_depth
+    entries while the caller converts and emits the current one; the DBAPI
+    releases the GIL while it waits on the server, so the two overlap. Any
+    exception raised while fetching is re-raised in the caller. With a
+    queue_depth of 0 the batches are fetched inline. Closing the iterator
+    closes batches, once the thread has stopped.
+    """
+    if queue_depth <= 0:
+        yield from batches
+        return
+
+    fetched = queue.Queue(maxsize=queue_depth)
+    stopped = threading.Event()
+
+    def fetch():
+        try:
+            for batch in batches:
+                if not put_unless_stopped(fetched, ("batch", batch), stopped):
+                    return
+            put_unless_stopped(fetched, ("done", None), stopped)
+        except Exception as exc:  # pylint: disable=broad-except
+            put_unless_stopped(fetched, ("error", exc), stopped)
+
+    fetcher = threading.Thread(target=fetch, name="read-ahead", daemon=True)
+    fetcher.start()
+
+    try:
+        while True:
+            kind, item = fetched.get()
+            if kind == "batch":
+                yield item
+            elif kind == "error":
+                raise item
+            else:
+                return
+    finally:
+        stopped.set()
+        fetcher.join()
+        close = getattr(batches, "close", None)
+        if close is not None:
+            close()
+
+
+class CheckpointPolicy:
+    """Decides when a sync emits its next checkpoint.
+
+    A checkpoint is due once max_rows rows, or max_bytes characters of
+    RECORD messages, have been emitted since the last one, or max_seconds
+    have passed since it. Each limit is disabled when 0 or None.
+    """
+
+    def __init__(
+        self, max_rows=DEFAULT_CHECKPOINT_ROWS, max_bytes=0, max_seconds=0
+    ):
+        self.max_rows = max_rows or 0
+        self.max_bytes = max_bytes or 0
+        self.max_seconds = max_seconds or 0
+        self.reset()
+
+    def reset(self):
+        """Starts counting towards the next checkpoint."""
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def record_emitted(self, size):
+        """Counts one emitted record of size characters; returns True when
+        a checkpoint is due."""
+        self.rows += 1
+        self.bytes += size
+
+        return bool(
+            (self.max_rows and self.rows >= self.max_rows)
+            or (self.max_bytes and self.bytes >= self.max_bytes)
+            or (
+                self.max_seconds
+                and time.monotonic() - self.started >= self.max_seconds
+            )
+        )
+
+
+def get_checkpoint_policy(config):
+    """Builds the CheckpointPolicy for the checkpoint_rows, checkpoint_bytes
+    and checkpoint_seconds config properties."""
+    config = config or {}
+    max_rows = config.get("checkpoint_rows")
+    if max_rows is None:
+        max_rows = DEFAULT_CHECKPOINT_ROWS
+
+    return CheckpointPolicy(
+        max_rows=int(max_rows),
+        max_bytes=int(config.get("checkpoint_bytes") or 0),
+        max_seconds=float(config.get("checkpoint_seconds") or 0),
+    )
+
+
+class SyncProgress:
+    """Tracks the rows synced for a stream and logs progress periodically.
+
+    Progress is logged at most every log_seconds seconds with the rows
+    synced so far and the rate. When the number of rows to sync is known,
+    e.g. from the row-count metadata of a full-table sync, the percentage
+    done and the estimated time remaining are logged as well.
+    """
+
+    def __init__(
+        self,
+        table,
+        expected_rows=None,
+        log_seconds=DEFAULT_PROGRESS_LOG_SECONDS,
+    ):
+        self.table = table
+        self.expected_rows = expected_rows
+        self.log_seconds = log_seconds
+        self.rows = 0
+        self.started = time.monotonic()
+        self.last_logged = self.started
+
+    def add(self, rows):
+        self.rows += rows
+
+        now = time.monotonic()
+        if self.log_seconds and now - self.last_logged >= self.log_seconds:
+            self.last_logged = now
+            self.log(now)
+
+    def log(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+
+        if self.expected_rows and rate:
+            remaining = max(self.expected_rows - self.rows, 0) / rate
+            LOGGER.info(
+                "Synced %d of ~%d rows of %s (%.1f%%), %.0f rows/sec, ETA %s",
+                self.rows,
+                self.expected_rows,
+                self.table,
+                min(100.0 * self.rows / self.expected_rows, 100.0),
+                rate,
+                datetime.timedelta(seconds=int(remaining)),
+            )
+        else:
+            LOGGER.info(
+                "Synced %d rows of %s, %.0f rows/sec",
+                self.rows,
+                self.table,
+                rate,
+            )
+
+
+# Progress of the streams being synced, by tap_stream_id
+_SYNC_PROGRESS = {}
+
+
+def start_progress(catalog_entry, expected_rows=None, config=None):
+    """Starts tracking the progress of a stream sync.
+
+    Every sync_query of the stream adds to it until finish_progress, so
+    chunked syncs report progress for the stream as a whole.
+    """
+    log_seconds = (config or {}).get("progress_log_seconds")
+    if log_seconds is None:
+        log_seconds = DEFAULT_PROGRESS_LOG_SECONDS
+
+    progress = SyncProgress(
+        catalog_entry.table, expected_rows, float(log_seconds)
+    )
+    _SYNC_PROGRESS[catalog_entry.tap_stream_id] = progress
+
+    return progress
+
+
+def get_progress(catalog_entry):
+    progress = _SYNC_PROGRESS.get(catalog_entry.tap_stream_id)
+    if progress is None:
+        progress = start_progress(catalog_entry)
+
+    return progress
+
+
+def finish_progress(catalog_entry):
+    """Logs the final progress of a stream sync and stops tracking it."""
+    progress = _SYNC_PROGRESS.pop(catalog_entry.tap_stream_id, None)
+    if progress is not None and progress.rows:
+        progress.log()
+
+
+class BookmarkTracker:
+    """Tracks the bookmark of a stream while sync_query emits its rows.
+
+    The replication method, replication key and key properties are resolved
+    once when the tracker is created. During the sync only the last record
+    emitted is remembered; it is turned into bookmarks by write_bookmarks,
+    which is called right before a STATE message is emitted.
+
+    last_pk_fetched is only bookmarked with track_last_pk, i.e. when the
+    rows are read in primary key order, as only then can a sync resume
+    after it.
+    """
+
+    def __init__(self, catalog_entry, state, track_last_pk=True):
+        self.tap_stream_id = catalog_entry.tap_stream_id
+        self.replication_key = None
+        self.key_properties = None
+
+        md_map = get_metadata_map(catalog_entry)
+        replication_method = md_map.get((), {}).get("replication-method")
+
+        if replication_method in {"FULL_TABLE", "LOG_BASED"}:
+            max_pk_values = singer.get_bookmark(
+                state, self.tap_stream_id, "max_pk_values"
+            )
+
+            if max_pk_values:
+                self.key_properties = get_key_properties(catalog_entry)
+
+        elif replication_method == "INCREMENTAL":
+            self.replication_key = singer.get_bookmark(
+                state, self.tap_stream_id, "replication_key"
+            )
+            self.key_properties = get_key_properties(catalog_entry)
+
+        if not track_last_pk:
+            self.key_properties = None
+
+    def write_bookmarks(self, state, last_record):
+        """Writes the bookmarks for last_record, if any, into state."""
+        if last_record is None:
+            return state
+
+        if self.replication_key is not None:
+            state = singer.write_bookmark(
+                state,
+                self.tap_stream_id,
+                "replication_key",
+                self.replication_key,
+            )
+
+            state = singer.write_bookmark(
+                state,
+                self.tap_stream_id,
+                "replication_key_value",
+                last_record[self.replication_key],
+            )
+
+        if self.key_properties:
+            last_pk_fetched = {
+                k: last_record[k]
+                for k in self.key_properties
+                if k in last_record
+            }
+
+            state = singer.write_bookmark(
+                state, self.tap_stream_id, "last_pk_fetched", last_pk_fetched
+            )
+
+        return state
+
+
 def sync_query(
     cursor,
     catalog_entry,
@@ -176,19 +846,77 @@ def sync_query(
     stream_version,
     table_stream,
     params,
+    config=None,
+    track_last_pk=True,
 ):
-    replication_key = singer.get_bookmark(
-        state, catalog_entry.tap_stream_id, "replication_key"
-    )
-
     # query_string = cursor.mogrify(select_sql, params)
 
     time_extracted = utils.now()
-    if len(params) == 0:
-        results = cursor.execute(select_sql)
+    results = execute_query(
+        cursor, select_sql, params, config, catalog_entry.tap_stream_id
+    )
+
+    batches = read_ahead(
+        fetch_batches(results, get_fetch_batch_size(config)),
+        get_fetch_queue_depth(config),
+    )
+
+    return sync_batches(
+        batches,
+        catalog_entry,
+        state,
+        columns,
+        stream_version,
+        table_stream,
+        time_extracted,
+        config,
+        track_last_pk,
+    )
+
+
+def sync_batches(
+    batches,
+    catalog_entry,
+    state,
+    columns,
+    stream_version,
+    table_stream,
+    time_extracted,
+    config=None,
+    track_last_pk=True,
+):
+    """Emits the rows of batches as RECORD messages, checkpointing state.
+
+    batches is an iterator of row lists; it is closed once the rows have
+    been emitted or emitting them failed. Checkpoints follow the
+    CheckpointPolicy built from config. Returns the number of rows emitted.
+
+    With the batch_config config property the records are written to batch
+    files instead. A checkpoint then follows every batch file that is
+    closed, once its BATCH message is out, so STATE never covers records
+    that are still in an unfinished file.
+
+    track_last_pk is passed on to the BookmarkTracker; it is False when the
+    rows are not read in primary key order.
+    """
+    convert_rows = build_batch_converter(catalog_entry, columns, config)
+    batch_writer = build_batch_writer(
+        catalog_entry, columns, table_stream, config
+    )
+    if batch_writer is not None:
+        write_record = batch_writer.write
     else:
-        results = cursor.execute(select_sql, params["replication_key_value"])
-    row = results.fetchone()
+        write_record = build_record_writer(
+            catalog_entry,
+            columns,
+            table_stream,
+            stream_version,
+            time_extracted,
+        ).write
+    bookmark_tracker = BookmarkTracker(catalog_entry, state, track_last_pk)
+    checkpoint_policy = get_checkpoint_policy(config)
+    progress = get_progress(catalog_entry)
+    last_record = None
     rows_saved = 0
 
     database_name = get_database_name(catalog_entry)
@@ -197,61 +925,39 @@ def sync_query(
         counter.tags["database"] = database_name
         counter.tags["table"] = catalog_entry.table
 
-        while row:
-            counter.increment()
-            rows_saved += 1
-            record_message = row_to_singer_record(
-                catalog_entry,
-                stream_version,
-                table_stream,
-                row,
-                columns,
-                time_extracted,
-            )
-            singer.write_message(record_message)
-            md_map = metadata.to_map(catalog_entry.metadata)
-            stream_metadata = md_map.get((), {})
-            replication_method = stream_metadata.get("replication-method")
-
-            if replication_method in {"FULL_TABLE", "LOG_BASED"}:
-                key_properties = get_key_properties(catalog_entry)
-
-                max_pk_values = singer.get_bookmark(
-                    state, catalog_entry.tap_stream_id, "max_pk_values"
-                )
-
-                if max_pk_values:
-                    last_pk_fetched = {
-                        k: v
-                        for k, v in record_message.record.items()
-                        if k in key_properties
-                    }
-
-                    state = singer.write_bookmark(
-                        state,
-                        catalog_entry.tap_stream_id,
-                        "last_pk_fetched",
-                        last_pk_fetched,
+        try:
+            for rows in batches:
+                for last_record in convert_rows(rows):
+                    counter.increment()
+                    rows_saved += 1
+                    size = write_record(last_record)
+
+                    if batch_writer is not None:
+                        if not batch_writer.is_full():
+                            continue
+                        batch_writer.finish_file()
+                    elif not checkpoint_policy.record_emitted(size):
+                        continue
+
+                    checkpoint_policy.reset()
+                    state = bookmark_tracker.write_bookmarks(
+                        state, last_record
                     )
+                    messages.write_state(state, catalog_entry.tap_stream_id)
 
-            elif replication_method == "INCREMENTAL":
-                if replication_key is not None:
-                    state = singer.write_bookmark(
-                        state,
-                        catalog_entry.tap_stream_id,
-                        "replication_key",
-                        replication_key,
-                    )
+                progress.add(len(rows))
+        except Exception:
+            if batch_writer is not None:
+                batch_writer.abort()
+            raise
+        finally:
+            # Stops any fetching threads if emitting fails part-way
+            batches.close()
 
-                    state = singer.write_bookmark(
-                        state,
-                        catalog_entry.tap_stream_id,
-                        "replication_key_value",
-                        record_message.record[replication_key],
-                    )
-            if rows_saved % 1000 == 0:
-                singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    if batch_writer is not None:
+        batch_writer.finish_file()
 
-            row = results.fetchone()
+    state = bookmark_tracker.write_bookmarks(state, last_record)
+    messages.write_state(state, catalog_entry.tap_stream_id)
 
-    singer.write_message(singer.StateMessage(value=copy.deepcopy(state)))
+    return rows_saved
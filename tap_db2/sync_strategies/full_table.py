@@ -2,23 +2,30 @@
 # pylint: disable=duplicate-code,too-many-locals,simplifiable-if-expression
 
 import copy
+import queue
+import threading
+
 import singer
-from singer import metadata
+from singer import utils
 
+import tap_db2.messages as messages
 import tap_db2.sync_strategies.common as common
 
 from tap_db2.connection import (
     connect_with_backoff,
-    get_azure_sql_engine,
     modify_ouput_converter,
     revert_ouput_converter,
 )
 
 LOGGER = singer.get_logger()
 
+INTEGER_SQL_DATATYPES = {"bigint", "int", "integer", "smallint"}
+
+DEFAULT_CHUNK_SIZE = 100000
+
 
 def generate_bookmark_keys(catalog_entry):
-    md_map = metadata.to_map(catalog_entry.metadata)
+    md_map = common.get_metadata_map(catalog_entry)
     stream_metadata = md_map.get((), {})
     replication_method = stream_metadata.get("replication-method")
 
@@ -27,6 +34,7 @@ def generate_bookmark_keys(catalog_entry):
         "max_pk_values",
         "version",
         "initial_full_table_complete",
+        "partitions",
     }
 
     bookmark_keys = base_bookmark_keys
@@ -34,8 +42,271 @@ def generate_bookmark_keys(catalog_entry):
     return bookmark_keys
 
 
+def get_partition_column(catalog_entry):
+    """Returns the leading key column if the table can be split on it.
+
+    Views are never split: rows whose view key is NULL fall in no range.
+    """
+    key_properties = common.get_key_properties(catalog_entry)
+    if not key_properties or common.get_is_view(catalog_entry):
+        return None
+
+    md_map = common.get_metadata_map(catalog_entry)
+    sql_datatype = md_map.get(("properties", key_properties[0]), {}).get("sql-datatype")
+    if sql_datatype not in INTEGER_SQL_DATATYPES:
+        return None
+
+    return key_properties[0]
+
+
+def split_key_range(min_value, max_value, partition_count):
+    """Splits [min_value, max_value] into contiguous, inclusive key ranges."""
+    span = max_value - min_value + 1
+    partition_count = min(partition_count, span)
+    size, remainder = divmod(span, partition_count)
+
+    key_ranges = []
+    lower = min_value
+    for index in range(partition_count):
+        upper = lower + size - 1 + (1 if index < remainder else 0)
+        key_ranges.append({"lower": lower, "upper": upper, "complete": False})
+        lower = upper + 1
+
+    return key_ranges
+
+
+def plan_partitions(open_conn, catalog_entry, partition_column, partition_count):
+    """Probes MIN/MAX of partition_column and splits the table into ranges."""
+    escaped_column = common.escape(partition_column)
+    probe_sql = "SELECT MIN({}), MAX({}) FROM {}.{}".format(
+        escaped_column,
+        escaped_column,
+        common.escape(common.get_database_name(catalog_entry)),
+        common.escape(catalog_entry.table),
+    )
+    min_value, max_value = open_conn.execute(probe_sql).fetchone()
+
+    if min_value is None:
+        return None
+
+    return {
+        "column": partition_column,
+        "ranges": split_key_range(int(min_value), int(max_value), partition_count),
+    }
+
+
+def fetch_partitions(mssql_conn, catalog_entry, partition_sql, key_ranges, config):
+    """Yields the row batches of every key range, each fetched on its own
+    connection and thread.
+
+    A range is marked complete, in place, once all of its batches have been
+    yielded and the consumer asks for more, i.e. once all of its rows have
+    been emitted.
+    """
+    batch_size = common.get_fetch_batch_size(config)
+    fetched = queue.Queue(
+        maxsize=max(len(key_ranges), common.get_fetch_queue_depth(config))
+    )
+    stopped = threading.Event()
+
+    def fetch(key_range):
+        try:
+            with mssql_conn.connect() as open_conn:
+                if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+                    prev_converter = modify_ouput_converter(open_conn)
+
+                results = common.execute_query(
+                    open_conn,
+                    partition_sql,
+                    [key_range["lower"], key_range["upper"]],
+                    config,
+                    catalog_entry.tap_stream_id,
+                )
+                for rows in common.fetch_batches(results, batch_size):
+                    item = ("batch", key_range, rows)
+                    if not common.put_unless_stopped(fetched, item, stopped):
+                        return
+
+                if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+                    revert_ouput_converter(open_conn, prev_converter)
+
+            common.put_unless_stopped(fetched, ("done", key_range, None), stopped)
+        except Exception as exc:  # pylint: disable=broad-except
+            common.put_unless_stopped(fetched, ("error", key_range, exc), stopped)
+
+    fetchers = [
+        threading.Thread(
+            target=fetch, args=(key_range,), name=f"partition-{index}", daemon=True
+        )
+        for index, key_range in enumerate(key_ranges)
+    ]
+    for fetcher in fetchers:
+        fetcher.start()
+
+    remaining = len(key_ranges)
+    try:
+        while remaining:
+            kind, key_range, item = fetched.get()
+            if kind == "batch":
+                yield item
+            elif kind == "error":
+                raise item
+            else:
+                key_range["complete"] = True
+                remaining -= 1
+                LOGGER.info(
+                    "Finished key range %s to %s of %s",
+                    key_range["lower"],
+                    key_range["upper"],
+                    catalog_entry.table,
+                )
+    finally:
+        stopped.set()
+        for fetcher in fetchers:
+            fetcher.join()
+
+
+def sync_partitions(
+    mssql_conn,
+    config,
+    catalog_entry,
+    state,
+    columns,
+    stream_version,
+    table_stream,
+    partitions,
+):
+    key_ranges = [r for r in partitions["ranges"] if not r["complete"]]
+    LOGGER.info(
+        "Syncing %s of %s key ranges of %s on %s",
+        len(key_ranges),
+        len(partitions["ranges"]),
+        catalog_entry.table,
+        partitions["column"],
+    )
+
+    escaped_column = common.escape(partitions["column"])
+    partition_sql = common.generate_select_sql(
+        catalog_entry, columns
+    ) + " WHERE {} >= ? AND {} <= ?".format(escaped_column, escaped_column)
+
+    common.sync_batches(
+        fetch_partitions(mssql_conn, catalog_entry, partition_sql, key_ranges, config),
+        catalog_entry,
+        state,
+        columns,
+        stream_version,
+        table_stream,
+        utils.now(),
+        config,
+    )
+
+
+def get_max_pk_values(open_conn, catalog_entry, key_properties):
+    """Returns the largest key in the table, as it would be bookmarked."""
+    escaped_keys = [common.escape(k) for k in key_properties]
+    max_pk_sql = "SELECT {} FROM {}.{} ORDER BY {} FETCH FIRST 1 ROWS ONLY".format(
+        ",".join(escaped_keys),
+        common.escape(common.get_database_name(catalog_entry)),
+        common.escape(catalog_entry.table),
+        ", ".join("{} DESC".format(k) for k in escaped_keys),
+    )
+    row = open_conn.execute(max_pk_sql).fetchone()
+
+    if row is None:
+        return None
+
+    return common.build_row_converter(catalog_entry, key_properties)(row)
+
+
+def sync_keyset_chunks(
+    mssql_conn,
+    config,
+    catalog_entry,
+    state,
+    columns,
+    stream_version,
+    table_stream,
+    key_properties,
+):
+    """Syncs the table in primary key order, one chunk at a time.
+
+    The largest key is captured in the max_pk_values bookmark before the
+    first chunk, and every chunk query is bounded by it. Each chunk selects
+    up to full_table_chunk_size rows with keys after last_pk_fetched and
+    ends with a checkpoint, so an interrupted sync resumes after the last
+    emitted row instead of from the start of the table.
+    """
+    tap_stream_id = catalog_entry.tap_stream_id
+    chunk_size = int(config.get("full_table_chunk_size", DEFAULT_CHUNK_SIZE) or 0)
+
+    with mssql_conn.connect() as open_conn:
+        max_pk_values = singer.get_bookmark(state, tap_stream_id, "max_pk_values")
+
+        if not max_pk_values:
+            max_pk_values = get_max_pk_values(open_conn, catalog_entry, key_properties)
+
+            if max_pk_values is None:
+                LOGGER.info("Table %s is empty", catalog_entry.table)
+                return
+
+            state = singer.write_bookmark(
+                state, tap_stream_id, "max_pk_values", max_pk_values
+            )
+
+        select_sql = common.generate_select_sql(catalog_entry, columns)
+        upper_bound, upper_bound_params = common.generate_key_predicate(
+            key_properties,
+            common.bookmark_to_query_values(catalog_entry, max_pk_values),
+            "<",
+            "<=",
+        )
+        order_by = common.generate_order_by_clause(key_properties)
+
+        if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+            prev_converter = modify_ouput_converter(open_conn)
+
+        while True:
+            predicates = [upper_bound]
+            params = list(upper_bound_params)
+
+            last_pk_fetched = singer.get_bookmark(
+                state, tap_stream_id, "last_pk_fetched"
+            )
+            if last_pk_fetched:
+                continuation, continuation_params = common.generate_key_predicate(
+                    key_properties,
+                    common.bookmark_to_query_values(catalog_entry, last_pk_fetched),
+                    ">",
+                    ">",
+                )
+                predicates.append(continuation)
+                params.extend(continuation_params)
+
+            chunk_sql = select_sql + " WHERE " + " AND ".join(predicates) + order_by
+            if chunk_size:
+                chunk_sql += " FETCH FIRST {} ROWS ONLY".format(chunk_size)
+
+            rows_saved = common.sync_query(
+                open_conn,
+                catalog_entry,
+                state,
+                chunk_sql,
+                columns,
+                stream_version,
+                table_stream,
+                params,
+                config,
+            )
+
+            if not chunk_size or rows_saved < chunk_size:
+                break
+
+        if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+            revert_ouput_converter(open_conn, prev_converter)
+
+
 def sync_table(mssql_conn, config, catalog_entry, state, columns, stream_version):
-    mssql_conn = get_azure_sql_engine(config)
     common.whitelist_bookmark_keys(
         generate_bookmark_keys(catalog_entry), catalog_entry.tap_stream_id, state
     )
@@ -60,33 +331,80 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns, stream_version
     if not initial_full_table_complete and not (
         version_exists and state_version is None
     ):
-        singer.write_message(activate_version_message)
+        messages.write_message(activate_version_message)
 
-    with mssql_conn.connect() as open_conn:
-        LOGGER.info("Generating select_sql")
-        select_sql = common.generate_select_sql(catalog_entry, columns)
+    key_properties = common.get_key_properties(catalog_entry)
+    partition_column = get_partition_column(catalog_entry)
+    partition_count = int(config.get("full_table_partitions") or 1)
+    partitions = singer.get_bookmark(state, catalog_entry.tap_stream_id, "partitions")
 
-        params = {}
+    if partitions and partitions.get("column") != partition_column:
+        LOGGER.info("Key of %s changed, discarding key ranges", catalog_entry.table)
+        partitions = None
 
-        if catalog_entry.tap_stream_id == "dbo-InputMetadata":
-            prev_converter = modify_ouput_converter(open_conn)
+    with mssql_conn.connect() as open_conn:
+        if not partitions and partition_count > 1 and partition_column:
+            partitions = plan_partitions(
+                open_conn, catalog_entry, partition_column, partition_count
+            )
+
+        if partitions:
+            state = singer.write_bookmark(
+                state, catalog_entry.tap_stream_id, "partitions", partitions
+            )
+        else:
+            singer.clear_bookmark(state, catalog_entry.tap_stream_id, "partitions")
 
-        common.sync_query(
-            open_conn,
+    if partitions:
+        sync_partitions(
+            mssql_conn,
+            config,
             catalog_entry,
             state,
-            select_sql,
             columns,
             stream_version,
             table_stream,
-            params,
+            partitions,
         )
+    elif common.supports_keyset_pagination(catalog_entry, key_properties, columns):
+        sync_keyset_chunks(
+            mssql_conn,
+            config,
+            catalog_entry,
+            state,
+            columns,
+            stream_version,
+            table_stream,
+            key_properties,
+        )
+    else:
+        with mssql_conn.connect() as open_conn:
+            LOGGER.info("Generating select_sql")
+            select_sql = common.generate_select_sql(catalog_entry, columns)
 
-        if catalog_entry.tap_stream_id == "dbo-InputMetadata":
-            revert_ouput_converter(open_conn, prev_converter)
+            params = []
+
+            if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+                prev_converter = modify_ouput_converter(open_conn)
+
+            common.sync_query(
+                open_conn,
+                catalog_entry,
+                state,
+                select_sql,
+                columns,
+                stream_version,
+                table_stream,
+                params,
+                config,
+            )
+
+            if catalog_entry.tap_stream_id == "dbo-InputMetadata":
+                revert_ouput_converter(open_conn, prev_converter)
 
-    # clear max pk value and last pk fetched upon successful sync
+    # clear max pk value, last pk fetched and key ranges upon successful sync
     singer.clear_bookmark(state, catalog_entry.tap_stream_id, "max_pk_values")
     singer.clear_bookmark(state, catalog_entry.tap_stream_id, "last_pk_fetched")
+    singer.clear_bookmark(state, catalog_entry.tap_stream_id, "partitions")
 
-    singer.write_message(activate_version_message)
+    messages.write_message(activate_version_message)
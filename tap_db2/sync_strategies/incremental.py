@@ -3,17 +3,211 @@
 
 import pendulum
 import singer
-from singer import metadata
 
 # from tap_db2.connection import (
 #     # connect_with_backoff,
 #     get_azure_sql_engine,
 # )
+import tap_db2.messages as messages
 import tap_db2.sync_strategies.common as common
 
 LOGGER = singer.get_logger()
 
-BOOKMARK_KEYS = {"replication_key", "replication_key_value", "version"}
+BOOKMARK_KEYS = {
+    "replication_key",
+    "replication_key_value",
+    "last_pk_fetched",
+    "version",
+}
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def get_keyset_columns(replication_key, key_properties):
+    """Returns the columns incremental rows are ordered by: the replication
+    key, with the primary key breaking ties between equal values."""
+    return [replication_key] + [
+        k for k in key_properties if k != replication_key
+    ]
+
+
+def sync_null_replication_keys(
+    open_conn,
+    config,
+    catalog_entry,
+    state,
+    columns,
+    stream_version,
+    table_stream,
+    replication_key,
+    key_properties,
+):
+    """Syncs the rows whose replication key is NULL, in primary key order.
+
+    Keyset chunks cannot reach these rows, as no bookmark can point at them.
+    Like the single WHERE key >= ? query, they are only synced while there
+    is no replication_key_value bookmark, i.e. on the initial sync. They are
+    read in chunks of incremental_chunk_size rows; an interrupted sync
+    resumes after the last_pk_fetched bookmark, which is cleared once all of
+    them are synced.
+    """
+    tap_stream_id = catalog_entry.tap_stream_id
+    chunk_size = int(
+        config.get("incremental_chunk_size", DEFAULT_CHUNK_SIZE) or 0
+    )
+
+    LOGGER.info(
+        "Syncing rows of %s whose replication key %s is NULL",
+        catalog_entry.table,
+        replication_key,
+    )
+    select_sql = common.generate_select_sql(catalog_entry, columns)
+    is_null = "{} IS NULL".format(common.escape(replication_key))
+    order_by = common.generate_order_by_clause(key_properties)
+
+    while True:
+        predicates = [is_null]
+        params = []
+
+        last_pk_fetched = singer.get_bookmark(
+            state, tap_stream_id, "last_pk_fetched"
+        )
+        if last_pk_fetched:
+            continuation, params = common.generate_key_predicate(
+                key_properties,
+                common.bookmark_to_query_values(
+                    catalog_entry, last_pk_fetched
+                ),
+                ">",
+                ">",
+            )
+            predicates.append(continuation)
+
+        chunk_sql = (
+            select_sql + " WHERE " + " AND ".join(predicates) + order_by
+        )
+        if chunk_size:
+            chunk_sql += " FETCH FIRST {} ROWS ONLY".format(chunk_size)
+
+        rows_saved = common.sync_query(
+            open_conn,
+            catalog_entry,
+            state,
+            chunk_sql,
+            columns,
+            stream_version,
+            table_stream,
+            params,
+            config,
+        )
+
+        if not chunk_size or rows_saved < chunk_size:
+            break
+
+    state = singer.clear_bookmark(state, tap_stream_id, "last_pk_fetched")
+
+
+def sync_keyset_chunks(
+    open_conn,
+    config,
+    catalog_entry,
+    state,
+    columns,
+    stream_version,
+    table_stream,
+    keyset_columns,
+):
+    """Syncs the rows after the bookmark in bounded chunks.
+
+    Rows are read in (replication key, primary key) order, up to
+    incremental_chunk_size rows per query, and every chunk ends with a
+    checkpoint. Once both replication_key_value and last_pk_fetched are
+    bookmarked, the next chunk starts strictly after that row, so rows
+    sharing the bookmarked replication key value are neither skipped nor
+    emitted twice. A bookmark without last_pk_fetched, e.g. from an older
+    version of the tap, is resumed inclusively as before. Without a
+    replication_key_value bookmark, the rows whose replication key is NULL
+    are synced first.
+    """
+    tap_stream_id = catalog_entry.tap_stream_id
+    replication_key = keyset_columns[0]
+    chunk_size = int(
+        config.get("incremental_chunk_size", DEFAULT_CHUNK_SIZE) or 0
+    )
+
+    key_properties = common.get_key_properties(catalog_entry)
+    if (
+        replication_key not in key_properties
+        and singer.get_bookmark(state, tap_stream_id, "replication_key_value")
+        is None
+    ):
+        sync_null_replication_keys(
+            open_conn,
+            config,
+            catalog_entry,
+            state,
+            columns,
+            stream_version,
+            table_stream,
+            replication_key,
+            key_properties,
+        )
+
+    select_sql = common.generate_select_sql(catalog_entry, columns)
+    not_null = "{} IS NOT NULL".format(common.escape(replication_key))
+    order_by = common.generate_order_by_clause(keyset_columns)
+
+    while True:
+        predicates = [not_null]
+        params = []
+
+        replication_key_value = singer.get_bookmark(
+            state, tap_stream_id, "replication_key_value"
+        )
+        last_pk_fetched = singer.get_bookmark(
+            state, tap_stream_id, "last_pk_fetched"
+        )
+
+        if replication_key_value is not None and last_pk_fetched:
+            bookmark_values = dict(last_pk_fetched)
+            bookmark_values[replication_key] = replication_key_value
+            continuation, params = common.generate_key_predicate(
+                keyset_columns,
+                common.bookmark_to_query_values(
+                    catalog_entry, bookmark_values
+                ),
+                ">",
+                ">",
+            )
+            predicates.append(continuation)
+        elif replication_key_value is not None:
+            predicates.append("{} >= ?".format(common.escape(replication_key)))
+            params.append(
+                common.bookmark_to_query_values(
+                    catalog_entry, {replication_key: replication_key_value}
+                )[replication_key]
+            )
+
+        chunk_sql = (
+            select_sql + " WHERE " + " AND ".join(predicates) + order_by
+        )
+        if chunk_size:
+            chunk_sql += " FETCH FIRST {} ROWS ONLY".format(chunk_size)
+
+        rows_saved = common.sync_query(
+            open_conn,
+            catalog_entry,
+            state,
+            chunk_sql,
+            columns,
+            stream_version,
+            table_stream,
+            params,
+            config,
+        )
+
+        if not chunk_size or rows_saved < chunk_size:
+            break
 
 
 def sync_table(mssql_conn, config, catalog_entry, state, columns):
@@ -21,7 +215,7 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns):
         BOOKMARK_KEYS, catalog_entry.tap_stream_id, state
     )
 
-    catalog_metadata = metadata.to_map(catalog_entry.metadata)
+    catalog_metadata = common.get_metadata_map(catalog_entry)
     stream_metadata = catalog_metadata.get((), {})
 
     replication_key_metadata = stream_metadata.get("replication-key")
@@ -45,6 +239,9 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns):
         state = singer.clear_bookmark(
             state, catalog_entry.tap_stream_id, "replication_key_value"
         )
+        state = singer.clear_bookmark(
+            state, catalog_entry.tap_stream_id, "last_pk_fetched"
+        )
 
     stream_version = common.get_stream_version(
         catalog_entry.tap_stream_id, state
@@ -59,11 +256,39 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns):
         stream=table_stream, version=stream_version
     )
 
-    singer.write_message(activate_version_message)
+    messages.write_message(activate_version_message)
     LOGGER.info("Beginning SQL")
+    key_properties = common.get_key_properties(catalog_entry)
+    keyset_columns = None
+    if replication_key_metadata is not None and key_properties:
+        keyset_columns = get_keyset_columns(
+            replication_key_metadata, key_properties
+        )
+
     with mssql_conn.connect() as open_conn:
+        if keyset_columns and common.supports_keyset_pagination(
+            catalog_entry, keyset_columns, columns
+        ):
+            sync_keyset_chunks(
+                open_conn,
+                config,
+                catalog_entry,
+                state,
+                columns,
+                stream_version,
+                table_stream,
+                keyset_columns,
+            )
+            return
+
+        # Rows are ordered by the replication key alone, so no
+        # last_pk_fetched bookmark can say where to resume among them
+        state = singer.clear_bookmark(
+            state, catalog_entry.tap_stream_id, "last_pk_fetched"
+        )
+
         select_sql = common.generate_select_sql(catalog_entry, columns)
-        params = {}
+        params = []
 
         if replication_key_value is not None:
             if (
@@ -78,7 +303,7 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns):
                 replication_key_metadata, replication_key_metadata
             )
 
-            params["replication_key_value"] = replication_key_value
+            params.append(replication_key_value)
         elif replication_key_metadata is not None:
             select_sql += ' ORDER BY "{}" ASC'.format(replication_key_metadata)
 
@@ -91,4 +316,6 @@ def sync_table(mssql_conn, config, catalog_entry, state, columns):
             stream_version,
             table_stream,
             params,
+            config,
+            track_last_pk=False,
         )
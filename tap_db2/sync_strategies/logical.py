@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 # pylint: disable=duplicate-code
-import copy
 import pendulum
 import singer
 from singer import metadata, metrics, utils
 from jinja2 import Template
+import threading
 import time
 
 from tap_db2.connection import (
@@ -13,10 +13,14 @@ from tap_db2.connection import (
     modify_ouput_converter,
     revert_ouput_converter,
 )
+import tap_db2.messages as messages
 import tap_db2.sync_strategies.common as common
 
 LOGGER = singer.get_logger()
 
+# Age after which the cached change tracking settings are read again
+DEFAULT_CHANGE_TRACKING_CACHE_SECONDS = 300
+
 BOOKMARK_KEYS = {
     "current_log_version",
     "last_pk_fetched",
@@ -24,6 +28,64 @@ BOOKMARK_KEYS = {
 }
 
 
+class ChangeTrackingSettings:
+    """
+    The databases and tables with change tracking enabled, with the object_id
+    and CHANGE_TRACKING_MIN_VALID_VERSION of every table.
+
+    They are read with two queries and shared by every log-based stream of
+    the run, instead of being queried again for each stream. The settings are
+    read again once they are older than max_age seconds, so a min valid
+    version that advances during a long run is noticed.
+    """
+
+    DATABASES_SQL = (
+        "SELECT DB_NAME(database_id) AS db_name FROM sys.change_tracking_databases"
+    )
+
+    TABLES_SQL = """
+        SELECT OBJECT_SCHEMA_NAME(object_id) AS schema_name,
+        OBJECT_NAME(object_id) AS table_name,
+        object_id,
+        CHANGE_TRACKING_MIN_VALID_VERSION(object_id) AS min_valid_version
+        FROM sys.change_tracking_tables
+        """
+
+    def __init__(self):
+        self.databases = set()
+        self.tables = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get(self, get_connection, max_age):
+        """
+        Returns the settings, reading them on get_connection() first if they
+        were never read or are older than max_age seconds.
+        """
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at > max_age:
+                self.load(get_connection())
+            return self
+
+    def load(self, open_conn):
+        LOGGER.info("Reading the change tracking settings of the database")
+
+        self.databases = {
+            row["db_name"] for row in open_conn.execute(self.DATABASES_SQL).fetchall()
+        }
+        self.tables = {
+            (row["schema_name"], row["table_name"]): {
+                "object_id": row["object_id"],
+                "min_valid_version": row["min_valid_version"],
+            }
+            for row in open_conn.execute(self.TABLES_SQL).fetchall()
+        }
+        self.loaded_at = time.monotonic()
+
+
+CHANGE_TRACKING_SETTINGS = ChangeTrackingSettings()
+
+
 class log_based_sync:
     """
     Methods to validate the log-based sync of a table from mssql
@@ -39,6 +101,25 @@ class log_based_sync:
         self.schema_name = common.get_database_name(self.catalog_entry)
         self.table_name = catalog_entry.table
         self.mssql_conn = mssql_conn
+        self.metadata_conn = None
+
+    def _get_metadata_connection(self):
+        """
+        Returns the pooled connection shared by the small metadata queries
+        of this stream, checking it out on first use.
+        """
+        if self.metadata_conn is None:
+            self.metadata_conn = self.mssql_conn.connect()
+
+        return self.metadata_conn
+
+    def close(self):
+        """
+        Returns the metadata connection to the pool.
+        """
+        if self.metadata_conn is not None:
+            self.metadata_conn.close()
+            self.metadata_conn = None
 
     def assert_log_based_is_enabled(self):
         database_is_change_tracking_enabled = self._get_change_tracking_database()
@@ -47,101 +128,75 @@ class log_based_sync:
 
         if (
             database_is_change_tracking_enabled
-            & table_is_change_tracking_enabled
-            & min_valid_version
-            is not None
+            and table_is_change_tracking_enabled
+            and min_valid_version is not None
         ):
             self.logger.info("Asserted stream is log-based enabled!")
             return True
         else:
             return False  # use this to break silently maybe if a table is not set properly and move to the next item?
 
-    def _get_change_tracking_database(
-        self,
-    ):  # do this the first time only as required? future change for now
-        self.logger.info("Validate the database for change tracking")
-
-        sql_query = (
-            "SELECT DB_NAME(database_id) AS db_name FROM sys.change_tracking_databases"
+    def _get_change_tracking_settings(self):
+        """
+        Returns the change tracking settings of the database, shared by all
+        log-based streams of the run.
+        """
+        return CHANGE_TRACKING_SETTINGS.get(
+            self._get_metadata_connection,
+            float(
+                self.config.get(
+                    "change_tracking_cache_seconds",
+                    DEFAULT_CHANGE_TRACKING_CACHE_SECONDS,
+                )
+            ),
         )
 
-        database_is_change_tracking_enabled = False
-
-        with self.mssql_conn.connect() as open_conn:
-            results = open_conn.execute(sql_query)
-            row = results.fetchone()
-
-            if row["db_name"] == self.database_name:
-                database_is_change_tracking_enabled = True
-            else:
-                raise Exception(
-                    "Cannot sync stream using log-based replication. Change tracking is not enabled for database: {}"
-                ).format(self.database_name)
+    def _get_change_tracking_database(self):
+        self.logger.info("Validate the database for change tracking")
 
-        return database_is_change_tracking_enabled
+        if self.database_name not in self._get_change_tracking_settings().databases:
+            raise Exception(
+                "Cannot sync stream using log-based replication. Change tracking is not enabled for database: {}".format(
+                    self.database_name
+                )
+            )
 
-    def _get_change_tracking_tables(self):  # do this the first time only as required?
+        return True
 
+    def _get_change_tracking_tables(self):
         self.logger.info("Validating the schemas and tables for change tracking")
 
         schema_table = (self.schema_name, self.table_name)
 
-        sql_query = """
-            SELECT OBJECT_SCHEMA_NAME(object_id) AS schema_name,
-            OBJECT_NAME(object_id) AS table_name
-            FROM sys.change_tracking_tables
-            """
-
-        table_is_change_tracking_enabled = False
-        with self.mssql_conn.connect() as open_conn:
-            change_tracking_tables = open_conn.execute(sql_query)
-
-            enabled_change_tracking_tables = change_tracking_tables.fetchall()
-            if schema_table in enabled_change_tracking_tables:
-                table_is_change_tracking_enabled = True
-            else:
-                raise Exception(
-                    f"Cannot sync stream using log-based replication. Change tracking is not enabled for table: {self.table_name}"
-                )
-
-        return table_is_change_tracking_enabled  # this should be the table name?
+        if schema_table not in self._get_change_tracking_settings().tables:
+            raise Exception(
+                f"Cannot sync stream using log-based replication. Change tracking is not enabled for table: {self.table_name}"
+            )
 
-    def _get_min_valid_version(self):  # should be per table I think?
+        return True
 
+    def _get_min_valid_version(self):
         self.logger.info("Validating the min_valid_version")
 
-        sql_query = "SELECT CHANGE_TRACKING_MIN_VALID_VERSION({}) as min_valid_version"
-        object_id = self._get_object_version_by_table_name()
-
-        with self.mssql_conn.connect() as open_conn:
-            results = open_conn.execute(sql_query.format(object_id))
-            row = results.fetchone()
-
-            min_valid_version = row["min_valid_version"]
-
-        return min_valid_version  # return a valid version
+        self._get_object_version_by_table_name()
+        schema_table = (self.schema_name, self.table_name)
 
-    def _get_object_version_by_table_name(self):  # should be per table I think?
+        return self._get_change_tracking_settings().tables[schema_table][
+            "min_valid_version"
+        ]
 
+    def _get_object_version_by_table_name(self):
         self.logger.info("Getting object_id by name")
 
-        schema_table = self.schema_name + "." + self.table_name
-        # config.database_name
-        # sel
-        sql_query = "SELECT OBJECT_ID('{}') AS object_id"
-        #    (-> (partial format "{}.{}.{}")
-        with self.mssql_conn.connect() as open_conn:
-            results = open_conn.execute(sql_query.format(schema_table))
-            row = results.fetchone()
-
-            object_id = row["object_id"]
+        schema_table = (self.schema_name, self.table_name)
+        table = self._get_change_tracking_settings().tables.get(schema_table)
 
-        if object_id is None:
-            raise Exception("The min valid version for the table was null").format(
-                self.schema_table
+        if table is None or table["object_id"] is None:
+            raise Exception(
+                "Cannot find the object_id of table {}.{}".format(*schema_table)
             )
 
-        return object_id
+        return table["object_id"]
 
     def log_based_init_state(self):
         # this appears to look for an existing state and gets the current log version if necessary
@@ -224,84 +279,181 @@ class log_based_sync:
                 f"Expected at least 1 key property column in the config, got {key_properties}."
             )
 
-        ct_sql_query = self._build_ct_sql_query(key_properties)
-        self.logger.info("Executing log-based query: {}".format(ct_sql_query))
         time_extracted = utils.now()
         stream_version = common.get_stream_version(
             self.catalog_entry.tap_stream_id, self.state
         )
+        deleted_columns = list(key_properties) + ["_sdc_deleted_at"]
+        changed_columns = list(self.columns) + ["_sdc_deleted_at"]
+        convert_deleted_row = common.build_row_converter(
+            self.catalog_entry, deleted_columns
+        )
+        convert_changed_row = common.build_row_converter(
+            self.catalog_entry, changed_columns
+        )
+        table_stream = self.catalog_entry.stream.replace("-", "_")
+        record_writer = common.build_record_writer(
+            self.catalog_entry,
+            changed_columns,
+            table_stream,
+            stream_version,
+            time_extracted,
+        )
+
+        # Positions of the columns in the rows of the change query, which
+        # selects the version, operation and commit time first
+        positions = {
+            column: idx
+            for idx, column in enumerate(
+                list(key_properties) + self._get_non_key_properties(key_properties),
+                start=3,
+            )
+        }
+        deleted_indexes = [positions[column] for column in key_properties]
+        changed_indexes = [positions[column] for column in self.columns]
+
+        def write_change(row):
+            if row[1] == "D":
+                commit_time = row[2]
+                if commit_time is None:
+                    self.logger.warn(
+                        "Found deleted record with no timestamp, falling back to current time."
+                    )
+                    commit_time = str(time_extracted)
+
+                record = convert_deleted_row(
+                    [row[idx] for idx in deleted_indexes] + [commit_time]
+                )
+            else:
+                record = convert_changed_row(
+                    [row[idx] for idx in changed_indexes] + [None]
+                )
+
+            return record_writer.write(record)
+
+        version_window = int(self.config.get("log_based_version_window") or 0)
+
         with self.mssql_conn.connect() as open_conn:
 
             if self.catalog_entry.tap_stream_id == "dbo-InputMetadata":
                 prev_converter = modify_ouput_converter(open_conn)
 
-            results = open_conn.execute(ct_sql_query)
-
-            row = results.fetchone()
-            rows_saved = 0
-
             with metrics.record_counter(None) as counter:
                 counter.tags["database"] = self.database_name
                 counter.tags["table"] = self.table_name
 
-                while row:
+                last_version = self._sync_change_windows(
+                    open_conn, key_properties, version_window, write_change, counter
+                )
+                if last_version is not None:
+                    # Every change up to and including last_version was emitted
+                    self._write_log_version(last_version + 1)
+                else:
+                    messages.write_state(self.state, self.catalog_entry.tap_stream_id)
+
+            if self.catalog_entry.tap_stream_id == "dbo-InputMetadata":
+                revert_ouput_converter(open_conn, prev_converter)
+
+    def _sync_change_windows(
+        self, open_conn, key_properties, version_window, write_change, counter
+    ):
+        """
+        Emits the changes from current_log_version on and returns the last
+        version they cover: that of the last change or, with version_window,
+        the end of the last range. Returns None if there was nothing to read.
+
+        With version_window, CHANGE_TRACKING_CURRENT_VERSION() is read once and
+        the versions from current_log_version up to it are read in ranges of
+        version_window versions. Each range is a change query filtered on
+        sys_change_version between its bounds, and is checkpointed once it is
+        complete. Without version_window a single change query is run.
+        """
+        current_version = None
+        if version_window:
+            current_version = self._get_current_log_version()
+
+        if current_version is None:
+            ct_sql_query = self._build_ct_sql_query(key_properties)
+            return self._sync_changes(open_conn, ct_sql_query, write_change, counter)
+
+        upper_version = None
+        while self.current_log_version <= current_version:
+            lower_version = self.current_log_version
+            upper_version = min(lower_version + version_window - 1, current_version)
+
+            ct_sql_query = self._build_ct_sql_query(
+                key_properties, lower_version, upper_version
+            )
+            self._sync_changes(open_conn, ct_sql_query, write_change, counter)
+
+            # Every change up to and including upper_version was emitted
+            self._write_log_version(upper_version + 1)
+
+        return upper_version
+
+    def _sync_changes(self, open_conn, ct_sql_query, write_change, counter):
+        """
+        Emits the changes returned by ct_sql_query, in batches, and returns
+        the version of the last one, or None if there were none.
+        """
+        self.logger.info("Executing log-based query: {}".format(ct_sql_query))
+
+        results = common.execute_streaming_query(
+            open_conn, ct_sql_query, [], self.config
+        )
+        batches = common.read_ahead(
+            common.fetch_batches(results, common.get_fetch_batch_size(self.config)),
+            common.get_fetch_queue_depth(self.config),
+        )
+        checkpoint_policy = common.get_checkpoint_policy(self.config)
+        progress = common.get_progress(self.catalog_entry)
+        checkpoint_due = False
+        last_version = None
+
+        try:
+            for rows in batches:
+                for row in rows:
+                    version = row[0]
+
+                    # Checkpoints only fall between versions, so the changes
+                    # of a transaction are never split across a resume point
+                    if checkpoint_due and version != last_version:
+                        self._write_log_version(version)
+                        checkpoint_policy.reset()
+                        checkpoint_due = False
+
+                    last_version = version
                     counter.increment()
-                    desired_columns = []
-                    ordered_row = []
-
-                    rows_saved += 1
-
-                    if row["sys_change_operation"] == "D":
-                        for index, column in enumerate(key_properties):
-                            desired_columns.append(column)
-                            ordered_row.append(row[column])
-
-                        desired_columns.append("_sdc_deleted_at")
-                        if row["commit_time"] is None:
-                            self.logger.warn(
-                                "Found deleted record with no timestamp, falling back to current time."
-                            )
-                            ordered_row.append(str(time_extracted))
-                        else:
-                            ordered_row.append(row["commit_time"])
-
-                    else:
-
-                        for index, column in enumerate(self.columns):
-                            desired_columns.append(column)
-                            ordered_row.append(row[column])
-
-                        desired_columns.append("_sdc_deleted_at")
-                        ordered_row.append(None)
-
-                    table_stream = self.catalog_entry.stream.replace("-", "_")
-                    record_message = common.row_to_singer_record(
-                        self.catalog_entry,
-                        stream_version,
-                        table_stream,
-                        ordered_row,
-                        desired_columns,
-                        time_extracted,
-                    )
-                    singer.write_message(record_message)
 
-                    self.state = singer.write_bookmark(
-                        self.state,
-                        self.catalog_entry.tap_stream_id,
-                        "current_log_version",
-                        row["sys_change_version"],
-                    )
-                    self.current_log_version = row["sys_change_version"]
-                    # do more
-                    row = results.fetchone()
+                    if checkpoint_policy.record_emitted(write_change(row)):
+                        checkpoint_due = True
 
-            singer.write_message(singer.StateMessage(value=copy.deepcopy(self.state)))
+                progress.add(len(rows))
+        finally:
+            batches.close()
 
-            if self.catalog_entry.tap_stream_id == "dbo-InputMetadata":
-                revert_ouput_converter(open_conn, prev_converter)
+        return last_version
+
+    def _write_log_version(self, next_version):
+        """
+        Checkpoints the stream once every change before next_version has been
+        emitted. The change query resumes from current_log_version
+        inclusively, so next_version is the first version it returns.
+        """
+        self.current_log_version = next_version
+        self.state = singer.write_bookmark(
+            self.state,
+            self.catalog_entry.tap_stream_id,
+            "current_log_version",
+            next_version,
+        )
+        messages.write_state(self.state, self.catalog_entry.tap_stream_id)
 
-    def _build_ct_sql_query(self, key_properties):
-        """Using Selected columns, return an SQL query to select updated records from Change Tracking"""
+    def _build_ct_sql_query(
+        self, key_properties, lower_version=None, upper_version=None
+    ):
+        """Using Selected columns, return an SQL query to select updated records from Change Tracking.
+        With lower_version and upper_version, only the changes between them are selected."""
         # Order column list in alphabetical order starting with key_properties then other columns
         selected_columns = self._get_non_key_properties(key_properties)
         self.logger.debug(
@@ -337,6 +489,9 @@ class log_based_sync:
                 LEFT JOIN sys.dm_tran_commit_table tc ON (
                     c.sys_change_version = tc.commit_ts
                 )
+            {% if upper_version is not none %}
+            WHERE c.sys_change_version BETWEEN {{ lower_version }} AND {{ upper_version }}
+            {% endif %}
             ORDER BY c.sys_change_version
             """
         )
@@ -348,6 +503,8 @@ class log_based_sync:
                 "schema_name": self.schema_name,
                 "table_name": self.table_name,
                 "current_log_version": self.current_log_version - 1,
+                "lower_version": lower_version,
+                "upper_version": upper_version,
             }
         )
 
@@ -356,10 +513,10 @@ class log_based_sync:
         This method takes a query and column name parameter
         and fetches then returns the single result as required.
         """
-        with self.mssql_conn.connect() as open_conn:
-            results = open_conn.execute(sql_query)
-            row = results.fetchone()
+        open_conn = self._get_metadata_connection()
+        results = open_conn.execute(sql_query)
+        row = results.fetchone()
 
-            single_result = row[column]
+        single_result = row[column]
 
         return single_result
@@ -0,0 +1,124 @@
+import re
+import sqlite3
+import threading
+import types
+
+from singer.catalog import CatalogEntry
+from singer.schema import Schema
+
+
+def make_catalog_entry(
+    column_types,
+    stream_metadata=None,
+    tap_stream_id="SCHEMA-TABLE",
+    stream="TABLE",
+    table="TABLE",
+    properties=None,
+):
+    """Builds a CatalogEntry whose columns have the given sql-datatypes."""
+    md = [{"breadcrumb": (), "metadata": stream_metadata or {}}]
+    for column, sql_datatype in column_types.items():
+        md.append(
+            {
+                "breadcrumb": ("properties", column),
+                "metadata": {"sql-datatype": sql_datatype},
+            }
+        )
+
+    return CatalogEntry(
+        tap_stream_id=tap_stream_id,
+        stream=stream,
+        table=table,
+        metadata=md,
+        schema=Schema(type="object", properties=properties or {}),
+    )
+
+
+class FakeResults:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.cursor = types.SimpleNamespace(arraysize=1)
+        self.closed = False
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """Stands in for an engine and its connections; connect() returns the
+    fake itself. Every executed query is recorded with its parameters and
+    answered by query_rows, which subclasses override."""
+
+    def __init__(self, rows=()):
+        self.rows = rows
+        self.queries = []
+        self.params = []
+        self.options = {}
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def close(self):
+        pass
+
+    def execution_options(self, **options):
+        self.options.update(options)
+        return self
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        self.params.append(tuple(params))
+        return FakeResults(self.query_rows(sql, tuple(params)))
+
+    def query_rows(self, sql, params):
+        return self.rows
+
+
+class SqliteConnection(FakeConnection):
+    """Answers queries from an in-memory SQLite table "SCHEMA"."TABLE".
+
+    DB2's FETCH FIRST n ROWS ONLY is rewritten to SQLite's LIMIT n, so the
+    generated chunk queries run as they would on the server.
+    """
+
+    def __init__(self, columns, rows):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.execute("ATTACH ':memory:' AS \"SCHEMA\"")
+        self.db.execute(
+            'CREATE TABLE "SCHEMA"."TABLE" ({})'.format(
+                ", ".join('"{}"'.format(column) for column in columns)
+            )
+        )
+        self.db.executemany(
+            'INSERT INTO "SCHEMA"."TABLE" VALUES ({})'.format(
+                ", ".join("?" for _ in columns)
+            ),
+            rows,
+        )
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return super().execute(sql, params)
+
+    def query_rows(self, sql, params):
+        sql = re.sub(r"FETCH FIRST (\d+) ROWS ONLY", r"LIMIT \1", sql)
+        return self.db.execute(sql, params).fetchall()
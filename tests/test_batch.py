@@ -0,0 +1,190 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from urllib.parse import urlparse
+
+import tap_db2.batch as batch
+import tap_db2.messages as messages
+import tap_db2.sync_strategies.common as common
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+try:
+    from tests.helpers import make_catalog_entry
+except ImportError:
+    from helpers import make_catalog_entry
+
+
+class TestBatchWriter(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        buffer_size, messages.SINK.buffer_size = messages.SINK.buffer_size, 0
+        self.addCleanup(setattr, messages.SINK, "buffer_size", buffer_size)
+        self.addCleanup(setattr, sys, "stdout", self.stdout)
+
+        self.batch_config = {
+            "encoding": {"format": "jsonl", "compression": "gzip"},
+            "storage": {"root": "file://" + self.root, "prefix": "test-"},
+            "batch_size": 2,
+        }
+
+    def written_messages(self):
+        return [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()
+        ]
+
+    def read_batch_file(self, url):
+        with gzip.open(urlparse(url).path, "rt") as batch_file:
+            return [json.loads(line) for line in batch_file]
+
+    def test_rolls_files_at_batch_size(self):
+        writer = batch.BatchWriter("TABLE", self.batch_config)
+        for i in range(3):
+            writer.write({"id": i})
+            if writer.is_full():
+                writer.finish_file()
+        writer.finish_file()
+        writer.finish_file()
+
+        batches = self.written_messages()
+        self.assertEqual([m["type"] for m in batches], ["BATCH", "BATCH"])
+        self.assertEqual(
+            batches[0]["encoding"], {"format": "jsonl", "compression": "gzip"}
+        )
+        self.assertEqual(
+            [self.read_batch_file(m["manifest"][0]) for m in batches],
+            [[{"id": 0}, {"id": 1}], [{"id": 2}]],
+        )
+        self.assertTrue(
+            os.path.basename(batches[0]["manifest"][0]).startswith(
+                "test-TABLE-"
+            )
+        )
+
+    def test_abort_removes_unfinished_file(self):
+        writer = batch.BatchWriter("TABLE", self.batch_config)
+        writer.write({"id": 1})
+        writer.abort()
+
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertEqual(self.written_messages(), [])
+
+    def parquet_writer(self, **batch_config):
+        self.batch_config.update(
+            encoding={"format": "parquet", "compression": "none"},
+            **batch_config,
+        )
+        return batch.BatchWriter("TABLE", self.batch_config)
+
+    def read_parquet_files(self):
+        return [
+            pq.ParquetFile(urlparse(m["manifest"][0]).path)
+            for m in self.written_messages()
+        ]
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_parquet_is_written_in_row_groups(self):
+        writer = self.parquet_writer(batch_size=10, row_group_size=2)
+        for i in range(5):
+            writer.write({"id": i, "name": str(i)})
+        self.assertEqual(len(writer.records), 1)
+        writer.finish_file()
+
+        (parquet_file,) = self.read_parquet_files()
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertEqual(
+            parquet_file.read().column("id").to_pylist(), [0, 1, 2, 3, 4]
+        )
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_parquet_rolls_files_at_max_file_bytes(self):
+        writer = self.parquet_writer(
+            batch_size=100, row_group_size=2, max_file_bytes=1
+        )
+        writer.write({"id": 1})
+        self.assertFalse(writer.is_full())
+        writer.write({"id": 2})
+        self.assertTrue(writer.is_full())
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_parquet_schema_change_starts_a_new_file(self):
+        writer = self.parquet_writer(batch_size=10, row_group_size=2)
+        for name in (None, None, "a", "b"):
+            writer.write({"id": 1, "name": name})
+        writer.finish_file()
+
+        files = self.read_parquet_files()
+        self.assertEqual(
+            [f.read().column("name").to_pylist() for f in files],
+            [[None, None], ["a", "b"]],
+        )
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_abort_removes_unfinished_parquet_file(self):
+        writer = self.parquet_writer(batch_size=10, row_group_size=1)
+        writer.write({"id": 1})
+        writer.abort()
+
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertEqual(self.written_messages(), [])
+
+    def test_state_follows_closed_files(self):
+        catalog_entry = make_catalog_entry(
+            {"id": "integer", "name": "varchar"},
+            {
+                "database-name": "SCHEMA",
+                "replication-method": "INCREMENTAL",
+                "replication-key": "id",
+                "table-key-properties": ["id"],
+            },
+        )
+        state = {"bookmarks": {"SCHEMA-TABLE": {"replication_key": "id"}}}
+
+        common.sync_batches(
+            common.read_ahead(iter([[(1, "a"), (2, "b")], [(3, "c")]]), 0),
+            catalog_entry,
+            state,
+            ["id", "name"],
+            1,
+            "TABLE",
+            None,
+            {"batch_config": self.batch_config},
+        )
+
+        written = self.written_messages()
+        self.assertEqual(
+            [m["type"] for m in written], ["BATCH", "STATE", "BATCH", "STATE"]
+        )
+        self.assertEqual(
+            written[1]["value"]["bookmarks"]["SCHEMA-TABLE"][
+                "replication_key_value"
+            ],
+            2,
+        )
+        self.assertEqual(
+            self.read_batch_file(written[2]["manifest"][0]),
+            [{"id": 3, "name": "c"}],
+        )
+
+    def test_rejects_unknown_encoding(self):
+        with self.assertRaises(Exception):
+            batch.BatchWriter(
+                "TABLE", {"encoding": {"format": "csv"}, "storage": {}}
+            )
+        with self.assertRaises(Exception):
+            batch.get_batch_root({"root": "s3://bucket/batches"})
+
+
+if __name__ == "__main__":
+    unittest.main()
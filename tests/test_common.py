@@ -0,0 +1,473 @@
+import datetime
+import decimal
+import unittest
+import uuid
+from unittest import mock
+
+from singer.schema import Schema
+
+import tap_db2.sync_strategies.columnar as columnar
+import tap_db2.sync_strategies.common as common
+
+try:
+    from tests.helpers import FakeConnection, FakeResults, make_catalog_entry
+except ImportError:
+    from helpers import FakeConnection, FakeResults, make_catalog_entry
+
+
+class TestRowConverter(unittest.TestCase):
+    def setUp(self):
+        self.column_types = {
+            "id": "integer",
+            "amount": "decimal",
+            "name": "varchar",
+            "created": "timestamp",
+            "born": "date",
+            "payload": "varbinary",
+            "flag": "boolean",
+            "bit": "char",
+            "ref": "varchar",
+            "duration": "time",
+        }
+        self.columns = list(self.column_types.keys())
+        self.catalog_entry = make_catalog_entry(self.column_types)
+
+    def test_converts_row_by_column_type(self):
+        row = (
+            1,
+            decimal.Decimal("1.50"),
+            "abc",
+            datetime.datetime(2021, 5, 4, 3, 2, 1),
+            datetime.date(2021, 5, 4),
+            b"\x01\xff",
+            0,
+            b"\x00",
+            uuid.UUID("12345678123456781234567812345678"),
+            datetime.timedelta(hours=1),
+        )
+
+        convert_row = common.build_row_converter(
+            self.catalog_entry, self.columns
+        )
+
+        self.assertEqual(
+            convert_row(row),
+            {
+                "id": 1,
+                "amount": decimal.Decimal("1.50"),
+                "name": "abc",
+                "created": "2021-05-04T03:02:01+00:00",
+                "born": "2021-05-04T00:00:00+00:00",
+                "payload": "0x01FF",
+                "flag": False,
+                "bit": False,
+                "ref": "12345678-1234-5678-1234-567812345678",
+                "duration": "1970-01-01T01:00:00+00:00",
+            },
+        )
+
+    def test_nulls_are_preserved(self):
+        convert_row = common.build_row_converter(
+            self.catalog_entry, self.columns
+        )
+
+        self.assertEqual(
+            convert_row((None,) * len(self.columns)),
+            {column: None for column in self.columns},
+        )
+
+    def test_deleted_at_is_treated_as_datetime(self):
+        convert_row = common.build_row_converter(
+            self.catalog_entry, ["id", "_sdc_deleted_at"]
+        )
+
+        self.assertEqual(
+            convert_row((1, datetime.datetime(2021, 1, 1))),
+            {"id": 1, "_sdc_deleted_at": "2021-01-01T00:00:00+00:00"},
+        )
+
+    def test_row_to_singer_record_matches_converter(self):
+        row = (2, None, "x", None, None, None, 1, b"\x01", "y", None)
+        time_extracted = datetime.datetime(
+            2021, 1, 1, tzinfo=datetime.timezone.utc
+        )
+
+        message = common.row_to_singer_record(
+            self.catalog_entry, 1, "TABLE", row, self.columns, time_extracted
+        )
+
+        self.assertEqual(
+            message.record,
+            common.build_row_converter(self.catalog_entry, self.columns)(row),
+        )
+        self.assertTrue(message.record["flag"])
+        self.assertTrue(message.record["bit"])
+
+
+@unittest.skipUnless(columnar.is_available(), "pyarrow is not installed")
+class TestColumnarConversion(unittest.TestCase):
+    def setUp(self):
+        self.column_types = {
+            "id": "integer",
+            "created": "timestamp",
+            "born": "date",
+            "payload": "varbinary",
+            "flag": "boolean",
+            "bit": "char",
+            "ref": "varchar",
+        }
+        self.columns = list(self.column_types.keys())
+        self.catalog_entry = make_catalog_entry(self.column_types)
+
+    def test_matches_row_conversion(self):
+        rows = [
+            (
+                1,
+                datetime.datetime(2021, 5, 4, 3, 2, 1),
+                datetime.date(2021, 5, 4),
+                b"\x01\xff",
+                0,
+                b"\x00",
+                "abc",
+            ),
+            (
+                2,
+                datetime.datetime(2021, 5, 4, 3, 2, 1, 123),
+                None,
+                None,
+                2,
+                b"\x01",
+                uuid.UUID("12345678123456781234567812345678"),
+            ),
+            (3, None, None, b"", None, None, None),
+        ]
+
+        convert_rows = common.build_batch_converter(
+            self.catalog_entry, self.columns, {"columnar_conversion": True}
+        )
+        convert_row = common.build_row_converter(
+            self.catalog_entry, self.columns
+        )
+
+        self.assertEqual(
+            convert_rows(rows), [convert_row(row) for row in rows]
+        )
+        self.assertEqual(
+            convert_rows(rows)[1]["created"],
+            "2021-05-04T03:02:01.000123+00:00",
+        )
+        self.assertEqual(convert_rows([]), [])
+
+    def test_unsupported_values_fall_back(self):
+        self.assertIsNone(
+            columnar.convert_column(
+                (uuid.UUID("12345678123456781234567812345678"),)
+            )
+        )
+        self.assertIsNone(
+            columnar.convert_column((datetime.timedelta(hours=1),))
+        )
+
+
+class TestMetadataMap(unittest.TestCase):
+    def test_map_is_built_once_per_entry(self):
+        catalog_entry = make_catalog_entry(
+            {"id": "integer"}, {"database-name": "SCHEMA"}
+        )
+
+        md_map = common.get_metadata_map(catalog_entry)
+
+        self.assertIs(common.get_metadata_map(catalog_entry), md_map)
+        self.assertEqual(common.get_database_name(catalog_entry), "SCHEMA")
+        self.assertIsNot(
+            common.get_metadata_map(make_catalog_entry({"id": "integer"})),
+            md_map,
+        )
+
+    def test_replaced_metadata_is_remapped(self):
+        catalog_entry = make_catalog_entry({"id": "integer"})
+        common.get_metadata_map(catalog_entry)
+
+        catalog_entry.metadata = make_catalog_entry(
+            {"id": "integer"}, {"table-key-properties": ["id"]}
+        ).metadata
+
+        self.assertEqual(common.get_key_properties(catalog_entry), ["id"])
+
+
+class TestStreamingQuery(unittest.TestCase):
+    def test_sets_streaming_execution_options(self):
+        connection = FakeConnection([(1,)])
+
+        results = common.execute_streaming_query(
+            connection,
+            "SELECT 1",
+            [5],
+            {"fetch_batch_size": 50, "cursor_array_size": 20},
+        )
+
+        self.assertEqual(
+            connection.options, {"stream_results": True, "max_row_buffer": 50}
+        )
+        self.assertEqual(connection.params, [(5,)])
+        self.assertEqual(results.cursor.arraysize, 20)
+
+    def test_array_size_defaults_to_batch_size(self):
+        results = common.execute_streaming_query(
+            FakeConnection(), "SELECT 1", [], {"fetch_batch_size": 50}
+        )
+
+        self.assertEqual(results.cursor.arraysize, 50)
+
+    def test_fetch_batches_ends_with_short_batch(self):
+        results = FakeResults([(i,) for i in range(5)])
+
+        self.assertEqual(
+            list(common.fetch_batches(results, 2)),
+            [[(0,), (1,)], [(2,), (3,)], [(4,)]],
+        )
+        self.assertTrue(results.closed)
+
+    def test_fetch_batches_stops_on_empty_fetch(self):
+        results = mock.Mock()
+        results.fetchmany.side_effect = [[(1,)], [], [(2,)]]
+
+        self.assertEqual(list(common.fetch_batches(results, 10)), [[(1,)]])
+        self.assertEqual(results.fetchmany.call_count, 2)
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_closing_early_closes_the_results(self):
+        for queue_depth in (0, 1):
+            results = FakeResults([(i,) for i in range(5)])
+            batches = common.read_ahead(
+                common.fetch_batches(results, 1), queue_depth
+            )
+
+            next(batches)
+            batches.close()
+
+            self.assertTrue(results.closed)
+
+    def test_yields_batches_in_order(self):
+        batches = [[1, 2], [3], [4, 5, 6]]
+
+        self.assertEqual(list(common.read_ahead(iter(batches), 2)), batches)
+        self.assertEqual(list(common.read_ahead(iter(batches), 0)), batches)
+
+    def test_reraises_fetch_errors(self):
+        def failing_batches():
+            yield [1]
+            raise RuntimeError("connection lost")
+
+        batches = common.read_ahead(failing_batches(), 1)
+
+        self.assertEqual(next(batches), [1])
+        with self.assertRaises(RuntimeError):
+            next(batches)
+
+    def test_close_stops_fetching(self):
+        def endless_batches():
+            while True:
+                yield [1]
+
+        batches = common.read_ahead(endless_batches(), 1)
+        next(batches)
+        batches.close()
+
+
+class TestCheckpointPolicy(unittest.TestCase):
+    def test_row_limit(self):
+        policy = common.CheckpointPolicy(max_rows=2)
+
+        self.assertFalse(policy.record_emitted(10))
+        self.assertTrue(policy.record_emitted(10))
+        policy.reset()
+        self.assertFalse(policy.record_emitted(10))
+
+    def test_byte_limit(self):
+        policy = common.CheckpointPolicy(max_rows=0, max_bytes=100)
+
+        self.assertFalse(policy.record_emitted(60))
+        self.assertTrue(policy.record_emitted(60))
+
+    def test_time_limit(self):
+        policy = common.CheckpointPolicy(max_rows=0, max_seconds=60)
+
+        self.assertFalse(policy.record_emitted(10))
+        policy.started -= 61
+        self.assertTrue(policy.record_emitted(10))
+
+    def test_from_config(self):
+        policy = common.get_checkpoint_policy(
+            {"checkpoint_rows": 0, "checkpoint_bytes": "5"}
+        )
+
+        self.assertEqual(policy.max_rows, 0)
+        self.assertEqual(policy.max_bytes, 5)
+        self.assertEqual(
+            common.get_checkpoint_policy(None).max_rows,
+            common.DEFAULT_CHECKPOINT_ROWS,
+        )
+
+
+class TestSyncProgress(unittest.TestCase):
+    def test_logs_percentage_and_eta(self):
+        progress = common.SyncProgress("TABLE", expected_rows=1000)
+        progress.started -= 10
+
+        with self.assertLogs(common.LOGGER, "INFO") as logs:
+            progress.add(250)
+            progress.log()
+
+        self.assertIn("250 of ~1000 rows of TABLE (25.0%)", logs.output[0])
+        self.assertIn("ETA 0:00:30", logs.output[0])
+
+    def test_logs_rate_without_expected_rows(self):
+        progress = common.SyncProgress("TABLE", log_seconds=0)
+        progress.add(10)
+
+        with self.assertLogs(common.LOGGER, "INFO") as logs:
+            progress.log()
+
+        self.assertIn("Synced 10 rows of TABLE", logs.output[0])
+
+
+class TestBookmarkTracker(unittest.TestCase):
+    def write_bookmarks(self, replication_method, bookmark, **kwargs):
+        catalog_entry = make_catalog_entry(
+            {"id": "integer", "updated": "timestamp"},
+            {
+                "replication-method": replication_method,
+                "table-key-properties": ["id"],
+            },
+        )
+        state = {"bookmarks": {"SCHEMA-TABLE": dict(bookmark)}}
+        tracker = common.BookmarkTracker(catalog_entry, state, **kwargs)
+
+        state = tracker.write_bookmarks(state, {"id": 7, "updated": "x"})
+        return state["bookmarks"]["SCHEMA-TABLE"]
+
+    def test_full_table_and_log_based_with_max_pk_values(self):
+        for replication_method in ("FULL_TABLE", "LOG_BASED"):
+            bookmark = self.write_bookmarks(
+                replication_method, {"max_pk_values": {"id": 10}}
+            )
+
+            self.assertEqual(bookmark["last_pk_fetched"], {"id": 7})
+
+    def test_full_table_and_log_based_without_max_pk_values(self):
+        for replication_method in ("FULL_TABLE", "LOG_BASED"):
+            bookmark = self.write_bookmarks(replication_method, {})
+
+            self.assertNotIn("last_pk_fetched", bookmark)
+
+    def test_incremental_writes_last_pk_fetched_in_key_order(self):
+        bookmark = self.write_bookmarks(
+            "INCREMENTAL", {"replication_key": "updated"}
+        )
+
+        self.assertEqual(
+            bookmark,
+            {
+                "replication_key": "updated",
+                "replication_key_value": "x",
+                "last_pk_fetched": {"id": 7},
+            },
+        )
+
+    def test_incremental_without_key_order_skips_last_pk_fetched(self):
+        bookmark = self.write_bookmarks(
+            "INCREMENTAL", {"replication_key": "updated"}, track_last_pk=False
+        )
+
+        self.assertEqual(
+            bookmark,
+            {"replication_key": "updated", "replication_key_value": "x"},
+        )
+
+    def test_nothing_is_written_without_records(self):
+        catalog_entry = make_catalog_entry(
+            {"id": "integer"},
+            {
+                "replication-method": "FULL_TABLE",
+                "table-key-properties": ["id"],
+            },
+        )
+        state = {"bookmarks": {"SCHEMA-TABLE": {"max_pk_values": {"id": 1}}}}
+
+        tracker = common.BookmarkTracker(catalog_entry, state)
+
+        self.assertEqual(
+            tracker.write_bookmarks(state, None),
+            {"bookmarks": {"SCHEMA-TABLE": {"max_pk_values": {"id": 1}}}},
+        )
+
+
+class TestKeysetPagination(unittest.TestCase):
+    def supports(self, key_type, stream_metadata=None, columns=("id",)):
+        catalog_entry = make_catalog_entry(
+            {"id": key_type, "name": "varchar"}, stream_metadata
+        )
+        return common.supports_keyset_pagination(
+            catalog_entry, ["id"], list(columns)
+        )
+
+    def test_integer_key_of_a_table(self):
+        self.assertTrue(self.supports("integer"))
+        self.assertTrue(self.supports("varchar"))
+
+    def test_views_are_not_paginated(self):
+        self.assertFalse(self.supports("integer", {"is-view": True}))
+
+    def test_keys_without_exact_bookmarks(self):
+        for key_type in ("decimal", "numeric", "double", "real", "varbinary"):
+            self.assertFalse(self.supports(key_type), key_type)
+
+    def test_key_must_be_selected(self):
+        self.assertFalse(self.supports("integer", columns=("name",)))
+
+
+class TestKeyPredicate(unittest.TestCase):
+    def test_single_key(self):
+        predicate, params = common.generate_key_predicate(
+            ["id"], {"id": 10}, ">", ">"
+        )
+
+        self.assertEqual(predicate, '(("id" > ?))')
+        self.assertEqual(params, [10])
+
+    def test_composite_key_expands_prefixes(self):
+        predicate, params = common.generate_key_predicate(
+            ["a", "b"], {"a": 1, "b": 2}, "<", "<="
+        )
+
+        self.assertEqual(predicate, '(("a" < ?) OR ("a" = ? AND "b" <= ?))')
+        self.assertEqual(params, [1, 1, 2])
+
+    def test_bookmarked_datetimes_are_parsed(self):
+        catalog_entry = make_catalog_entry({"id": "integer"})
+        catalog_entry.schema = Schema(
+            type="object",
+            properties={
+                "id": Schema(type=["integer"]),
+                "created": Schema(type=["string"], format="date-time"),
+            },
+        )
+
+        values = common.bookmark_to_query_values(
+            catalog_entry,
+            {"id": 1, "created": "2021-05-04T03:02:01+00:00"},
+        )
+
+        self.assertEqual(values["id"], 1)
+        self.assertEqual(
+            values["created"],
+            datetime.datetime(
+                2021, 5, 4, 3, 2, 1, tzinfo=datetime.timezone.utc
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+
+import tap_db2.connection as connection
+
+CONFIG = {
+    "username": "db2inst1",
+    "password": "password",
+    "hostname": "localhost",
+    "port": 50000,
+    "database": "TESTDB",
+}
+
+
+class FakePool:
+    def __init__(self, size):
+        self._size = size
+
+    def size(self):
+        return self._size
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    def __init__(self, pool_size):
+        self.pool = FakePool(pool_size)
+        self.connections = []
+        self.disposed = False
+
+    def connect(self):
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+    def dispose(self):
+        self.disposed = True
+
+
+def create_fake_engine(connection_string, pool_size, pool_pre_ping):
+    return FakeEngine(pool_size)
+
+
+class TestPoolSize(unittest.TestCase):
+    def test_defaults_to_a_connection_per_worker(self):
+        self.assertEqual(connection.get_pool_size({}), 5)
+        self.assertEqual(
+            connection.get_pool_size(
+                {"max_parallel_streams": 4, "full_table_partitions": 3}
+            ),
+            12,
+        )
+
+    def test_configured_pool_size(self):
+        self.assertEqual(
+            connection.get_pool_size(
+                {"pool_size": "2", "max_parallel_streams": 4}
+            ),
+            2,
+        )
+
+
+class TestSharedEngine(unittest.TestCase):
+    def tearDown(self):
+        connection.ENGINES.clear()
+
+    @mock.patch.object(connection, "create_engine", create_fake_engine)
+    def test_engine_is_created_once(self):
+        engine = connection.get_azure_sql_engine(CONFIG)
+
+        self.assertIs(connection.get_azure_sql_engine(dict(CONFIG)), engine)
+        self.assertIsNot(
+            connection.get_azure_sql_engine(dict(CONFIG, pool_size=10)),
+            engine,
+        )
+
+    @mock.patch.object(connection, "create_engine", create_fake_engine)
+    def test_prewarm_returns_connections_to_the_pool(self):
+        engine = connection.get_azure_sql_engine(
+            dict(CONFIG, pool_size=3, pool_prewarm=10)
+        )
+
+        self.assertEqual(len(engine.connections), 3)
+        self.assertTrue(all(c.closed for c in engine.connections))
+
+    @mock.patch.object(connection, "create_engine", create_fake_engine)
+    def test_dispose_engines(self):
+        engine = connection.get_azure_sql_engine(CONFIG)
+
+        connection.dispose_engines()
+
+        self.assertTrue(engine.disposed)
+        self.assertEqual(connection.ENGINES, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import tempfile
+import unittest
+
+import tap_db2
+
+try:
+    import tests.helpers as helpers
+except ImportError:
+    import helpers
+
+STATISTICS = {
+    ("APP", "ORDERS"): (1000, 10, 50, 4096),
+    ("APP", "ORDER_VIEW"): (-1, -1, -1, None),
+    ("HIST", "ORDERS"): (-1, 3, -1, 8192),
+}
+
+COLUMNS = [
+    ("APP", "ORDERS", "ID", "INTEGER", 4, 0, 0, 1, 2, "T"),
+    ("APP", "ORDERS", "REGION", "CHARACTER", 2, 0, 0, 1, 1, "T"),
+    ("APP", "ORDERS", "TOTAL", "DECIMAL", 10, 0, 2, 0, None, "T"),
+    ("APP", "ORDER_VIEW", "ID", "INTEGER", 4, 0, 0, 0, None, "V"),
+    ("HIST", "ORDERS", "ID", "INTEGER", 4, 0, 0, 0, None, "T"),
+]
+
+ROWS = [column + STATISTICS[column[:2]] for column in COLUMNS]
+
+
+class FakeConnection(helpers.FakeConnection):
+    def __init__(self, alter_times=None):
+        super().__init__()
+        self.alter_times = alter_times or {}
+        self.discovered = []
+
+    def query_rows(self, sql, params):
+        tables = set(zip(params[::2], params[1::2]))
+        rows = [row for row in ROWS if not tables or row[:2] in tables]
+
+        if "ALTER_TIME" in sql:
+            return [
+                (schema, table, self.alter_times.get((schema, table), 1))
+                + STATISTICS[(schema, table)]
+                for schema, table in sorted({row[:2] for row in rows})
+            ]
+
+        self.discovered.extend(sorted({row[:2] for row in rows}))
+        return rows
+
+
+class TestDiscoverCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = tap_db2.discover_catalog(FakeConnection(), {})
+
+    def get_stream_metadata(self, tap_stream_id):
+        entry = self.catalog.get_stream(tap_stream_id)
+        return tap_db2.metadata.to_map(entry.metadata)[()]
+
+    def test_same_named_tables_in_other_schemas_stay_apart(self):
+        self.assertEqual(
+            [e.tap_stream_id for e in self.catalog.streams],
+            ["APP-ORDERS", "APP-ORDER_VIEW", "HIST-ORDERS"],
+        )
+        self.assertEqual(
+            list(self.catalog.get_stream("HIST-ORDERS").schema.properties),
+            ["ID"],
+        )
+
+    def test_key_properties_follow_key_sequence(self):
+        self.assertEqual(
+            self.get_stream_metadata("APP-ORDERS")["table-key-properties"],
+            ["REGION", "ID"],
+        )
+        self.assertEqual(
+            self.get_stream_metadata("HIST-ORDERS")["table-key-properties"],
+            [],
+        )
+
+    def test_views_and_types(self):
+        self.assertTrue(self.get_stream_metadata("APP-ORDER_VIEW")["is-view"])
+        self.assertFalse(self.get_stream_metadata("APP-ORDERS")["is-view"])
+
+        properties = self.catalog.get_stream("APP-ORDERS").schema.properties
+        self.assertEqual(properties["REGION"].type, ["null", "string"])
+        self.assertEqual(properties["REGION"].maxLength, 2)
+        self.assertEqual(properties["TOTAL"].multipleOf, 0.01)
+
+    def test_table_statistics(self):
+        orders = self.get_stream_metadata("APP-ORDERS")
+        self.assertEqual(orders["row-count"], 1000)
+        self.assertEqual(orders["estimated-size-bytes"], 50000)
+
+        history = self.get_stream_metadata("HIST-ORDERS")
+        self.assertNotIn("row-count", history)
+        self.assertEqual(history["estimated-size-bytes"], 3 * 8192)
+
+        view = self.get_stream_metadata("APP-ORDER_VIEW")
+        self.assertNotIn("row-count", view)
+        self.assertNotIn("estimated-size-bytes", view)
+
+    def test_resolved_streams_get_current_statistics(self):
+        selected = tap_db2.CatalogEntry(
+            tap_stream_id="APP-ORDERS",
+            table="ORDERS",
+            metadata=[
+                {
+                    "breadcrumb": (),
+                    "metadata": {"selected": True, "row-count": 5},
+                }
+            ],
+        )
+
+        resolved = tap_db2.resolve_catalog(self.catalog, [selected])
+        stream_metadata = resolved.streams[0].metadata[0]["metadata"]
+
+        self.assertEqual(stream_metadata["row-count"], 1000)
+        self.assertTrue(stream_metadata["selected"])
+        self.assertEqual(selected.metadata[0]["metadata"]["row-count"], 5)
+
+    def test_targeted_discovery(self):
+        connection = FakeConnection()
+        catalog = tap_db2.discover_catalog(
+            connection, {}, [("HIST", "ORDERS"), ("APP", "MISSING")]
+        )
+
+        self.assertEqual(
+            [e.tap_stream_id for e in catalog.streams], ["HIST-ORDERS"]
+        )
+        self.assertEqual(connection.discovered, [("HIST", "ORDERS")])
+
+    def test_selected_tables(self):
+        self.assertEqual(
+            tap_db2.get_selected_tables(self.catalog.streams),
+            [("APP", "ORDERS"), ("APP", "ORDER_VIEW"), ("HIST", "ORDERS")],
+        )
+
+        self.catalog.streams[0].metadata = []
+        self.assertIsNone(tap_db2.get_selected_tables(self.catalog.streams))
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.config = {
+            "discovery_cache_path": os.path.join(cache_dir, "catalog.json")
+        }
+
+    def discover(self, alter_times=None):
+        connection = FakeConnection(alter_times)
+        catalog = tap_db2.discover_catalog(connection, self.config)
+        return catalog, connection.discovered
+
+    def test_only_altered_tables_are_rediscovered(self):
+        catalog, discovered = self.discover()
+        self.assertEqual(len(discovered), 3)
+
+        cached_catalog, discovered = self.discover()
+        self.assertEqual(discovered, [])
+        self.assertEqual(cached_catalog.to_dict(), catalog.to_dict())
+
+        altered_catalog, discovered = self.discover({("HIST", "ORDERS"): 2})
+        self.assertEqual(discovered, [("HIST", "ORDERS")])
+        self.assertEqual(altered_catalog.to_dict(), catalog.to_dict())
+
+    def test_targeted_discovery_keeps_other_tables_cached(self):
+        self.discover()
+
+        connection = FakeConnection({("APP", "ORDERS"): 2})
+        tap_db2.discover_catalog(connection, self.config, [("APP", "ORDERS")])
+        self.assertEqual(connection.discovered, [("APP", "ORDERS")])
+
+        _, discovered = self.discover({("APP", "ORDERS"): 2})
+        self.assertEqual(discovered, [])
+
+    def test_unreadable_cache_is_ignored(self):
+        with open(self.config["discovery_cache_path"], "w") as cache_file:
+            cache_file.write("{")
+
+        catalog, discovered = self.discover()
+
+        self.assertEqual(len(catalog.streams), 3)
+        self.assertEqual(len(discovered), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+import io
+import json
+import sys
+import unittest
+
+import tap_db2.messages as messages
+import tap_db2.sync_strategies.full_table as full_table
+
+try:
+    import tests.helpers as helpers
+except ImportError:
+    import helpers
+
+ROWS = [(i, "name-{}".format(i)) for i in range(1, 7)]
+
+
+class TestSplitKeyRange(unittest.TestCase):
+    def test_ranges_cover_the_key_space_without_overlap(self):
+        key_ranges = full_table.split_key_range(1, 10, 3)
+
+        self.assertEqual(
+            [(r["lower"], r["upper"]) for r in key_ranges],
+            [(1, 4), (5, 7), (8, 10)],
+        )
+        self.assertFalse(any(r["complete"] for r in key_ranges))
+
+    def test_never_more_ranges_than_keys(self):
+        key_ranges = full_table.split_key_range(5, 6, 8)
+
+        self.assertEqual(
+            [(r["lower"], r["upper"]) for r in key_ranges], [(5, 5), (6, 6)]
+        )
+
+
+class TestPartitionColumn(unittest.TestCase):
+    def test_integer_leading_key_of_a_table(self):
+        catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer"}, {"table-key-properties": ["ID"]}
+        )
+
+        self.assertEqual(full_table.get_partition_column(catalog_entry), "ID")
+
+    def test_views_are_not_split(self):
+        catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer"}, {"is-view": True, "view-key-properties": ["ID"]}
+        )
+
+        self.assertIsNone(full_table.get_partition_column(catalog_entry))
+
+
+class FailingConnection(helpers.SqliteConnection):
+    def __init__(self, columns, rows, failing_lower):
+        super().__init__(columns, rows)
+        self.failing_lower = failing_lower
+
+    def query_rows(self, sql, params):
+        if params and params[0] == self.failing_lower:
+            raise RuntimeError("connection lost")
+        return super().query_rows(sql, params)
+
+
+class TestSyncPartitions(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        self.addCleanup(setattr, sys, "stdout", self.stdout)
+
+        self.catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer", "NAME": "varchar"},
+            {
+                "database-name": "SCHEMA",
+                "replication-method": "FULL_TABLE",
+                "table-key-properties": ["ID"],
+            },
+        )
+        self.connection = helpers.SqliteConnection(["ID", "NAME"], ROWS)
+        self.partitions = {
+            "column": "ID",
+            "ranges": full_table.split_key_range(1, 6, 2),
+        }
+
+    def sync(self):
+        state = {
+            "bookmarks": {"SCHEMA-TABLE": {"partitions": self.partitions}}
+        }
+        try:
+            full_table.sync_partitions(
+                self.connection,
+                {"checkpoint_rows": 1},
+                self.catalog_entry,
+                state,
+                ["ID", "NAME"],
+                1,
+                "TABLE",
+                self.partitions,
+            )
+        finally:
+            messages.flush()
+
+    def written_messages(self):
+        return [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()
+        ]
+
+    def synced_ids(self):
+        return sorted(
+            m["record"]["ID"]
+            for m in self.written_messages()
+            if m["type"] == "RECORD"
+        )
+
+    def test_every_range_is_marked_complete(self):
+        self.sync()
+
+        self.assertEqual(self.synced_ids(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(
+            [r["complete"] for r in self.partitions["ranges"]], [True, True]
+        )
+        final_state = self.written_messages()[-1]["value"]
+        self.assertEqual(
+            final_state["bookmarks"]["SCHEMA-TABLE"]["partitions"],
+            self.partitions,
+        )
+
+    def test_ranges_are_complete_only_after_their_rows(self):
+        self.sync()
+
+        emitted = set()
+        for message in self.written_messages():
+            if message["type"] == "RECORD":
+                emitted.add(message["record"]["ID"])
+                continue
+
+            bookmark = message["value"]["bookmarks"]["SCHEMA-TABLE"]
+            for key_range in bookmark["partitions"]["ranges"]:
+                if key_range["complete"]:
+                    self.assertLessEqual(
+                        set(range(key_range["lower"], key_range["upper"] + 1)),
+                        emitted,
+                    )
+
+    def test_resume_skips_complete_ranges(self):
+        self.partitions["ranges"][0]["complete"] = True
+
+        self.sync()
+
+        self.assertEqual(self.synced_ids(), [4, 5, 6])
+        self.assertEqual(self.connection.params, [(4, 6)])
+        self.assertTrue(self.partitions["ranges"][1]["complete"])
+
+    def test_failed_range_stays_incomplete(self):
+        self.partitions["ranges"][0]["complete"] = True
+        self.connection = FailingConnection(["ID", "NAME"], ROWS, 4)
+
+        with self.assertRaises(RuntimeError):
+            self.sync()
+
+        self.assertEqual(
+            [r["complete"] for r in self.partitions["ranges"]], [True, False]
+        )
+        self.assertEqual(self.synced_ids(), [])
+
+
+class TestKeysetChunks(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        self.addCleanup(setattr, sys, "stdout", self.stdout)
+
+    def sync(self, columns, rows, key_properties, bookmark=None):
+        self.catalog_entry = helpers.make_catalog_entry(
+            {column: "integer" for column in columns},
+            {
+                "database-name": "SCHEMA",
+                "replication-method": "FULL_TABLE",
+                "table-key-properties": key_properties,
+            },
+        )
+        self.connection = helpers.SqliteConnection(columns, rows)
+        state = {"bookmarks": {"SCHEMA-TABLE": dict(bookmark or {})}}
+
+        full_table.sync_keyset_chunks(
+            self.connection,
+            {"full_table_chunk_size": 2, "checkpoint_rows": 0},
+            self.catalog_entry,
+            state,
+            columns,
+            1,
+            "TABLE",
+            key_properties,
+        )
+        messages.flush()
+
+        written = [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()
+        ]
+        records = [
+            tuple(m["record"][c] for c in columns)
+            for m in written
+            if m["type"] == "RECORD"
+        ]
+        checkpoints = [
+            m["value"]["bookmarks"]["SCHEMA-TABLE"]["last_pk_fetched"]
+            for m in written
+            if m["type"] == "STATE"
+        ]
+        return records, checkpoints
+
+    def test_last_chunk_smaller_than_chunk_size(self):
+        rows = [(i, "name-{}".format(i)) for i in range(1, 6)]
+
+        records, checkpoints = self.sync(["ID", "NAME"], rows, ["ID"])
+
+        self.assertEqual(records, rows)
+        self.assertEqual(checkpoints, [{"ID": 2}, {"ID": 4}, {"ID": 5}])
+        self.assertEqual(
+            len([sql for sql in self.connection.queries if "DESC" not in sql]),
+            3,
+        )
+
+    def test_resumes_after_last_pk_fetched(self):
+        rows = [(i, "name-{}".format(i)) for i in range(1, 8)]
+
+        records, checkpoints = self.sync(
+            ["ID", "NAME"],
+            rows,
+            ["ID"],
+            {"max_pk_values": {"ID": 6}, "last_pk_fetched": {"ID": 3}},
+        )
+
+        # Rows after max_pk_values were added after the sync started
+        self.assertEqual(records, rows[3:6])
+        self.assertEqual(checkpoints, [{"ID": 5}, {"ID": 6}])
+        self.assertEqual(self.connection.params[0], (6, 3))
+
+    def test_composite_key(self):
+        rows = [(1, 1, 10), (1, 2, 20), (1, 3, 30), (2, 1, 40), (2, 2, 50)]
+
+        records, checkpoints = self.sync(["A", "B", "VALUE"], rows, ["A", "B"])
+
+        self.assertEqual(records, rows)
+        self.assertEqual(
+            checkpoints,
+            [{"A": 1, "B": 2}, {"A": 2, "B": 1}, {"A": 2, "B": 2}],
+        )
+
+    def test_composite_key_resume(self):
+        rows = [(1, 1, 10), (1, 2, 20), (1, 3, 30), (2, 1, 40), (2, 2, 50)]
+
+        records, _ = self.sync(
+            ["A", "B", "VALUE"],
+            rows,
+            ["A", "B"],
+            {
+                "max_pk_values": {"A": 2, "B": 2},
+                "last_pk_fetched": {"A": 1, "B": 2},
+            },
+        )
+
+        self.assertEqual(records, rows[2:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import io
+import json
+import sys
+import unittest
+
+from singer.schema import Schema
+
+import tap_db2.messages as messages
+import tap_db2.sync_strategies.incremental as incremental
+
+try:
+    import tests.helpers as helpers
+except ImportError:
+    import helpers
+
+# ID, UPDATED
+ROWS = [(1, 2), (2, None), (3, 1), (4, 3), (5, 3), (6, None), (7, 4)]
+
+
+class TestKeysetColumns(unittest.TestCase):
+    def test_primary_key_breaks_ties(self):
+        self.assertEqual(
+            incremental.get_keyset_columns("updated", ["a", "b"]),
+            ["updated", "a", "b"],
+        )
+
+    def test_replication_key_in_primary_key_is_not_repeated(self):
+        self.assertEqual(
+            incremental.get_keyset_columns("id", ["id", "part"]),
+            ["id", "part"],
+        )
+
+
+class TestIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        self.addCleanup(setattr, sys, "stdout", self.stdout)
+
+        self.catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer", "UPDATED": "integer"},
+            {
+                "database-name": "SCHEMA",
+                "replication-method": "INCREMENTAL",
+                "replication-key": "UPDATED",
+                "table-key-properties": ["ID"],
+            },
+        )
+        self.connection = helpers.SqliteConnection(["ID", "UPDATED"], ROWS)
+
+    def sync(self, bookmark=None):
+        bookmark = dict(bookmark or {}, replication_key="UPDATED")
+        state = {"bookmarks": {"SCHEMA-TABLE": bookmark}}
+
+        incremental.sync_table(
+            self.connection,
+            {"incremental_chunk_size": 2, "checkpoint_rows": 0},
+            self.catalog_entry,
+            state,
+            ["ID", "UPDATED"],
+        )
+        messages.flush()
+
+        self.written = [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()
+        ]
+        return [
+            m["record"]["ID"] for m in self.written if m["type"] == "RECORD"
+        ]
+
+    def test_initial_sync_includes_null_replication_keys(self):
+        self.assertEqual(self.sync(), [2, 6, 3, 1, 4, 5, 7])
+
+        bookmark = self.written[-1]["value"]["bookmarks"]["SCHEMA-TABLE"]
+        self.assertEqual(bookmark["replication_key_value"], 4)
+        self.assertEqual(bookmark["last_pk_fetched"], {"ID": 7})
+
+    def test_null_replication_keys_are_chunked(self):
+        self.sync()
+
+        null_queries = [
+            (sql, params)
+            for sql, params in zip(
+                self.connection.queries, self.connection.params
+            )
+            if "IS NULL" in sql
+        ]
+        self.assertEqual(len(null_queries), 2)
+        self.assertIn("FETCH FIRST 2 ROWS ONLY", null_queries[0][0])
+        self.assertEqual(null_queries[1][1], (6,))
+
+    def test_interrupted_null_pass_resumes_after_last_pk_fetched(self):
+        self.assertEqual(
+            self.sync({"last_pk_fetched": {"ID": 2}}), [6, 3, 1, 4, 5, 7]
+        )
+        self.assertEqual(self.connection.params[0], (2,))
+
+    def test_bookmarked_sync_skips_null_replication_keys(self):
+        self.assertEqual(
+            self.sync(
+                {"replication_key_value": 2, "last_pk_fetched": {"ID": 1}}
+            ),
+            [4, 5, 7],
+        )
+        self.assertFalse(
+            any("IS NULL" in sql for sql in self.connection.queries)
+        )
+
+    def test_first_chunk_without_last_pk_fetched_is_inclusive(self):
+        self.assertEqual(self.sync({"replication_key_value": 3}), [4, 5, 7])
+
+        self.assertIn('"UPDATED" >= ?', self.connection.queries[0])
+        self.assertEqual(self.connection.params[0], (3,))
+        # The next chunk continues strictly after the last row, (3, 5)
+        self.assertNotIn(">=", self.connection.queries[1])
+        self.assertEqual(self.connection.params[1], (3, 3, 5))
+
+    def test_continuation_after_last_pk_fetched_is_exclusive(self):
+        self.assertEqual(
+            self.sync(
+                {"replication_key_value": 3, "last_pk_fetched": {"ID": 4}}
+            ),
+            [5, 7],
+        )
+        self.assertEqual(self.connection.params[0], (3, 3, 4))
+
+    def test_unordered_keys_do_not_bookmark_last_pk_fetched(self):
+        # Decimal keys are read with a single query ordered by the
+        # replication key alone
+        self.catalog_entry = helpers.make_catalog_entry(
+            {"ID": "decimal", "UPDATED": "integer"},
+            self.catalog_entry.metadata[0]["metadata"],
+            properties={"UPDATED": Schema(type=["null", "integer"])},
+        )
+
+        self.assertEqual(
+            self.sync(
+                {"replication_key_value": 3, "last_pk_fetched": {"ID": 4}}
+            ),
+            [4, 5, 7],
+        )
+
+        bookmark = self.written[-1]["value"]["bookmarks"]["SCHEMA-TABLE"]
+        self.assertEqual(bookmark["replication_key_value"], 4)
+        self.assertNotIn("last_pk_fetched", bookmark)
+
+
+if __name__ == "__main__":
+    unittest.main()
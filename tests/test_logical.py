@@ -0,0 +1,245 @@
+import datetime
+import io
+import json
+import re
+import sys
+import unittest
+from unittest import mock
+
+import tap_db2.messages as messages
+import tap_db2.sync_strategies.logical as logical
+
+try:
+    import tests.helpers as helpers
+except ImportError:
+    import helpers
+
+COMMIT_TIME = datetime.datetime(2021, 5, 4, 3, 2, 1)
+
+# sys_change_version, sys_change_operation, commit_time, ID, NAME
+CHANGES = [
+    (11, "I", COMMIT_TIME, 1, "a"),
+    (11, "U", COMMIT_TIME, 2, "b"),
+    (12, "D", COMMIT_TIME, 3, None),
+    (13, "I", COMMIT_TIME, 4, "d"),
+    (13, "I", COMMIT_TIME, 5, "e"),
+]
+
+
+class FakeChangeConnection(helpers.FakeConnection):
+    """Answers CHANGETABLE queries from the changes after their version."""
+
+    def query_rows(self, sql, params):
+        if "CHANGE_TRACKING_CURRENT_VERSION" in sql:
+            return [{"current_version": self.rows[-1][0]}]
+
+        last_version = int(re.search(r"CHANGES \S+, (\d+)", sql).group(1))
+        bounds = re.search(r"BETWEEN (\d+) AND (\d+)", sql)
+        return [
+            change
+            for change in self.rows
+            if change[0] > last_version
+            and (
+                bounds is None or int(bounds[1]) <= change[0] <= int(bounds[2])
+            )
+        ]
+
+    def change_queries(self):
+        return [sql for sql in self.queries if "CHANGETABLE" in sql]
+
+    def current_version_queries(self):
+        return [
+            sql
+            for sql in self.queries
+            if "CHANGE_TRACKING_CURRENT_VERSION" in sql
+        ]
+
+
+def make_catalog_entry():
+    return helpers.make_catalog_entry(
+        {"ID": "integer", "NAME": "varchar"},
+        {"database-name": "dbo", "table-key-properties": ["ID"]},
+        tap_stream_id="dbo-ORDERS",
+        stream="dbo-ORDERS",
+        table="ORDERS",
+    )
+
+
+class TestLogBasedSync(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        self.addCleanup(setattr, sys, "stdout", self.stdout)
+
+    def sync(self, config, changes=CHANGES):
+        self.connection = FakeChangeConnection(changes)
+        log_based = logical.log_based_sync(
+            self.connection,
+            dict(config, database="DB"),
+            make_catalog_entry(),
+            {},
+            ["ID", "NAME"],
+        )
+        log_based.current_log_version = 11
+        log_based.execute_log_based_sync()
+        messages.flush()
+
+        return log_based, [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()
+        ]
+
+    def checkpoints(self, written):
+        return [
+            m["value"]["bookmarks"]["dbo-ORDERS"]["current_log_version"]
+            for m in written
+            if m["type"] == "STATE"
+        ]
+
+    def test_records_and_final_version(self):
+        log_based, written = self.sync({"checkpoint_rows": 0})
+
+        records = [m["record"] for m in written if m["type"] == "RECORD"]
+        self.assertEqual(
+            records,
+            [
+                {"ID": 1, "NAME": "a", "_sdc_deleted_at": None},
+                {"ID": 2, "NAME": "b", "_sdc_deleted_at": None},
+                {"ID": 3, "_sdc_deleted_at": "2021-05-04T03:02:01+00:00"},
+                {"ID": 4, "NAME": "d", "_sdc_deleted_at": None},
+                {"ID": 5, "NAME": "e", "_sdc_deleted_at": None},
+            ],
+        )
+        self.assertEqual(log_based.current_log_version, 14)
+        self.assertEqual(
+            written[-1]["value"]["bookmarks"]["dbo-ORDERS"],
+            {"current_log_version": 14},
+        )
+
+    def test_checkpoints_fall_on_version_boundaries(self):
+        _, written = self.sync({"checkpoint_rows": 1, "fetch_batch_size": 2})
+
+        # Each checkpoint names the first version whose changes follow it
+        checkpoints = []
+        emitted = 0
+        for message in written:
+            if message["type"] == "RECORD":
+                emitted += 1
+            elif message["type"] == "STATE":
+                bookmark = message["value"]["bookmarks"]["dbo-ORDERS"]
+                checkpoints.append((emitted, bookmark["current_log_version"]))
+
+        self.assertEqual(checkpoints, [(2, 12), (3, 13), (5, 14)])
+
+    def test_windows_cover_version_ranges(self):
+        _, written = self.sync({"log_based_version_window": 2})
+
+        self.assertEqual(len(self.connection.current_version_queries()), 1)
+        queries = self.connection.change_queries()
+        self.assertEqual(len(queries), 2)
+        self.assertIn("CHANGES dbo.ORDERS, 10", queries[0])
+        self.assertIn("BETWEEN 11 AND 12", queries[0])
+        self.assertIn("CHANGES dbo.ORDERS, 12", queries[1])
+        self.assertIn("BETWEEN 13 AND 13", queries[1])
+        self.assertEqual(self.checkpoints(written), [13, 14, 14])
+        self.assertEqual(
+            len([m for m in written if m["type"] == "RECORD"]), len(CHANGES)
+        )
+
+    def test_windows_end_at_the_current_version(self):
+        changes = [
+            (version, "I", COMMIT_TIME, version, "x")
+            for version in (11, 12, 20, 21)
+        ]
+
+        _, written = self.sync({"log_based_version_window": 4}, changes)
+
+        self.assertEqual(len(self.connection.current_version_queries()), 1)
+        self.assertEqual(len(self.connection.change_queries()), 3)
+        self.assertIn("BETWEEN 19 AND 21", self.connection.queries[-1])
+        self.assertEqual(self.checkpoints(written), [15, 19, 22, 22])
+        self.assertEqual(
+            [m["record"]["ID"] for m in written if m["type"] == "RECORD"],
+            [11, 12, 20, 21],
+        )
+
+    def test_single_change_query_by_default(self):
+        log_based, _ = self.sync({})
+
+        queries = self.connection.change_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("BETWEEN", queries[0])
+        self.assertEqual(len(self.connection.queries), 1)
+        self.assertEqual(log_based.current_log_version, 14)
+
+
+class FakeSettingsConnection(helpers.FakeConnection):
+    def query_rows(self, sql, params):
+        if "change_tracking_databases" in sql:
+            return [{"db_name": "OTHER"}, {"db_name": "DB"}]
+
+        return [
+            {
+                "schema_name": "dbo",
+                "table_name": "ORDERS",
+                "object_id": 42,
+                "min_valid_version": 7,
+            }
+        ]
+
+
+class TestChangeTrackingSettings(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            logical,
+            "CHANGE_TRACKING_SETTINGS",
+            logical.ChangeTrackingSettings(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = FakeSettingsConnection()
+
+    def log_based_sync(self, catalog_entry, config=None):
+        return logical.log_based_sync(
+            self.connection,
+            dict(config or {}, database="DB"),
+            catalog_entry,
+            {},
+            ["ID", "NAME"],
+        )
+
+    def test_settings_are_read_once_per_run(self):
+        for _ in range(3):
+            log_based = self.log_based_sync(make_catalog_entry())
+            self.assertTrue(log_based.assert_log_based_is_enabled())
+            self.assertEqual(log_based._get_min_valid_version(), 7)
+            self.assertEqual(log_based._get_object_version_by_table_name(), 42)
+
+        self.assertEqual(len(self.connection.queries), 2)
+
+    def test_settings_expire(self):
+        log_based = self.log_based_sync(
+            make_catalog_entry(), {"change_tracking_cache_seconds": 60}
+        )
+        log_based.assert_log_based_is_enabled()
+        log_based.assert_log_based_is_enabled()
+        logical.CHANGE_TRACKING_SETTINGS.loaded_at -= 61
+        log_based.assert_log_based_is_enabled()
+
+        self.assertEqual(len(self.connection.queries), 4)
+
+    def test_table_without_change_tracking(self):
+        catalog_entry = make_catalog_entry()
+        catalog_entry.table = "CUSTOMERS"
+
+        with self.assertRaisesRegex(Exception, "not enabled for table"):
+            self.log_based_sync(catalog_entry).assert_log_based_is_enabled()
+
+    def test_database_without_change_tracking(self):
+        log_based = self.log_based_sync(make_catalog_entry())
+        log_based.database_name = "MISSING"
+
+        with self.assertRaisesRegex(Exception, "database: MISSING"):
+            log_based.assert_log_based_is_enabled()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import datetime
+import decimal
+import io
+import sys
+import unittest
+
+import simplejson
+import singer
+
+import tap_db2.messages as messages
+
+
+class TestRecordWriter(unittest.TestCase):
+    def setUp(self):
+        self.time_extracted = datetime.datetime(
+            2021, 5, 4, 3, 2, 1, tzinfo=datetime.timezone.utc
+        )
+
+    def expected_message(self, record):
+        return singer.format_message(
+            singer.RecordMessage(
+                stream="TABLE",
+                record=record,
+                version=7,
+                time_extracted=self.time_extracted,
+            )
+        )
+
+    def test_matches_singer_record_message(self):
+        record = {"ID": 1, "NAME": "café", "NOTES": None, "OK": True}
+        writer = messages.RecordWriter(
+            "TABLE", 7, self.time_extracted, use_decimal=False
+        )
+
+        self.assertEqual(
+            simplejson.loads(writer.format_record(record)),
+            simplejson.loads(self.expected_message(record)),
+        )
+
+    def test_decimal_records_are_byte_identical(self):
+        record = {"ID": 1, "AMOUNT": decimal.Decimal("10.50")}
+        writer = messages.RecordWriter(
+            "TABLE", 7, self.time_extracted, use_decimal=True
+        )
+
+        self.assertEqual(
+            writer.format_record(record), self.expected_message(record) + "\n"
+        )
+
+    def test_falls_back_for_unexpected_decimals(self):
+        record = {"AMOUNT": decimal.Decimal("0.1")}
+        writer = messages.RecordWriter(
+            "TABLE", 7, self.time_extracted, use_decimal=False
+        )
+
+        self.assertIn(
+            '"record": {"AMOUNT": 0.1}', writer.format_record(record)
+        )
+
+    def test_write_returns_bytes_written(self):
+        writer = messages.RecordWriter("TABLE", use_decimal=False)
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            written = writer.write({"ID": 1})
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(written, len(output))
+        self.assertEqual(simplejson.loads(output)["type"], "RECORD")
+
+
+class TestMessageSink(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+        self.buffer_size = messages.SINK.buffer_size
+        messages.SINK.buffer_size = 1024 * 1024
+
+    def tearDown(self):
+        messages.SINK.pending = []
+        messages.SINK.pending_size = 0
+        messages.SINK.buffer_size = self.buffer_size
+        sys.stdout = self.stdout
+
+    def test_records_are_buffered_until_state(self):
+        writer = messages.RecordWriter("TABLE", use_decimal=False)
+        writer.write({"ID": 1})
+        writer.write({"ID": 2})
+
+        self.assertEqual(sys.stdout.getvalue(), "")
+
+        messages.write_message(singer.StateMessage(value={"bookmarks": {}}))
+
+        lines = [
+            simplejson.loads(line)
+            for line in sys.stdout.getvalue().splitlines()
+        ]
+        self.assertEqual(
+            [line["type"] for line in lines], ["RECORD", "RECORD", "STATE"]
+        )
+
+    def test_flushes_when_buffer_is_full(self):
+        messages.SINK.buffer_size = 10
+        messages.write_message(
+            singer.ActivateVersionMessage(stream="TABLE", version=1)
+        )
+
+        self.assertIn("ACTIVATE_VERSION", sys.stdout.getvalue())
+
+
+class TestStateSerializer(unittest.TestCase):
+    def setUp(self):
+        self.state = {
+            "currently_syncing": "A",
+            "bookmarks": {
+                "A": {"version": 1, "last_pk_fetched": {"id": 10}},
+                "B": {"replication_key_value": decimal.Decimal("1.10")},
+            },
+        }
+
+    def test_matches_singer_state_message(self):
+        serializer = messages.StateSerializer()
+
+        self.assertEqual(
+            serializer.format_state(self.state),
+            singer.format_message(singer.StateMessage(value=self.state)),
+        )
+
+    def test_only_dirty_streams_are_reencoded(self):
+        serializer = messages.StateSerializer()
+        serializer.format_state(self.state)
+
+        self.state["bookmarks"]["A"]["last_pk_fetched"] = {"id": 20}
+        self.state["currently_syncing"] = "B"
+        formatted = serializer.format_state(self.state, {"A"})
+
+        self.assertEqual(
+            formatted,
+            singer.format_message(singer.StateMessage(value=self.state)),
+        )
+        self.assertIs(
+            serializer.fragments["B"][0], self.state["bookmarks"]["B"]
+        )
+
+    def test_replaced_bookmarks_are_reencoded(self):
+        serializer = messages.StateSerializer()
+        serializer.format_state(self.state)
+
+        self.state["bookmarks"]["B"] = {"version": 3}
+        del self.state["bookmarks"]["A"]
+
+        self.assertEqual(
+            serializer.format_state(self.state, set()),
+            singer.format_message(singer.StateMessage(value=self.state)),
+        )
+        self.assertEqual(list(serializer.fragments), ["B"])
+
+
+class TestStateMerger(unittest.TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, io.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def written_states(self):
+        return [
+            simplejson.loads(line)["value"]
+            for line in sys.stdout.getvalue().splitlines()
+        ]
+
+    def test_merges_stream_bookmarks_into_shared_state(self):
+        state = {"bookmarks": {"A": {"version": 1}}}
+        state_merger = messages.StateMerger(state)
+
+        a_state = state_merger.start("A")
+        b_state = state_merger.start("B")
+        self.assertEqual(a_state["bookmarks"], {"A": {"version": 1}})
+        self.assertNotIn("bookmarks", b_state)
+
+        with messages.merging_state(state_merger):
+            singer.write_bookmark(b_state, "B", "version", 2)
+            messages.write_message(singer.StateMessage(value=b_state))
+
+        self.assertEqual(
+            self.written_states(),
+            [
+                {
+                    "bookmarks": {"A": {"version": 1}, "B": {"version": 2}},
+                    "currently_syncing": "A",
+                }
+            ],
+        )
+
+    def test_currently_syncing_follows_oldest_stream_in_flight(self):
+        state_merger = messages.StateMerger({})
+        a_state = state_merger.start("A")
+        state_merger.start("B")
+
+        singer.write_bookmark(a_state, "A", "version", 1)
+        state_merger.finish("A", a_state)
+
+        self.assertEqual(state_merger.state["currently_syncing"], "B")
+        self.assertEqual(
+            state_merger.state["bookmarks"],
+            {"A": {"version": 1}},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import contextlib
+import decimal
+import io
+import unittest
+from unittest import mock
+
+import tap_db2.native_fetch as native_fetch
+import tap_db2.sync_strategies.common as common
+
+try:
+    import tests.helpers as helpers
+except ImportError:
+    import helpers
+
+CONFIG = {
+    "username": "db2inst1",
+    "password": "password",
+    "hostname": "localhost",
+    "port": 50000,
+    "database": "TESTDB",
+    "fetch_backend": "ibm_db",
+    "fetch_batch_size": 2,
+}
+
+
+class FakeStatement:
+    def __init__(self, sql, field_types, rows):
+        self.sql = sql
+        self.params = None
+        self.field_types = field_types
+        self.rows = iter(rows)
+        self.freed = False
+
+
+class FakeIbmDb:
+    """The subset of the ibm_db module the native backend uses."""
+
+    SQL_ATTR_CURSOR_TYPE = 10
+    SQL_CURSOR_FORWARD_ONLY = 0
+
+    def __init__(self, field_types, rows):
+        self.field_types = field_types
+        self.rows = rows
+        self.connections = []
+        self.statements = []
+
+    def connect(self, connection_string, user, password):
+        conn = {"connection_string": connection_string, "active": True}
+        self.connections.append(conn)
+        return conn
+
+    def active(self, conn):
+        return conn["active"]
+
+    def close(self, conn):
+        conn["active"] = False
+
+    def exec_immediate(self, conn, sql):
+        self.statements.append(FakeStatement(sql, self.field_types, self.rows))
+        return self.statements[-1]
+
+    def prepare(self, conn, sql, options):
+        return self.exec_immediate(conn, sql)
+
+    def execute(self, stmt, params):
+        stmt.params = params
+
+    def num_fields(self, stmt):
+        return len(stmt.field_types)
+
+    def field_type(self, stmt, index):
+        return stmt.field_types[index]
+
+    def fetch_tuple(self, stmt):
+        return next(stmt.rows, False)
+
+    def free_result(self, stmt):
+        stmt.freed = True
+
+
+class TestFetchBackend(unittest.TestCase):
+    def test_defaults_to_sqlalchemy(self):
+        self.assertEqual(native_fetch.get_fetch_backend({}), "sqlalchemy")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(Exception):
+            native_fetch.get_fetch_backend({"fetch_backend": "jdbc"})
+
+    def test_block_size_follows_cursor_array_size(self):
+        self.assertIn(
+            "BlockForNRows=500;",
+            native_fetch.generate_connection_string(
+                dict(CONFIG, cursor_array_size=500)
+            ),
+        )
+
+
+class TestNativeFetch(unittest.TestCase):
+    def setUp(self):
+        self.ibm_db = FakeIbmDb(
+            ["integer", "decimal"],
+            [(1, "1.50"), (2, None), (3, "-0.25")],
+        )
+        patcher = mock.patch.object(native_fetch, "ibm_db", self.ibm_db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(native_fetch.POOLS.clear)
+
+    def test_batches_with_decimals(self):
+        results = common.execute_query(None, "SELECT 1", [5], CONFIG)
+
+        self.assertEqual(
+            list(common.fetch_batches(results, 2)),
+            [
+                [(1, decimal.Decimal("1.50")), (2, None)],
+                [(3, decimal.Decimal("-0.25"))],
+            ],
+        )
+        statement = self.ibm_db.statements[0]
+        self.assertEqual(statement.sql, "SELECT 1 FOR READ ONLY")
+        self.assertEqual(statement.params, (5,))
+        self.assertTrue(statement.freed)
+
+    def test_input_metadata_is_read_with_sqlalchemy(self):
+        # Its rows need the output converter installed on the pyodbc
+        # connection, see connection.modify_ouput_converter
+        catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer"}, tap_stream_id="dbo-InputMetadata"
+        )
+        connection = helpers.FakeConnection([(1,)])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows_saved = common.sync_query(
+                connection,
+                catalog_entry,
+                {},
+                "SELECT 1",
+                ["ID"],
+                1,
+                "TABLE",
+                [],
+                CONFIG,
+            )
+
+        self.assertEqual(rows_saved, 1)
+        self.assertEqual(connection.queries, ["SELECT 1"])
+        self.assertEqual(self.ibm_db.statements, [])
+
+    def test_escaped_percent_signs_are_unescaped(self):
+        catalog_entry = helpers.make_catalog_entry(
+            {"RATE%": "integer"}, {"database-name": "SCHEMA"}
+        )
+        select_sql = common.generate_select_sql(catalog_entry, ["RATE%"])
+
+        common.execute_query(None, select_sql, [], CONFIG)
+
+        self.assertEqual(
+            self.ibm_db.statements[0].sql,
+            'SELECT "RATE%" FROM "SCHEMA"."TABLE" FOR READ ONLY',
+        )
+
+    def test_connection_is_reused(self):
+        for _ in range(2):
+            results = common.execute_query(None, "SELECT 1", [], CONFIG)
+            list(common.fetch_batches(results, 10))
+
+        self.assertEqual(len(self.ibm_db.connections), 1)
+
+    def test_dropped_connection_is_replaced(self):
+        results = common.execute_query(None, "SELECT 1", [], CONFIG)
+        list(common.fetch_batches(results, 10))
+        self.ibm_db.connections[0]["active"] = False
+
+        common.execute_query(None, "SELECT 1", [], CONFIG)
+
+        self.assertEqual(len(self.ibm_db.connections), 2)
+
+    def test_connection_is_returned_after_a_write_error(self):
+        catalog_entry = helpers.make_catalog_entry(
+            {"ID": "integer", "AMOUNT": "decimal"}
+        )
+        record_writer = mock.Mock()
+        record_writer.write.side_effect = RuntimeError("broken pipe")
+
+        for queue_depth in (0, 1):
+            with mock.patch.object(
+                common, "build_record_writer", return_value=record_writer
+            ):
+                with self.assertRaises(RuntimeError):
+                    common.sync_query(
+                        None,
+                        catalog_entry,
+                        {},
+                        "SELECT 1",
+                        ["ID", "AMOUNT"],
+                        1,
+                        "TABLE",
+                        [],
+                        dict(CONFIG, fetch_queue_depth=queue_depth),
+                    )
+
+            self.assertTrue(self.ibm_db.statements[-1].freed)
+            pool = native_fetch.get_pool(CONFIG)
+            self.assertEqual(pool.idle.qsize(), 1)
+
+        self.assertEqual(len(self.ibm_db.connections), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import threading
+import unittest
+from unittest import mock
+
+from singer.catalog import CatalogEntry
+
+import tap_db2
+import tap_db2.messages as messages
+import tap_db2.scheduler as scheduler
+
+
+def make_stream(tap_stream_id, size=None):
+    stream_metadata = {}
+    if size is not None:
+        stream_metadata["estimated-size-bytes"] = size
+
+    return CatalogEntry(
+        tap_stream_id=tap_stream_id,
+        table=tap_stream_id,
+        metadata=[{"breadcrumb": (), "metadata": stream_metadata}],
+    )
+
+
+class TestEstimateCosts(unittest.TestCase):
+    def test_sizes_are_scaled_by_observed_throughput(self):
+        streams = [make_stream("A", 1000), make_stream("B", 5000)]
+        state = {"bookmarks": {"A": {"last_sync_seconds": 10}}}
+
+        self.assertEqual(
+            scheduler.estimate_costs(streams, state), {"A": 10, "B": 50}
+        )
+
+    def test_unknown_streams_cost_nothing(self):
+        streams = [make_stream("A"), make_stream("B", 20 * 1024 * 1024)]
+
+        self.assertEqual(
+            scheduler.estimate_costs(streams, {}), {"A": 0, "B": 2}
+        )
+
+
+class TestPackStreams(unittest.TestCase):
+    def setUp(self):
+        self.streams = [
+            make_stream(tap_stream_id, size)
+            for tap_stream_id, size in [
+                ("A", 10),
+                ("B", 70),
+                ("C", 40),
+                ("D", 30),
+                ("E", 20),
+            ]
+        ]
+
+    def ids(self, stream_lists):
+        return [[s.tap_stream_id for s in streams] for streams in stream_lists]
+
+    def test_largest_first(self):
+        stream_lists = scheduler.pack_streams(
+            self.streams, {}, "largest_first", 2
+        )
+
+        self.assertEqual(
+            self.ids(stream_lists), [["B"], ["C"], ["D"], ["E"], ["A"]]
+        )
+
+    def test_bin_packing_balances_workers(self):
+        stream_lists = scheduler.pack_streams(
+            self.streams, {}, "bin_packing", 2
+        )
+
+        self.assertEqual(self.ids(stream_lists), [["B", "E"], ["C", "D", "A"]])
+
+    def test_currently_syncing_goes_first(self):
+        stream_lists = scheduler.pack_streams(
+            self.streams, {"currently_syncing": "A"}, "largest_first", 1
+        )
+
+        self.assertEqual(self.ids(stream_lists)[0], ["A"])
+
+
+class TestParallelSync(unittest.TestCase):
+    def setUp(self):
+        self.synced = []
+        patcher = mock.patch.object(
+            tap_db2, "sync_non_binlog_stream", side_effect=self.sync_stream
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync_stream(self, mssql_conn, config, catalog_entry, state):
+        if catalog_entry.tap_stream_id == "FAIL":
+            raise RuntimeError("sync failed")
+        self.synced.append(catalog_entry.tap_stream_id)
+
+    def sync_stream_list(self, tap_stream_ids, failed):
+        tap_db2.sync_stream_list(
+            None,
+            {},
+            [make_stream(tap_stream_id) for tap_stream_id in tap_stream_ids],
+            messages.StateMerger({}),
+            failed,
+        )
+
+    def test_failure_stops_the_list(self):
+        failed = threading.Event()
+
+        with self.assertRaises(RuntimeError):
+            self.sync_stream_list(["A", "FAIL", "B"], failed)
+
+        self.assertTrue(failed.is_set())
+        self.assertEqual(self.synced, ["A"])
+
+    def test_no_streams_start_after_a_failure(self):
+        failed = threading.Event()
+        failed.set()
+
+        self.sync_stream_list(["A", "B"], failed)
+
+        self.assertEqual(self.synced, [])
+
+    def test_other_workers_stop_between_streams(self):
+        slow_started = threading.Event()
+        stream_lists = [
+            [make_stream("FAIL")],
+            [make_stream("SLOW"), make_stream("NEXT")],
+        ]
+
+        def sync_stream(mssql_conn, config, catalog_entry, state):
+            tap_stream_id = catalog_entry.tap_stream_id
+            if tap_stream_id == "SLOW":
+                slow_started.set()
+                # Finishes only once the failure has been seen
+                failed = sync_stream_list.call_args_list[0].args[4]
+                self.assertTrue(failed.wait(5))
+            elif tap_stream_id == "FAIL":
+                self.assertTrue(slow_started.wait(5))
+            self.sync_stream(mssql_conn, config, catalog_entry, state)
+
+        tap_db2.sync_non_binlog_stream.side_effect = sync_stream
+        with mock.patch.object(
+            tap_db2, "sync_stream_list", wraps=tap_db2.sync_stream_list
+        ) as sync_stream_list:
+            with self.assertRaises(RuntimeError):
+                tap_db2.sync_streams_in_parallel(
+                    None, stream_lists, {"max_parallel_streams": 2}, {}
+                )
+
+        self.assertEqual(self.synced, ["SLOW"])
+
+
+if __name__ == "__main__":
+    unittest.main()